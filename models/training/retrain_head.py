@@ -0,0 +1,373 @@
+"""
+Head-only retraining from cached bottleneck features
+Retrains just the final classification layer of the served image model on
+penultimate-layer features of data/raw plus feedback-labeled uploads
+
+The features are cached in a memory-mapped store (features.npy + index.json)
+and only images that are new or changed since the last run go through the
+network, so a retrain after a few new feedback images takes seconds on CPU.
+The store is invalidated automatically when the feature layers change.
+
+Usage:
+    python retrain_head.py                  # embed new images, retrain, write a new version
+    python retrain_head.py --promote        # ...and serve it (running servers hot-swap to it)
+    python retrain_head.py --embed-only     # just refresh the feature store
+"""
+
+import os
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import argparse
+import sys
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+# Versions are written in the backend's model registry format
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'web_app', 'backend'))
+from model_registry import write_active, write_manifest
+
+# Configuration
+IMAGE_SIZE = (224, 224)
+EMBED_BATCH_SIZE = 32
+EPOCHS = 300
+LEARNING_RATE = 0.01
+L2_WEIGHT = 1e-4
+FEEDBACK_WEIGHT = 2.0  # user-labeled uploads count double: they are the model's real mistakes
+HOLDOUT_PERCENT = 20
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+# Paths
+RAW_DATA_DIR = '../../data/raw'
+FEEDBACK_UPLOAD_DIR = '../../web_app/backend/feedback/labeled_uploads'
+MODEL_DIR = '../../models/trained'
+MODEL_PATH = os.path.join(MODEL_DIR, 'model.h5')
+CLASS_NAMES_PATH = os.path.join(MODEL_DIR, 'class_names.json')
+FEATURE_STORE_DIR = os.path.join(MODEL_DIR, 'feature_cache')
+VERSIONS_DIR = os.path.join(MODEL_DIR, 'versions')
+
+
+def load_image(image_path):
+    """Same preprocessing as the backend's preprocess_image()"""
+    with Image.open(image_path) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = img.resize(IMAGE_SIZE, Image.Resampling.LANCZOS)
+        return np.array(img, dtype=np.float32) / 255.0
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def feature_signature(model):
+    """Checksum of every layer except the classification head (features change iff this does)"""
+    digest = hashlib.sha256()
+    for layer in model.layers[:-1]:
+        for weights in layer.get_weights():
+            digest.update(np.ascontiguousarray(weights).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def collect_images(class_names):
+    """(path, label, source) for data/raw and feedback-labeled uploads of known classes"""
+    known = set(class_names)
+    images = []
+    for source, root in (('raw', RAW_DATA_DIR), ('feedback', FEEDBACK_UPLOAD_DIR)):
+        if not os.path.exists(root):
+            continue
+        for label in sorted(os.listdir(root)):
+            class_dir = os.path.join(root, label)
+            if label not in known or not os.path.isdir(class_dir):
+                continue
+            for filename in sorted(os.listdir(class_dir)):
+                if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                    images.append((os.path.join(class_dir, filename), label, source))
+    return images
+
+
+class FeatureStore:
+    """
+    Memory-mapped float32 feature matrix with a JSON index
+
+    features.npy holds `capacity` rows (doubled when full); index.json lists
+    the item of each used row: {'path', 'label', 'source', 'signature'}.
+    """
+
+    def __init__(self, directory, dim, model_signature):
+        self.directory = directory
+        self.dim = dim
+        self.features_path = os.path.join(directory, 'features.npy')
+        self.index_path = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+
+        self.items = []
+        self.model_signature = model_signature
+        if os.path.exists(self.index_path) and os.path.exists(self.features_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('model_signature') == model_signature and index.get('dim') == dim:
+                self.items = index['items']
+            else:
+                print("Feature layers changed, rebuilding the feature store")
+        self._features = None
+        if self.items:
+            self._features = np.load(self.features_path, mmap_mode='r+')
+        self._rows = {item['path']: row for row, item in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def is_current(self, path):
+        row = self._rows.get(path)
+        return row is not None and self.items[row]['signature'] == file_signature(path)
+
+    def _reserve(self, count):
+        capacity = 0 if self._features is None else self._features.shape[0]
+        if len(self.items) + count <= capacity:
+            return
+        new_capacity = max(capacity * 2, len(self.items) + count, 1024)
+        temp_path = self.features_path + '.tmp'
+        grown = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32, shape=(new_capacity, self.dim))
+        if self._features is not None:
+            grown[:len(self.items)] = self._features[:len(self.items)]
+        grown.flush()
+        del grown
+        self._features = None
+        os.replace(temp_path, self.features_path)
+        self._features = np.load(self.features_path, mmap_mode='r+')
+
+    def put(self, features, items):
+        """Store features for items, replacing rows of paths that were embedded before"""
+        new_rows = [item for item in items if item['path'] not in self._rows]
+        self._reserve(len(new_rows))
+        for vector, item in zip(features, items):
+            row = self._rows.get(item['path'])
+            if row is None:
+                row = len(self.items)
+                self.items.append(item)
+                self._rows[item['path']] = row
+            else:
+                self.items[row] = item
+            self._features[row] = vector
+
+    def save(self):
+        if self._features is not None:
+            self._features.flush()
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model_signature': self.model_signature, 'dim': self.dim, 'items': self.items}, f)
+        os.replace(temp_path, self.index_path)
+
+    def dataset(self, paths):
+        """(features, items) of the given paths, features as a read-only view where possible"""
+        rows = np.array([self._rows[path] for path in paths], dtype=np.int64)
+        return self._features[rows], [self.items[row] for row in rows]
+
+
+def update_feature_store(feature_extractor, store, images):
+    """Embed images that are not in the store (or changed); returns the number embedded"""
+    pending = [(path, label, source) for path, label, source in images if not store.is_current(path)]
+    start = time.time()
+    for offset in range(0, len(pending), EMBED_BATCH_SIZE):
+        batch = pending[offset:offset + EMBED_BATCH_SIZE]
+        arrays, items = [], []
+        for path, label, source in batch:
+            try:
+                arrays.append(load_image(path))
+                items.append({'path': path, 'label': label, 'source': source, 'signature': file_signature(path)})
+            except Exception as e:
+                print(f"  Skipping {path}: {e}")
+        if arrays:
+            store.put(feature_extractor.predict(np.stack(arrays), verbose=0), items)
+        print(f"  Embedded {min(offset + EMBED_BATCH_SIZE, len(pending))}/{len(pending)}")
+    store.save()
+    if pending:
+        print(f"Embedded {len(pending)} images in {time.time() - start:.1f}s")
+    return len(pending)
+
+
+def split_holdout(items):
+    """Deterministic ~HOLDOUT_PERCENT% hold-out by path hash, only from classes with 2+ samples"""
+    per_class = {}
+    for item in items:
+        per_class[item['label']] = per_class.get(item['label'], 0) + 1
+    train, holdout = [], []
+    for item in items:
+        in_holdout = per_class[item['label']] > 1 and zlib.crc32(item['path'].encode('utf-8')) % 100 < HOLDOUT_PERCENT
+        (holdout if in_holdout else train).append(item['path'])
+    return train, holdout
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def train_head(features, labels, weights, sample_weights, bias, epochs=EPOCHS, learning_rate=LEARNING_RATE):
+    """
+    Softmax regression on fixed features with Adam, warm-started from the current head
+
+    Returns:
+        (weights, bias) of the new head
+    """
+    weights = weights.astype(np.float64).copy()
+    bias = bias.astype(np.float64).copy()
+    features = np.asarray(features, dtype=np.float64)
+    sample_weights = sample_weights / sample_weights.sum()
+    one_hot = np.zeros((len(labels), weights.shape[1]))
+    one_hot[np.arange(len(labels)), labels] = 1.0
+
+    moments = [np.zeros_like(weights), np.zeros_like(bias)]
+    velocities = [np.zeros_like(weights), np.zeros_like(bias)]
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    for epoch in range(1, epochs + 1):
+        probabilities = softmax(features @ weights + bias)
+        error = (probabilities - one_hot) * sample_weights[:, None]
+        gradients = [features.T @ error + L2_WEIGHT * weights, error.sum(axis=0)]
+        for i, (param, gradient) in enumerate(zip((weights, bias), gradients)):
+            moments[i] = beta1 * moments[i] + (1 - beta1) * gradient
+            velocities[i] = beta2 * velocities[i] + (1 - beta2) * gradient ** 2
+            m_hat = moments[i] / (1 - beta1 ** epoch)
+            v_hat = velocities[i] / (1 - beta2 ** epoch)
+            param -= learning_rate * m_hat / (np.sqrt(v_hat) + epsilon)
+        if epoch % 50 == 0 or epoch == 1:
+            loss = -(sample_weights * np.log(probabilities[np.arange(len(labels)), labels] + 1e-12)).sum()
+            print(f"  Epoch {epoch}/{epochs} - loss: {loss:.4f}")
+    return weights.astype(np.float32), bias.astype(np.float32)
+
+
+def evaluate_head(features, labels, weights, bias):
+    """Top-1 and top-3 accuracy"""
+    if len(labels) == 0:
+        return {'samples': 0, 'accuracy': None, 'top_3_accuracy': None}
+    logits = np.asarray(features, dtype=np.float32) @ weights + bias
+    top3 = np.argsort(-logits, axis=1)[:, :3]
+    return {
+        'samples': int(len(labels)),
+        'accuracy': float(np.mean(top3[:, 0] == labels)),
+        'top_3_accuracy': float(np.mean((top3 == labels[:, None]).any(axis=1)))
+    }
+
+
+def retrain(promote=False, embed_only=False):
+    """Main retraining function"""
+    import tensorflow as tf
+
+    print("=" * 50)
+    print("Head-only retraining from cached features")
+    print("=" * 50)
+
+    if not os.path.exists(MODEL_PATH):
+        print(f"Error: Model not found at {MODEL_PATH}")
+        return None
+    with open(CLASS_NAMES_PATH, 'r', encoding='utf-8') as f:
+        class_names = json.load(f)
+    class_index = {name: i for i, name in enumerate(class_names)}
+
+    print("\n[1/4] Loading model...")
+    model = tf.keras.models.load_model(MODEL_PATH)
+    head = model.layers[-1]
+    head_weights, head_bias = head.get_weights()
+    feature_extractor = tf.keras.Model(inputs=model.input, outputs=model.layers[-2].output)
+    dim = head_weights.shape[0]
+
+    print("\n[2/4] Updating feature store...")
+    store = FeatureStore(FEATURE_STORE_DIR, dim, feature_signature(model))
+    images = collect_images(class_names)
+    update_feature_store(feature_extractor, store, images)
+    if embed_only:
+        return None
+
+    train_paths, holdout_paths = split_holdout([item for item in store.items
+                                                if item['path'] in {path for path, _, _ in images}])
+    train_features, train_items = store.dataset(train_paths)
+    holdout_features, holdout_items = store.dataset(holdout_paths)
+    train_labels = np.array([class_index[item['label']] for item in train_items], dtype=np.int64)
+    holdout_labels = np.array([class_index[item['label']] for item in holdout_items], dtype=np.int64)
+    sample_weights = np.array([FEEDBACK_WEIGHT if item['source'] == 'feedback' else 1.0 for item in train_items])
+    print(f"Training samples: {len(train_items)} "
+          f"({int(np.sum(sample_weights > 1))} from feedback), held out: {len(holdout_items)}")
+
+    print("\n[3/4] Training classification head...")
+    start = time.time()
+    new_weights, new_bias = train_head(train_features, train_labels, head_weights, sample_weights, head_bias)
+    train_seconds = time.time() - start
+    print(f"Head trained in {train_seconds:.1f}s")
+
+    feedback_rows = np.array([item['source'] == 'feedback' for item in holdout_items], dtype=bool)
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'base_model': MODEL_PATH,
+        'feature_signature': store.model_signature,
+        'train_samples': len(train_items),
+        'train_seconds': train_seconds,
+        'holdout': {
+            'previous': evaluate_head(holdout_features, holdout_labels, head_weights, head_bias),
+            'retrained': evaluate_head(holdout_features, holdout_labels, new_weights, new_bias)
+        },
+        'holdout_feedback': {
+            'previous': evaluate_head(holdout_features[feedback_rows], holdout_labels[feedback_rows],
+                                      head_weights, head_bias),
+            'retrained': evaluate_head(holdout_features[feedback_rows], holdout_labels[feedback_rows],
+                                       new_weights, new_bias)
+        }
+    }
+
+    print("\n[4/4] Saving new version...")
+    version = datetime.now().strftime('head-%Y%m%d-%H%M%S')
+    version_dir = os.path.join(VERSIONS_DIR, version)
+    os.makedirs(version_dir, exist_ok=True)
+    head.set_weights([new_weights, new_bias])
+    model.save(os.path.join(version_dir, 'model.h5'))
+    np.savez(os.path.join(version_dir, 'head_weights.npz'), weights=new_weights, bias=new_bias)
+    write_manifest(version_dir, 'image', class_names, list(model.input_shape[1:]), source='retrain_head')
+    report['version'] = version
+    with open(os.path.join(version_dir, 'retrain_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print("\n" + "=" * 50)
+    print("Held-out Results:")
+    print("=" * 50)
+    for name, key in (('All held-out', 'holdout'), ('Feedback held-out', 'holdout_feedback')):
+        previous, retrained = report[key]['previous'], report[key]['retrained']
+        if previous['samples']:
+            print(f"{name} ({previous['samples']}): accuracy {previous['accuracy']:.4f} -> "
+                  f"{retrained['accuracy']:.4f}, top-3 {previous['top_3_accuracy']:.4f} -> "
+                  f"{retrained['top_3_accuracy']:.4f}")
+    print(f"\nNew version saved to {version_dir}")
+
+    if promote:
+        temp_path = MODEL_PATH + '.tmp'
+        shutil.copy(os.path.join(version_dir, 'model.h5'), temp_path)
+        os.replace(temp_path, MODEL_PATH)
+        write_active(VERSIONS_DIR, version)
+        print(f"Promoted {version} to {MODEL_PATH} and {os.path.join(VERSIONS_DIR, 'ACTIVE')}")
+    print("=" * 50)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Retrain the classification head from cached features')
+    parser.add_argument('--promote', action='store_true',
+                        help=f'Copy the new model to {MODEL_PATH} and make it the active version')
+    parser.add_argument('--embed-only', action='store_true', help='Only update the feature store')
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    # Set GPU memory growth
+    gpus = tf.config.experimental.list_physical_devices('GPU')
+    if gpus:
+        try:
+            for gpu in gpus:
+                tf.config.experimental.set_memory_growth(gpu, True)
+        except RuntimeError as e:
+            print(e)
+
+    retrain(promote=args.promote, embed_only=args.embed_only)
@@ -1,16 +1,25 @@
 """
 Model Training Script for HK Urban Ecological Identification
 Trains a CNN model to classify plants and birds in Hong Kong
+
+Usage:
+    python train_model.py                   # train the MobileNetV2 transfer model (model.h5)
+    python train_model.py --distill         # distill model.h5 into smaller student models
+    python train_model.py --distill --students mobilenetv2_a035_160 --epochs 10
 """
 
 import os
+import sys
 import json
+import time
+import argparse
+from datetime import datetime
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.applications import MobileNetV2
+from tensorflow.keras.applications import MobileNetV2, MobileNetV3Small
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
 from tensorflow.keras.metrics import TopKCategoricalAccuracy
 import matplotlib.pyplot as plt
@@ -31,6 +40,30 @@ TRAIN_DIR = os.path.join(DATA_DIR, 'train')
 MODEL_SAVE_DIR = '../../models/trained'
 os.makedirs(MODEL_SAVE_DIR, exist_ok=True)
 
+# Distillation (--distill): model.h5 teaches smaller students on data/raw
+STUDENT_DIR = os.path.join(MODEL_SAVE_DIR, 'student')
+STUDENT_VERSIONS_DIR = os.path.join(STUDENT_DIR, 'versions')
+DISTILL_EPOCHS = 30
+DISTILL_LEARNING_RATE = 0.001
+DISTILL_TEMPERATURE = 4.0
+DISTILL_ALPHA = 0.7  # weight of the teacher's soft targets; the rest goes to the true labels
+DISTILL_PATIENCE = 5
+LATENCY_RUNS = 50
+CASCADE_MARGINS = [0.3, 0.5, 0.6, 0.7, 0.8]  # see web_app/backend/cascade.py
+TF_IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}  # what tf.io.decode_image reads
+
+# name -> (architecture, input size, width multiplier); all have ImageNet weights in Keras
+STUDENT_CONFIGS = {
+    'mobilenetv2_a035_160': ('mobilenetv2', 160, 0.35),
+    'mobilenetv2_a050_128': ('mobilenetv2', 128, 0.5),
+    'mobilenetv2_a100_128': ('mobilenetv2', 128, 1.0),
+    'mobilenetv3small_a075_160': ('mobilenetv3small', 160, 0.75),
+    'mobilenetv3small_224': ('mobilenetv3small', 224, 1.0),
+}
+
+# Students are exported in the backend's model registry format
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'web_app', 'backend'))
+
 
 def create_data_generators():
     """Create data generators with augmentation"""
@@ -248,6 +281,246 @@ def train_model():
     print("=" * 50)
 
 
+def build_student(num_classes, config_name):
+    """Build a student classifier: a smaller ImageNet backbone + softmax head, taking [0, 1] images"""
+    architecture, size, alpha = STUDENT_CONFIGS[config_name]
+    inputs = keras.Input(shape=(size, size, 3))
+    # The backend feeds [0, 1] images; the ImageNet weights expect [-1, 1]
+    x = layers.Rescaling(2.0, offset=-1.0)(inputs)
+    if architecture == 'mobilenetv2':
+        base_model = MobileNetV2(input_shape=(size, size, 3), alpha=alpha, include_top=False, weights='imagenet')
+    else:
+        base_model = MobileNetV3Small(input_shape=(size, size, 3), alpha=alpha, include_top=False,
+                                      weights='imagenet', include_preprocessing=False)
+    x = base_model(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(0.2)(x)
+    outputs = layers.Dense(num_classes, activation='softmax')(x)
+    return keras.Model(inputs, outputs, name=f'student_{config_name}')
+
+
+def make_distill_dataset(items, class_index, student_size, training):
+    """
+    tf.data pipeline yielding ((teacher_image, student_image), label)
+
+    Both images come from the same (augmented) decode, resized like the
+    backend's preprocess_image() (Lanczos, [0, 1] RGB).
+    """
+    paths = [item['path'] for item in items]
+    labels = [class_index[item['label']] for item in items]
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if training:
+        dataset = dataset.shuffle(len(paths), reshuffle_each_iteration=True)
+
+    def load(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.convert_image_dtype(image, tf.float32)
+        if training:
+            image = tf.image.resize(image, (IMAGE_SIZE[0] + 32, IMAGE_SIZE[1] + 32), method='lanczos3')
+            image = tf.image.random_crop(image, (*IMAGE_SIZE, 3))
+            image = tf.image.random_flip_left_right(image)
+            image = tf.image.random_brightness(image, 0.1)
+            image = tf.image.random_contrast(image, 0.9, 1.1)
+        else:
+            image = tf.image.resize(image, IMAGE_SIZE, method='lanczos3')
+        image = tf.clip_by_value(image, 0.0, 1.0)
+        student_image = tf.image.resize(image, (student_size, student_size), method='lanczos3', antialias=True)
+        return (image, student_image), label
+
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+
+def distillation_loss(labels, teacher_probs, student_probs, temperature=DISTILL_TEMPERATURE, alpha=DISTILL_ALPHA):
+    """alpha * T^2 * KL(teacher_T || student_T) + (1 - alpha) * cross-entropy with the true labels"""
+    def soften(probs):
+        return tf.nn.softmax(tf.math.log(probs + 1e-8) / temperature)
+    soft = keras.losses.KLDivergence()(soften(teacher_probs), soften(student_probs)) * temperature ** 2
+    hard = tf.reduce_mean(keras.losses.sparse_categorical_crossentropy(labels, student_probs))
+    return alpha * soft + (1 - alpha) * hard
+
+
+def predict_holdout(model, dataset, use_student_input):
+    """Probabilities of a model over a distillation dataset"""
+    outputs = []
+    for (teacher_images, student_images), _ in dataset:
+        outputs.append(model(student_images if use_student_input else teacher_images, training=False).numpy())
+    return np.concatenate(outputs) if outputs else np.zeros((0, 0))
+
+
+def distill_student(teacher, config_name, train_ds, holdout_ds, holdout_labels, epochs=DISTILL_EPOCHS):
+    """Train one student against the teacher; keeps the weights with the best hold-out accuracy"""
+    student = build_student(teacher.output_shape[-1], config_name)
+    steps = max(int(train_ds.cardinality().numpy()), 1)
+    optimizer = keras.optimizers.Adam(
+        learning_rate=keras.optimizers.schedules.CosineDecay(DISTILL_LEARNING_RATE, decay_steps=epochs * steps)
+    )
+
+    @tf.function
+    def train_step(teacher_images, student_images, labels):
+        teacher_probs = teacher(teacher_images, training=False)
+        with tf.GradientTape() as tape:
+            student_probs = student(student_images, training=True)
+            loss = distillation_loss(labels, teacher_probs, student_probs)
+        gradients = tape.gradient(loss, student.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, student.trainable_variables))
+        return loss
+
+    best_accuracy, best_weights, stale = -1.0, None, 0
+    for epoch in range(epochs):
+        start = time.time()
+        losses = [float(train_step(t, s, y)) for (t, s), y in train_ds]
+        accuracy = float(np.mean(np.argmax(predict_holdout(student, holdout_ds, True), axis=1) == holdout_labels))
+        print(f"  [{config_name}] epoch {epoch + 1}/{epochs}: loss {np.mean(losses):.4f}, "
+              f"hold-out accuracy {accuracy:.4f} ({time.time() - start:.0f}s)")
+        if accuracy > best_accuracy:
+            best_accuracy, best_weights, stale = accuracy, student.get_weights(), 0
+        else:
+            stale += 1
+            if stale >= DISTILL_PATIENCE:
+                print(f"  [{config_name}] early stopping")
+                break
+    student.set_weights(best_weights)
+    return student
+
+
+def cpu_latency_ms(model, runs=LATENCY_RUNS):
+    """Median and p90 single-image latency on CPU, through model.predict like the backend"""
+    size = model.input_shape[1:3]
+    image = np.random.rand(1, *size, 3).astype(np.float32)
+    with tf.device('/CPU:0'):
+        model.predict(image, verbose=0, batch_size=1)  # trace
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            model.predict(image, verbose=0, batch_size=1)
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 90))
+
+
+def top2_margins(probabilities):
+    top2 = np.sort(probabilities, axis=1)[:, -2:]
+    return top2[:, 1] - top2[:, 0]
+
+
+def model_report_row(name, model, model_path, probs, labels, teacher_probs):
+    """Size / CPU latency / accuracy row for the distillation table"""
+    latency_median, latency_p90 = cpu_latency_ms(model)
+    predicted = np.argmax(probs, axis=1)
+    top3 = np.argsort(probs, axis=1)[:, -3:]
+    return {
+        'name': name,
+        'input_size': int(model.input_shape[1]),
+        'params': int(model.count_params()),
+        'file_mb': os.path.getsize(model_path) / (1024 * 1024),
+        'cpu_latency_ms': latency_median,
+        'cpu_latency_p90_ms': latency_p90,
+        'accuracy': float(np.mean(predicted == labels)),
+        'top_3_accuracy': float(np.mean(np.any(top3 == labels[:, None], axis=1))),
+        'teacher_agreement': float(np.mean(predicted == np.argmax(teacher_probs, axis=1)))
+    }
+
+
+def cascade_report(student_probs, teacher_probs, labels, student_latency, teacher_latency):
+    """Escalation rate, accuracy and expected latency of the student -> teacher cascade per margin"""
+    margins = top2_margins(student_probs)
+    rows = []
+    for threshold in CASCADE_MARGINS:
+        escalate = margins < threshold
+        predicted = np.where(escalate, np.argmax(teacher_probs, axis=1), np.argmax(student_probs, axis=1))
+        rate = float(np.mean(escalate))
+        rows.append({
+            'margin': threshold,
+            'escalation_rate': rate,
+            'accuracy': float(np.mean(predicted == labels)),
+            'expected_latency_ms': student_latency + rate * teacher_latency
+        })
+    return rows
+
+
+def distill(student_names, epochs=DISTILL_EPOCHS):
+    """Distill model.h5 into each student config and write the size/latency/accuracy table"""
+    from retrain_head import collect_images, split_holdout
+    from model_registry import write_manifest
+
+    print("=" * 50)
+    print("Distilling model.h5 into student models")
+    print("=" * 50)
+
+    teacher_path = os.path.join(MODEL_SAVE_DIR, 'model.h5')
+    with open(os.path.join(MODEL_SAVE_DIR, 'class_names.json'), 'r', encoding='utf-8') as f:
+        class_names = json.load(f)
+    class_index = {name: i for i, name in enumerate(class_names)}
+    teacher = keras.models.load_model(teacher_path)
+    teacher.trainable = False
+
+    items = [{'path': path, 'label': label} for path, label, source in collect_images(class_names)
+             if source == 'raw' and os.path.splitext(path)[1].lower() in TF_IMAGE_EXTENSIONS]
+    train_items, holdout_items = split_holdout(items)
+    holdout_labels = np.array([class_index[item['label']] for item in holdout_items])
+    print(f"Images: {len(train_items)} train, {len(holdout_items)} held out, {len(class_names)} classes")
+    if not train_items or not holdout_items:
+        print("Error: no training images found under data/raw")
+        return None
+
+    teacher_holdout = make_distill_dataset(holdout_items, class_index, IMAGE_SIZE[0], training=False)
+    teacher_probs = predict_holdout(teacher, teacher_holdout, False)
+    rows = [model_report_row('teacher (model.h5)', teacher, teacher_path, teacher_probs, holdout_labels,
+                             teacher_probs)]
+    report = {'created_at': datetime.now().isoformat(), 'holdout_samples': len(holdout_items),
+              'temperature': DISTILL_TEMPERATURE, 'alpha': DISTILL_ALPHA, 'students': {}}
+
+    for name in student_names:
+        size = STUDENT_CONFIGS[name][1]
+        print(f"\nTraining student {name}...")
+        train_ds = make_distill_dataset(train_items, class_index, size, training=True)
+        holdout_ds = make_distill_dataset(holdout_items, class_index, size, training=False)
+        student = distill_student(teacher, name, train_ds, holdout_ds, holdout_labels, epochs=epochs)
+
+        version = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        version_dir = os.path.join(STUDENT_VERSIONS_DIR, version)
+        os.makedirs(version_dir, exist_ok=True)
+        model_path = os.path.join(version_dir, 'model.h5')
+        student.save(model_path)
+        write_manifest(version_dir, 'image_student', class_names, [size, size, 3], source='train_model --distill')
+
+        student_probs = predict_holdout(student, holdout_ds, True)
+        row = model_report_row(name, student, model_path, student_probs, holdout_labels, teacher_probs)
+        row['version'] = version
+        rows.append(row)
+        report['students'][name] = {
+            'version': version,
+            'cascade': cascade_report(student_probs, teacher_probs, holdout_labels,
+                                      row['cpu_latency_ms'], rows[0]['cpu_latency_ms'])
+        }
+    report['table'] = rows
+
+    os.makedirs(STUDENT_DIR, exist_ok=True)
+    report_path = os.path.join(STUDENT_DIR, 'distillation_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print("\n" + "=" * 50)
+    print("Distillation Results (hold-out, CPU batch size 1):")
+    print("=" * 50)
+    print("| Model | Input | Params | Size (MB) | CPU ms (p50/p90) | Top-1 | Top-3 | Agrees w/ teacher |")
+    print("|---|---|---|---|---|---|---|---|")
+    for row in rows:
+        print(f"| {row['name']} | {row['input_size']} | {row['params'] / 1e6:.2f}M | {row['file_mb']:.1f} | "
+              f"{row['cpu_latency_ms']:.1f}/{row['cpu_latency_p90_ms']:.1f} | {row['accuracy']:.4f} | "
+              f"{row['top_3_accuracy']:.4f} | {row['teacher_agreement']:.4f} |")
+    for name, student_report in report['students'].items():
+        print(f"\nCascade {name} -> teacher:")
+        for row in student_report['cascade']:
+            print(f"  margin {row['margin']:.1f}: escalation {row['escalation_rate']:.1%}, "
+                  f"accuracy {row['accuracy']:.4f}, expected {row['expected_latency_ms']:.1f} ms")
+    print(f"\nReport saved to {report_path}")
+    print(f"Students saved to {STUDENT_VERSIONS_DIR}; serve one with")
+    print(f"  python ../../web_app/backend/model_registry.py --dir {STUDENT_VERSIONS_DIR} --kind image_student --activate <version>")
+    print("=" * 50)
+    return report
+
+
 def plot_training_history(history, history_finetune=None):
     """Plot training history"""
     
@@ -300,6 +573,13 @@ def plot_confusion_matrix(true_classes, predicted_classes, class_names):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the image classifier or distill it into students')
+    parser.add_argument('--distill', action='store_true', help='Distill model.h5 into smaller student models')
+    parser.add_argument('--students', nargs='+', choices=sorted(STUDENT_CONFIGS), default=list(STUDENT_CONFIGS),
+                        help='Student configurations to train with --distill')
+    parser.add_argument('--epochs', type=int, default=DISTILL_EPOCHS, help='Distillation epochs per student')
+    args = parser.parse_args()
+    
     # Set GPU memory growth
     gpus = tf.config.experimental.list_physical_devices('GPU')
     if gpus:
@@ -309,5 +589,8 @@ if __name__ == '__main__':
         except RuntimeError as e:
             print(e)
     
-    train_model()
+    if args.distill:
+        distill(args.students, epochs=args.epochs)
+    else:
+        train_model()
 
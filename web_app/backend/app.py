@@ -3,7 +3,7 @@ Flask Backend for Butterfly and Bird Identification System
 Handles image upload and model prediction
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import os
 import numpy as np
@@ -11,6 +11,10 @@ from PIL import Image, ImageEnhance, ImageFilter
 import tensorflow as tf
 from werkzeug.utils import secure_filename
 import json
+import hmac
+import io
+import threading
+import time
 from datetime import datetime
 import gc  # For memory management
 try:
@@ -23,18 +27,37 @@ except ImportError:
 # Import semantic matcher for description-based identification
 try:
     from semantic_matcher import identify_species_semantic, initialize as init_semantic_matcher
+    from semantic_matcher import get_cache_stats as get_semantic_cache_stats
+    from semantic_matcher import encode_query, extract_colors_from_query
     SEMANTIC_MATCHER_AVAILABLE = True
 except ImportError:
     SEMANTIC_MATCHER_AVAILABLE = False
     print("Warning: Semantic matcher not available. Using keyword matching.")
 
+from cascade import CASCADE_ENABLED, FULL, STUDENT, get_model_cascade, image_input_size
+from description_sessions import get_session_store
+from feedback_analytics import feedback_labels, get_feedback_analytics
+from feedback_store import get_feedback_log
+from feedback_uploads import label_upload, retain_upload
+from feedback_uploads import stats as get_feedback_upload_stats
+from history_store import MAX_IMPORT_ITEMS, get_history_store
+from identification_stats import compute_statistics, get_species_category_map
+from load_governor import FULL as QUALITY_FULL, MINIMAL as QUALITY_MINIMAL, REDUCED as QUALITY_REDUCED
+from load_governor import get_load_governor
+from model_registry import ModelHandle, all_model_registries, file_sha256, get_model_registry, read_active
+from prediction_cache import get_prediction_cache, prediction_cache_key
+from request_deadline import DEADLINE_HEADER, SKIPPED_DEADLINE, RequestDeadline, deadline_budget_ms, get_stage_costs
+from shadow_eval import all_shadow_evaluators, get_shadow_evaluator, get_shadow_store
+from warmup import get_warmup_manager
+
 app = Flask(__name__)
 # Configure CORS to allow all origins (for mobile and web access)
 CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", DEADLINE_HEADER],
+        "expose_headers": ["X-Model-Version"],
         "max_age": 3600
     }
 })
@@ -57,6 +80,9 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 ALLOWED_AUDIO_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'ogg', 'aac'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 MAX_AUDIO_SIZE = 10 * 1024 * 1024  # 10MB for audio files
+REDUCED_CARTOON_MAX_SIDE = 256  # cartoon check on a thumbnail in the governor's reduced mode
+# Bearer token for /api/admin/* (admin endpoints are disabled when unset)
+MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN', '')
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
@@ -257,8 +283,13 @@ def audio_to_spectrogram(audio_path, target_size=(128, 128)):
 
 
 def load_model():
-    """Load the trained model and class names"""
-    global model, class_names
+    """
+    Load the trained model and class names
+    
+    Serves the version named by models/trained/versions/ACTIVE if there is
+    one, otherwise models/trained/model.h5 (versioned by its checksum).
+    """
+    global model, class_names, feature_extractor
     
     # Get the base directory (project root)
     # Try multiple possible paths for different deployment environments
@@ -390,46 +421,75 @@ def load_model():
                     base_dir = root
                     break
     
+    registry = _get_image_registry(os.path.join(base_dir, 'models', 'trained', 'versions'))
+    active_version = read_active(registry.versions_dir)
+    if active_version and registry.activate(active_version, wait=True, persist=False):
+        print(f"Model version {active_version} loaded from {registry.versions_dir}")
+        return
+    
+    loaded_model = None
+    extras = {}
     if os.path.exists(model_path):
         try:
-            model = tf.keras.models.load_model(model_path)
+            # The classifier plus a feature extractor (layer before classification) for similarity
+            loaded_model, extras = _load_image_model_file(model_path)
             print(f"Model loaded successfully from {model_path}")
-            
-            # Create feature extractor model (extract features before final classification layer)
-            # This will be used for similarity calculations
-            global feature_extractor
-            try:
-                # Try to get the layer before the final Dense layer
-                # For MobileNetV2-based models, this is usually the global average pooling layer
-                if len(model.layers) > 1:
-                    # Get all layers except the last (classification) layer
-                    feature_extractor = tf.keras.Model(
-                        inputs=model.input,
-                        outputs=model.layers[-2].output  # Second to last layer (before classification)
-                    )
-                    print(f"Feature extractor created successfully")
-                else:
-                    # Fallback: use the model itself but extract intermediate features
-                    feature_extractor = model
-                    print(f"Using model as feature extractor (fallback)")
-            except Exception as e:
-                print(f"Warning: Could not create feature extractor: {e}")
-                feature_extractor = model  # Fallback to using the model itself
         except Exception as e:
             print(f"Error loading model: {e}")
-            model = None
-            feature_extractor = None
+            loaded_model = None
     else:
         print(f"Model not found at {model_path}. Please train the model first.")
     
+    names = []
     if os.path.exists(class_names_path):
         try:
             with open(class_names_path, 'r', encoding='utf-8') as f:
-                class_names = json.load(f)
-            print(f"Class names loaded: {len(class_names)} classes")
+                names = json.load(f)
+            print(f"Class names loaded: {len(names)} classes")
         except Exception as e:
             print(f"Error loading class names: {e}")
-            class_names = []
+            names = []
+    
+    if loaded_model is None:
+        model, feature_extractor, class_names = None, None, names
+        return
+    # Unregistered model.h5: versioned by its checksum
+    registry.install(ModelHandle(f"base-{file_sha256(model_path)[:12]}", 'image', loaded_model, names,
+                                 list(loaded_model.input_shape[1:]), extras))
+
+
+def _load_image_model_file(model_path):
+    """Registry loader: the classifier and its feature extractor (output of the second to last layer)."""
+    loaded_model = tf.keras.models.load_model(model_path)
+    try:
+        if len(loaded_model.layers) > 1:
+            # For MobileNetV2-based models this is the layer before the final Dense layer
+            extractor = tf.keras.Model(inputs=loaded_model.input, outputs=loaded_model.layers[-2].output)
+            print(f"Feature extractor created successfully")
+        else:
+            extractor = loaded_model
+            print(f"Using model as feature extractor (fallback)")
+    except Exception as e:
+        print(f"Warning: Could not create feature extractor: {e}")
+        extractor = loaded_model
+    return loaded_model, {'feature_extractor': extractor}
+
+
+def _install_image_handle(handle):
+    """Point the module-level image model globals at a newly served version."""
+    global model, class_names, feature_extractor
+    model = handle.model
+    class_names = handle.class_names
+    feature_extractor = handle.extras.get('feature_extractor')
+
+
+def _get_image_registry(versions_dir=None):
+    """The image model registry (created on the first call, from load_model())."""
+    registry = get_model_registry('image')
+    if registry is None and versions_dir is not None:
+        registry = get_model_registry('image', versions_dir, _load_image_model_file, _warm_up_image_handle)
+        registry.add_listener(_install_image_handle)
+    return registry
 
 
 def load_bird_sound_model():
@@ -484,6 +544,12 @@ def load_bird_sound_model():
         bird_sound_class_names = []
         return
     
+    registry = _get_bird_sound_registry(os.path.join(base_dir, 'models', 'trained', 'bird_sound', 'versions'))
+    active_version = read_active(registry.versions_dir)
+    if active_version and registry.activate(active_version, wait=True, persist=False):
+        print(f"✅ Bird sound model version {active_version} loaded from {registry.versions_dir}")
+        return
+    
     # Try to load model.h5 first (new format), then fallback to bird_sound_model.h5 (legacy)
     model_path = os.path.join(base_dir, 'models', 'trained', 'bird_sound', 'model.h5')
     if not os.path.exists(model_path):
@@ -491,29 +557,131 @@ def load_bird_sound_model():
     
     class_names_path = os.path.join(base_dir, 'models', 'trained', 'bird_sound', 'class_names.json')
     
+    loaded_model = None
     if os.path.exists(model_path):
         try:
-            bird_sound_model = tf.keras.models.load_model(model_path)
+            loaded_model, _ = _load_bird_sound_model_file(model_path)
             print(f"✅ Bird sound model loaded successfully from {model_path}")
         except Exception as e:
             print(f"❌ Error loading bird sound model: {e}")
-            bird_sound_model = None
+            loaded_model = None
     else:
         print(f"⚠️ Bird sound model not found at {model_path}")
-        bird_sound_model = None
     
+    names = []
     if os.path.exists(class_names_path):
         try:
             with open(class_names_path, 'r', encoding='utf-8') as f:
-                bird_sound_class_names = json.load(f)
-            print(f"✅ Bird sound class names loaded: {len(bird_sound_class_names)} classes")
-            print(f"   Classes: {', '.join(bird_sound_class_names[:5])}{'...' if len(bird_sound_class_names) > 5 else ''}")
+                names = json.load(f)
+            print(f"✅ Bird sound class names loaded: {len(names)} classes")
+            print(f"   Classes: {', '.join(names[:5])}{'...' if len(names) > 5 else ''}")
         except Exception as e:
             print(f"❌ Error loading bird sound class names: {e}")
-            bird_sound_class_names = []
+            names = []
     else:
         print(f"⚠️ Bird sound class names not found at {class_names_path}")
-        bird_sound_class_names = []
+    
+    if loaded_model is None:
+        bird_sound_model, bird_sound_class_names = None, names
+        return
+    registry.install(ModelHandle(f"base-{file_sha256(model_path)[:12]}", 'bird_sound', loaded_model, names,
+                                 list(loaded_model.input_shape[1:])))
+
+
+def _load_bird_sound_model_file(model_path):
+    """Registry loader for the bird sound model."""
+    return tf.keras.models.load_model(model_path), {}
+
+
+def _install_bird_sound_handle(handle):
+    """Point the module-level bird sound globals at a newly served version."""
+    global bird_sound_model, bird_sound_class_names
+    bird_sound_model = handle.model
+    bird_sound_class_names = handle.class_names
+
+
+def _get_bird_sound_registry(versions_dir=None):
+    """The bird sound model registry (created on the first call, from load_bird_sound_model())."""
+    registry = get_model_registry('bird_sound')
+    if registry is None and versions_dir is not None:
+        registry = get_model_registry('bird_sound', versions_dir, _load_bird_sound_model_file,
+                                      _warm_up_bird_sound_handle)
+        registry.add_listener(_install_bird_sound_handle)
+    return registry
+
+
+def load_student_model():
+    """
+    Load the cascade's student classifier (models/trained/student), if there is one
+    
+    Same layout as the full model: a versions directory with an ACTIVE
+    pointer, or a plain model.h5 + class_names.json.
+    """
+    image_registry = _get_image_registry()
+    if image_registry is None:
+        return
+    student_dir = os.path.join(os.path.dirname(image_registry.versions_dir), 'student')
+    registry = _get_student_registry(os.path.join(student_dir, 'versions'))
+    active_version = read_active(registry.versions_dir)
+    if active_version and registry.activate(active_version, wait=True, persist=False):
+        print(f"✅ Student model version {active_version} loaded (cascade margin {get_model_cascade().margin})")
+        return
+    
+    model_path = os.path.join(student_dir, 'model.h5')
+    class_names_path = os.path.join(student_dir, 'class_names.json')
+    if not os.path.exists(model_path) or not os.path.exists(class_names_path):
+        print("ℹ️ No student model; /api/predict always runs the full model")
+        return
+    try:
+        loaded_model, extras = _load_student_model_file(model_path)
+        with open(class_names_path, 'r', encoding='utf-8') as f:
+            names = json.load(f)
+    except Exception as e:
+        print(f"❌ Error loading student model: {e}")
+        return
+    registry.install(ModelHandle(f"base-{file_sha256(model_path)[:12]}", 'image_student', loaded_model, names,
+                                 list(loaded_model.input_shape[1:]), extras))
+    print(f"✅ Student model loaded from {model_path} (cascade margin {get_model_cascade().margin})")
+
+
+def _load_student_model_file(model_path):
+    """Registry loader for the cascade's student classifier."""
+    return tf.keras.models.load_model(model_path), {}
+
+
+def _warm_up_student_handle(handle):
+    handle.model.predict(_dummy_model_input(handle.model, (224, 224, 3)), verbose=0, batch_size=1)
+
+
+def _get_student_registry(versions_dir=None):
+    """The student model registry (created on the first call, from load_student_model())."""
+    registry = get_model_registry('image_student')
+    if registry is None and versions_dir is not None:
+        registry = get_model_registry('image_student', versions_dir, _load_student_model_file,
+                                      _warm_up_student_handle)
+    return registry
+
+
+def _served_model(registry):
+    """The handle a request should use from start to finish (None if no model is loaded)."""
+    return registry.current() if registry is not None else None
+
+
+def _clear_keras_session():
+    """tf.keras.backend.clear_session(), except while a model version is being built in the background."""
+    if any(registry.loading for registry in all_model_registries().values()):
+        return
+    if any(evaluator.loading for evaluator in all_shadow_evaluators().values()):
+        return
+    tf.keras.backend.clear_session()
+
+
+def _submit_shadow(kind, inputs, served, predicted_class, confidence, latency_ms):
+    """Hand a sampled request's model input to the shadow candidate, if one is being evaluated (never blocks)."""
+    evaluator = get_shadow_evaluator(kind)
+    if evaluator is not None and evaluator.should_sample():
+        evaluator.submit(inputs, {'version': served.version, 'class': predicted_class,
+                                  'confidence': confidence, 'latency_ms': latency_ms})
 
 
 def load_general_model():
@@ -655,18 +823,23 @@ def calculate_similarity(feature1, feature2):
         return 0.0
 
 
-def get_similar_species_from_predictions(predictions_array, top_k=5, exclude_idx=None):
-    """Find similar species from already computed predictions - Memory optimized"""
-    global class_names
+def get_similar_species_from_predictions(predictions_array, top_k=5, exclude_idx=None, names=None):
+    """Find similar species from already computed predictions - Memory optimized
+    
+    names: class names of the model version that produced the predictions
+    (defaults to the currently served version's)
+    """
+    if names is None:
+        names = class_names
     
-    if not class_names:
+    if not names:
         return []
     
     try:
         # Use predictions that were already computed (no need to call model.predict again)
         # This saves significant memory
         similarities = []
-        for idx in range(len(class_names)):
+        for idx in range(len(names)):
             # Skip the predicted class itself
             if exclude_idx is not None and idx == exclude_idx:
                 continue
@@ -680,7 +853,7 @@ def get_similar_species_from_predictions(predictions_array, top_k=5, exclude_idx
             if similarity_score > 0.01:
                 similarities.append({
                     'index': idx,
-                    'class': class_names[idx] if idx < len(class_names) else f"Class_{idx}",
+                    'class': names[idx] if idx < len(names) else f"Class_{idx}",
                     'similarity': similarity_score,
                     'confidence': similarity_score
                 })
@@ -715,7 +888,7 @@ def get_similar_species(image_array, top_k=5, exclude_idx=None):
         return []
 
 
-def is_cartoon_or_illustration(image_path):
+def is_cartoon_or_illustration(image_path, max_side=None):
     """
     Detect if an image is a cartoon, illustration, or non-photographic image.
     Cartoon/illustration images typically have:
@@ -723,11 +896,15 @@ def is_cartoon_or_illustration(image_path):
     - Very sharp edges (high edge density)
     - Low texture variation (uniform color patches)
     - High contrast between regions
+    
+    max_side: analyze a thumbnail no larger than this (cheaper, less precise)
     """
     try:
         img = Image.open(image_path)
         if img.mode != 'RGB':
             img = img.convert('RGB')
+        if max_side:
+            img.thumbnail((max_side, max_side))
         
         img_array = np.array(img)
         
@@ -1065,18 +1242,28 @@ def predict():
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
         response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Headers', f'Content-Type, {DEADLINE_HEADER}')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response
     
+    # Latency budget for the whole request; optional stages are skipped when it runs short
+    deadline = RequestDeadline(deadline_budget_ms(request.headers.get(DEADLINE_HEADER)))
+    
     # Log request info for debugging
     print(f"Predict request from: {request.remote_addr}")
     print(f"User-Agent: {request.headers.get('User-Agent', 'Unknown')}")
     
-    if model is None:
+    # Use one model version for the whole request, even if a new one is swapped in meanwhile
+    served = _served_model(_get_image_registry())
+    if served is None:
         return jsonify({
             'error': 'Model not loaded. Please train and save the model first.'
         }), 503
+    g.model_version = served.version
+    # Optional stages are degraded under load (full / reduced / minimal)
+    quality_mode = get_load_governor().mode()
+    # Opt-in progressive response (server-sent events): top-3 first, enrichment as it is computed
+    stream = _wants_prediction_stream()
     
     if 'image' not in request.files:
         return jsonify({'error': 'No image file provided'}), 400
@@ -1095,199 +1282,350 @@ def predict():
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_{filename}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        with deadline.stage('upload', cost_key=False):
+            file.save(filepath)
+        
+        events = _image_prediction_events(filepath, served, quality_mode, deadline,
+                                      include_catalog=stream)
+        if stream:
+            return _prediction_stream(events, filepath)
+        for event_type, data in events:
+            if event_type == 'error':
+                return jsonify({'error': data['error']}), data['status']
+            if event_type == 'done':
+                return _prediction_response(data)
+    
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Error during prediction: {e}")
+        print(f"Traceback: {error_trace}")
         
+        response = jsonify({
+            'error': str(e),
+            'message': 'Failed to process prediction. Please try again.'
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 500
+
+
+# Fields of the 'prediction' event of a streamed /api/predict
+PREDICTION_EVENT_FIELDS = ('prediction', 'model_version', 'cascade', 'quality_mode')
+
+
+def _image_prediction_events(filepath, served, quality_mode, deadline, include_catalog=False):
+    """
+    Run the /api/predict pipeline on a saved upload, yielding (event, data) as results become available.
+    
+    Events, in order:
+    - prediction: classifier top-3 (right after the forward pass)
+    - verification: cartoon check and general model (ImageNet) result
+    - warning: the non-target / low-confidence warning, or None
+    - similar_species
+    - catalog: species catalog entry of the predicted class (include_catalog only)
+    - done: the complete response payload
+    - error: {'error', 'status'} instead of the rest when the image cannot be processed
+    """
+    model, class_names = served.model, served.class_names
+    
+    # Cascade student (only one trained on the served model's class list)
+    student = _served_model(_get_student_registry()) if CASCADE_ENABLED else None
+    if student is not None and student.class_names != class_names:
+        student = None
+    pipeline_version = served.version if student is None else f"{served.version}+{student.version}"
+    
+    # Same image under the same model versions: reuse the previous result
+    with deadline.stage('cache_lookup', cost_key=False):
+        cache_key = prediction_cache_key(pipeline_version, filepath)
+        cached = get_prediction_cache().get(cache_key)
+    if cached is not None:
+        print(f"⚡ Prediction cache hit: {cached['prediction']['class']} ({pipeline_version})")
+        upload_id = _discard_upload(filepath)
+        # Same events as a fresh prediction, minus verification (nothing was re-run)
+        yield 'prediction', {key: cached[key] for key in PREDICTION_EVENT_FIELDS}
+        yield 'warning', {'warning': cached['warning']}
+        yield 'similar_species', {'similar_species': cached['similar_species']}
+        if include_catalog:
+            yield 'catalog', {'species': cached['prediction']['class'],
+                              'info': _species_catalog_entry(cached['prediction']['class'])}
+        yield 'done', dict(cached, upload_id=upload_id, timing=deadline.report())
+        return
+    
+    # Clear TensorFlow session cache before prediction to free memory
+    _clear_keras_session()
+    cascade_start = time.perf_counter()
+    cascade_info = None
+    predictions = None
+    processed_image = None
+    
+    # The student answers when its top-2 margin is high; uncertain images escalate to the full model
+    if student is not None:
+        student_start = time.perf_counter()
+        student_image = preprocess_image(filepath, target_size=image_input_size(student))
+        if student_image is not None:
+            student_predictions = student.model.predict(student_image, verbose=0, batch_size=1)
+            accepted, margin = get_model_cascade().accepts(student_predictions[0])
+            cascade_info = {'stage': STUDENT if accepted else FULL, 'margin': margin,
+                            'student_version': student.version}
+            if accepted:
+                predictions = student_predictions
+            del student_image
+        deadline.record('student', (time.perf_counter() - student_start) * 1000, cost_key=False)
+    
+    full_model_ms = None
+    if predictions is None:
         # Preprocess image
+        full_start = time.perf_counter()
         processed_image = preprocess_image(filepath)
         
         if processed_image is None:
-            return jsonify({'error': 'Failed to process image'}), 500
+            yield 'error', {'error': 'Failed to process image', 'status': 500}
+            return
         
         # Make prediction - use batch_size=1 to reduce memory usage
-        # Clear TensorFlow session cache before prediction to free memory
-        tf.keras.backend.clear_session()
+        predict_start = time.perf_counter()
         predictions = model.predict(processed_image, verbose=0, batch_size=1)
-        predicted_class_idx = np.argmax(predictions[0])
-        confidence = float(predictions[0][predicted_class_idx])
-        
-        # Get class name
-        if class_names and predicted_class_idx < len(class_names):
-            predicted_class = class_names[predicted_class_idx]
+        predict_ms = (time.perf_counter() - predict_start) * 1000
+        full_model_ms = (time.perf_counter() - full_start) * 1000
+        deadline.record('classify', full_model_ms, cost_key=False)
+    predicted_class_idx = np.argmax(predictions[0])
+    confidence = float(predictions[0][predicted_class_idx])
+    
+    # Get class name
+    if class_names and predicted_class_idx < len(class_names):
+        predicted_class = class_names[predicted_class_idx]
+    else:
+        predicted_class = f"Class_{predicted_class_idx}"
+    if processed_image is not None:
+        _submit_shadow('image', processed_image, served, predicted_class, confidence, predict_ms)
+    if cascade_info is not None:
+        cascade = get_model_cascade()
+        cascade.record(cascade_info['stage'], (time.perf_counter() - cascade_start) * 1000, full_model_ms)
+        if cascade_info['stage'] == STUDENT and cascade.should_audit():
+            # The upload is moved or deleted when this request finishes
+            with open(filepath, 'rb') as f:
+                cascade.submit_audit(io.BytesIO(f.read()), predicted_class, served, preprocess_image)
+    
+    # Get top 3 predictions
+    top_indices = np.argsort(predictions[0])[-3:][::-1]
+    top_predictions = []
+    for idx in top_indices:
+        if class_names and idx < len(class_names):
+            class_name = class_names[idx]
         else:
-            predicted_class = f"Class_{predicted_class_idx}"
-        
-        # Get top 3 predictions
-        top_indices = np.argsort(predictions[0])[-3:][::-1]
-        top_predictions = []
-        for idx in top_indices:
-            if class_names and idx < len(class_names):
-                class_name = class_names[idx]
+            class_name = f"Class_{idx}"
+        top_predictions.append({
+            'class': class_name,
+            'confidence': float(predictions[0][idx])
+        })
+    # Streaming clients can show the top-3 now; the checks below only add warnings and enrichment
+    yield 'prediction', {
+        'prediction': {
+            'class': predicted_class,
+            'confidence': confidence,
+            'top_predictions': top_predictions
+        },
+        'model_version': served.version,
+        'cascade': cascade_info,
+        'quality_mode': quality_mode
+    }
+
+    # 檢測是否為非蝴蝶/鳥類圖片
+    # 方法0: 優先檢測是否為卡通/插畫圖片（所有卡通圖片都歸類為 others）
+    # 按剩余时间预算决定：完整检测、缩略图检测（cut short）或跳过
+    is_cartoon = False
+    try:
+        # 如果置信度已经很高，可以跳过详细检测以节省时间
+        if quality_mode == QUALITY_MINIMAL:
+            deadline.skip('cartoon_check', 'quality_mode')
+            print("⏱️ Cartoon detection skipped (minimal quality mode)")
+        elif confidence > 0.80:
+            # 高置信度时，假设不是卡通（快速路径）
+            is_cartoon = False
+            deadline.skip('cartoon_check', 'high_confidence')
+            print("⏱️ Cartoon detection skipped (high confidence)")
+        else:
+            # 低置信度时，进行快速检测（限制处理时间）; reduced mode and a short budget check a thumbnail
+            cut_short = quality_mode == QUALITY_FULL and not deadline.allows('cartoon_check')
+            thumbnail = cut_short or quality_mode == QUALITY_REDUCED
+            cost_key = 'cartoon_check_thumbnail' if thumbnail else 'cartoon_check'
+            if not deadline.allows(cost_key):
+                deadline.skip('cartoon_check', SKIPPED_DEADLINE)
+                print(f"⏱️ Cartoon detection skipped ({deadline.remaining_ms():.0f} ms left)")
             else:
-                class_name = f"Class_{idx}"
-            top_predictions.append({
-                'class': class_name,
-                'confidence': float(predictions[0][idx])
-            })
-        
-        # 檢測是否為非蝴蝶/鳥類圖片
-        # 方法0: 優先檢測是否為卡通/插畫圖片（所有卡通圖片都歸類為 others）
-        # 添加超时保护，避免卡通检测耗时过长导致服务不健康
-        is_cartoon = False
+                details = {'thumbnail': True, 'cut_short': cut_short} if thumbnail else {}
+                with deadline.stage('cartoon_check', cost_key=cost_key, **details):
+                    is_cartoon = is_cartoon_or_illustration(
+                        filepath, max_side=REDUCED_CARTOON_MAX_SIDE if thumbnail else None
+                    )
+    except Exception as cartoon_error:
+        print(f"⚠️ Cartoon detection error (continuing): {cartoon_error}")
+        is_cartoon = False  # 出错时假设不是卡通，继续处理
+    
+    is_likely_not_target = is_cartoon
+    general_prediction = None
+    
+    # 計算前3個預測的總置信度
+    top3_total_confidence = sum(p['confidence'] for p in top_predictions[:3])
+    
+    # 方法1: 如果置信度低於30%，可能是其他類型的圖片
+    LOW_CONFIDENCE_THRESHOLD = 0.30
+    is_likely_not_target = is_likely_not_target or confidence < LOW_CONFIDENCE_THRESHOLD
+    
+    # 方法2: 計算前3個預測的總置信度，如果都很低，更可能是非目標圖片
+    is_likely_not_target = is_likely_not_target or top3_total_confidence < 0.50
+    
+    # 如果置信度很低（<30%）或中等置信度（30-80%），嘗試使用通用模型識別進行驗證
+    # 這樣可以捕獲誤識別的情況（如人被識別為鳥類）
+    should_use_general_model = (confidence < LOW_CONFIDENCE_THRESHOLD) or (0.30 <= confidence < 0.80)
+    
+    if should_use_general_model and quality_mode != QUALITY_FULL:
+        deadline.skip('general_model', 'quality_mode')
+        print(f"⏱️ General model verification skipped ({quality_mode} quality mode)")
+    elif should_use_general_model and general_model is not None and not is_cartoon and not deadline.allows('general_model'):
+        deadline.skip('general_model', SKIPPED_DEADLINE)
+        print(f"⏱️ General model verification skipped ({deadline.remaining_ms():.0f} ms left)")
+    elif should_use_general_model and general_model is not None and not is_cartoon:
+        print(f"🔄 Verifying with general model (confidence: {confidence:.2%})...")
+        general_start = time.perf_counter()
         try:
-            # 如果置信度已经很高，可以跳过详细检测以节省时间
-            if confidence > 0.80:
-                # 高置信度时，假设不是卡通（快速路径）
-                is_cartoon = False
-                print("⏱️ Cartoon detection skipped (high confidence)")
-            else:
-                # 低置信度时，进行快速检测（限制处理时间）
-                is_cartoon = is_cartoon_or_illustration(filepath)
-        except Exception as cartoon_error:
-            print(f"⚠️ Cartoon detection error (continuing): {cartoon_error}")
-            is_cartoon = False  # 出错时假设不是卡通，继续处理
-        
-        is_likely_not_target = is_cartoon
-        general_prediction = None
-        
-        # 計算前3個預測的總置信度
-        top3_total_confidence = sum(p['confidence'] for p in top_predictions[:3])
-        
-        # 方法1: 如果置信度低於30%，可能是其他類型的圖片
-        LOW_CONFIDENCE_THRESHOLD = 0.30
-        is_likely_not_target = is_likely_not_target or confidence < LOW_CONFIDENCE_THRESHOLD
-        
-        # 方法2: 計算前3個預測的總置信度，如果都很低，更可能是非目標圖片
-        is_likely_not_target = is_likely_not_target or top3_total_confidence < 0.50
-        
-        # 如果置信度很低（<30%）或中等置信度（30-80%），嘗試使用通用模型識別進行驗證
-        # 這樣可以捕獲誤識別的情況（如人被識別為鳥類）
-        should_use_general_model = (confidence < LOW_CONFIDENCE_THRESHOLD) or (0.30 <= confidence < 0.80)
-        
-        if should_use_general_model and general_model is not None and not is_cartoon:
-            print(f"🔄 Verifying with general model (confidence: {confidence:.2%})...")
-            try:
-                # Preprocess for ImageNet
-                imagenet_image = preprocess_image_for_imagenet(filepath)
-                if imagenet_image is not None:
-                    # Make prediction with general model
-                    general_predictions = general_model.predict(imagenet_image, verbose=0)
-                    general_results = decode_imagenet_predictions(general_predictions, top=3)
+            # Preprocess for ImageNet
+            imagenet_image = preprocess_image_for_imagenet(filepath)
+            if imagenet_image is not None:
+                # Make prediction with general model
+                general_predictions = general_model.predict(imagenet_image, verbose=0)
+                general_results = decode_imagenet_predictions(general_predictions, top=3)
+                
+                if general_results and len(general_results) > 0:
+                    general_top_class = general_results[0]['class'].lower()
+                    general_confidence = general_results[0]['confidence']
                     
-                    if general_results and len(general_results) > 0:
-                        general_top_class = general_results[0]['class'].lower()
-                        general_confidence = general_results[0]['confidence']
-                        
-                        # 檢查通用模型識別出的類別是否明顯不是鳥類/蝴蝶
-                        # 定義明顯不是目標類別的關鍵詞
-                        non_target_keywords = [
-                            'person', 'people', 'human', 'man', 'woman', 'child', 'adult',
-                            'table', 'chair', 'furniture', 'desk', 'room', 'indoor',
-                            'car', 'vehicle', 'building', 'house', 'street', 'road',
-                            'dog', 'cat', 'pet', 'animal', 'mammal',
-                            'food', 'dish', 'meal', 'plate', 'cup', 'bottle',
-                            'phone', 'computer', 'screen', 'device', 'electronic'
-                        ]
-                        
-                        # 如果通用模型識別出明顯不是鳥類/蝴蝶的類別，且置信度較高
-                        is_non_target = any(keyword in general_top_class for keyword in non_target_keywords)
-                        
-                        if is_non_target and general_confidence > 0.50:
-                            general_prediction = {
-                                'class': general_results[0]['class'],
-                                'confidence': general_confidence,
-                                'top_predictions': general_results
-                            }
-                            print(f"✅ General model identified non-target: {general_prediction['class']} ({general_prediction['confidence']:.2%})")
-                            is_likely_not_target = True  # Mark as non-butterfly/bird
-                        elif confidence < LOW_CONFIDENCE_THRESHOLD:
-                            # 即使不是明顯的非目標類別，如果置信度很低，也使用通用識別結果
-                            general_prediction = {
-                                'class': general_results[0]['class'],
-                                'confidence': general_confidence,
-                                'top_predictions': general_results
-                            }
-                            print(f"✅ General model identified: {general_prediction['class']} ({general_prediction['confidence']:.2%})")
-                            is_likely_not_target = True
-            except Exception as e:
-                print(f"⚠️ Error in general model prediction: {e}")
-        
-        # 方法3: 即使置信度高，如果預測的類別不在已知類別列表中，也可能是錯誤識別
-        # 檢查預測的類別是否在 class_names 列表中
-        if class_names and predicted_class not in class_names:
+                    # 檢查通用模型識別出的類別是否明顯不是鳥類/蝴蝶
+                    # 定義明顯不是目標類別的關鍵詞
+                    non_target_keywords = [
+                        'person', 'people', 'human', 'man', 'woman', 'child', 'adult',
+                        'table', 'chair', 'furniture', 'desk', 'room', 'indoor',
+                        'car', 'vehicle', 'building', 'house', 'street', 'road',
+                        'dog', 'cat', 'pet', 'animal', 'mammal',
+                        'food', 'dish', 'meal', 'plate', 'cup', 'bottle',
+                        'phone', 'computer', 'screen', 'device', 'electronic'
+                    ]
+                    
+                    # 如果通用模型識別出明顯不是鳥類/蝴蝶的類別，且置信度較高
+                    is_non_target = any(keyword in general_top_class for keyword in non_target_keywords)
+                    
+                    if is_non_target and general_confidence > 0.50:
+                        general_prediction = {
+                            'class': general_results[0]['class'],
+                            'confidence': general_confidence,
+                            'top_predictions': general_results
+                        }
+                        print(f"✅ General model identified non-target: {general_prediction['class']} ({general_prediction['confidence']:.2%})")
+                        is_likely_not_target = True  # Mark as non-butterfly/bird
+                    elif confidence < LOW_CONFIDENCE_THRESHOLD:
+                        # 即使不是明顯的非目標類別，如果置信度很低，也使用通用識別結果
+                        general_prediction = {
+                            'class': general_results[0]['class'],
+                            'confidence': general_confidence,
+                            'top_predictions': general_results
+                        }
+                        print(f"✅ General model identified: {general_prediction['class']} ({general_prediction['confidence']:.2%})")
+                        is_likely_not_target = True
+        except Exception as e:
+            print(f"⚠️ Error in general model prediction: {e}")
+        deadline.record('general_model', (time.perf_counter() - general_start) * 1000)
+    yield 'verification', {'is_cartoon': is_cartoon, 'general_prediction': general_prediction}
+
+    # 方法3: 即使置信度高，如果預測的類別不在已知類別列表中，也可能是錯誤識別
+    # 檢查預測的類別是否在 class_names 列表中
+    if class_names and predicted_class not in class_names:
+        is_likely_not_target = True
+    
+    # 方法4: 如果置信度雖然高（>70%），但前3個預測的類別都不在已知類別列表中，也可能是錯誤識別
+    if confidence > 0.70 and class_names:
+        all_top3_invalid = all(p['class'] not in class_names for p in top_predictions[:3])
+        if all_top3_invalid:
             is_likely_not_target = True
-        
-        # 方法4: 如果置信度雖然高（>70%），但前3個預測的類別都不在已知類別列表中，也可能是錯誤識別
-        if confidence > 0.70 and class_names:
-            all_top3_invalid = all(p['class'] not in class_names for p in top_predictions[:3])
-            if all_top3_invalid:
-                is_likely_not_target = True
-        
-        # 方法5: 如果置信度高但前3個預測的總置信度異常低（說明模型不確定），也可能是錯誤識別
-        # 例如：置信度92%但前3個總和只有95%（正常應該接近100%）
-        # 如果前3個總置信度 < 98%，即使單個置信度高，也可能是錯誤識別
-        if confidence > 0.70 and top3_total_confidence < 0.98:
-            # 如果最高置信度很高，但前3個總和較低，說明模型可能錯誤地給某個類別很高的分數
-            # 這種情況下，即使置信度高，也可能是錯誤識別
-            confidence_ratio = confidence / top3_total_confidence if top3_total_confidence > 0 else 1.0
-            # 如果最高預測佔了前3個總和的90%以上，且總和 < 98%，可能是錯誤識別
-            if confidence_ratio > 0.90:
-                is_likely_not_target = True
-        
-        # 生成警告信息或通用識別結果
-        warning_message = None
-        if is_likely_not_target:
-            # 如果是卡通/插畫圖片，使用特殊的警告消息
-            if is_cartoon:
-                warning_message = {
-                    'type': 'cartoon',
-                    'title': '⚠️ Cartoon/Illustration Detected',
-                    'message': 'This appears to be a cartoon, illustration, or non-photographic image. This system is designed to identify real butterflies and birds from photographs.',
-                    'suggestions': [
-                        'Please upload a real photograph of a butterfly or bird',
-                        'Cartoon or illustrated images cannot be accurately identified',
-                        'Try using a clear photo taken with a camera'
-                    ],
-                    'confidence': confidence,
-                    'top3_total_confidence': top3_total_confidence
-                }
-            elif general_prediction:
-                # 使用通用模型識別結果
-                warning_message = {
-                    'type': 'general_identification',
-                    'title': '🔍 General Image Recognition',
-                    'message': f'This image appears to be: {general_prediction["class"]} (not a butterfly or bird).',
-                    'suggestions': [
-                        'This system is designed for butterfly and bird identification',
-                        'The image has been identified using general image recognition',
-                        'For better results, please upload a clear photo of a butterfly or bird'
-                    ],
-                    'confidence': general_prediction['confidence'],
-                    'top3_total_confidence': sum(p['confidence'] for p in general_prediction['top_predictions'][:3]),
-                    'general_prediction': general_prediction
-                }
-            else:
-                # 低置信度警告
-                warning_message = {
-                    'type': 'low_confidence',
-                    'title': '⚠️ Low Identification Confidence',
-                    'message': 'This image may not be a butterfly or bird, or the image quality is insufficient for accurate identification.',
-                    'suggestions': [
-                        'Please ensure you upload a clear photo of a butterfly or bird',
-                        'Try taking photos from different angles to ensure the subject is clearly visible',
-                        'Ensure the photo has sufficient lighting, avoid blurry or too dark images',
-                        'If it is indeed a butterfly or bird, please try taking a clearer photo'
-                    ],
-                    'confidence': confidence,
-                    'top3_total_confidence': top3_total_confidence
-                }
-        
-        # Get similar species - pass predictions to avoid re-computing
-        # This saves memory by not calling model.predict again
-        # Make a copy of predictions[0] before deleting predictions
-        predictions_copy = np.copy(predictions[0])
-        similar_species = []
-        try:
-            similar_species = get_similar_species_from_predictions(predictions_copy, top_k=5, exclude_idx=predicted_class_idx)
+    
+    # 方法5: 如果置信度高但前3個預測的總置信度異常低（說明模型不確定），也可能是錯誤識別
+    # 例如：置信度92%但前3個總和只有95%（正常應該接近100%）
+    # 如果前3個總置信度 < 98%，即使單個置信度高，也可能是錯誤識別
+    if confidence > 0.70 and top3_total_confidence < 0.98:
+        # 如果最高置信度很高，但前3個總和較低，說明模型可能錯誤地給某個類別很高的分數
+        # 這種情況下，即使置信度高，也可能是錯誤識別
+        confidence_ratio = confidence / top3_total_confidence if top3_total_confidence > 0 else 1.0
+        # 如果最高預測佔了前3個總和的90%以上，且總和 < 98%，可能是錯誤識別
+        if confidence_ratio > 0.90:
+            is_likely_not_target = True
+    
+    # 生成警告信息或通用識別結果
+    warning_message = None
+    if is_likely_not_target:
+        # 如果是卡通/插畫圖片，使用特殊的警告消息
+        if is_cartoon:
+            warning_message = {
+                'type': 'cartoon',
+                'title': '⚠️ Cartoon/Illustration Detected',
+                'message': 'This appears to be a cartoon, illustration, or non-photographic image. This system is designed to identify real butterflies and birds from photographs.',
+                'suggestions': [
+                    'Please upload a real photograph of a butterfly or bird',
+                    'Cartoon or illustrated images cannot be accurately identified',
+                    'Try using a clear photo taken with a camera'
+                ],
+                'confidence': confidence,
+                'top3_total_confidence': top3_total_confidence
+            }
+        elif general_prediction:
+            # 使用通用模型識別結果
+            warning_message = {
+                'type': 'general_identification',
+                'title': '🔍 General Image Recognition',
+                'message': f'This image appears to be: {general_prediction["class"]} (not a butterfly or bird).',
+                'suggestions': [
+                    'This system is designed for butterfly and bird identification',
+                    'The image has been identified using general image recognition',
+                    'For better results, please upload a clear photo of a butterfly or bird'
+                ],
+                'confidence': general_prediction['confidence'],
+                'top3_total_confidence': sum(p['confidence'] for p in general_prediction['top_predictions'][:3]),
+                'general_prediction': general_prediction
+            }
+        else:
+            # 低置信度警告
+            warning_message = {
+                'type': 'low_confidence',
+                'title': '⚠️ Low Identification Confidence',
+                'message': 'This image may not be a butterfly or bird, or the image quality is insufficient for accurate identification.',
+                'suggestions': [
+                    'Please ensure you upload a clear photo of a butterfly or bird',
+                    'Try taking photos from different angles to ensure the subject is clearly visible',
+                    'Ensure the photo has sufficient lighting, avoid blurry or too dark images',
+                    'If it is indeed a butterfly or bird, please try taking a clearer photo'
+                ],
+                'confidence': confidence,
+                'top3_total_confidence': top3_total_confidence
+            }
+    yield 'warning', {'warning': warning_message}
+    
+    # Get similar species - pass predictions to avoid re-computing
+    # This saves memory by not calling model.predict again
+    # Make a copy of predictions[0] before deleting predictions
+    predictions_copy = np.copy(predictions[0])
+    similar_species = []
+    try:
+        if quality_mode == QUALITY_MINIMAL:
+            deadline.skip('similar_species', 'quality_mode')
+            print("⏱️ Similar species skipped (minimal quality mode)")
+        elif not deadline.allows('similar_species'):
+            deadline.skip('similar_species', SKIPPED_DEADLINE)
+            print(f"⏱️ Similar species skipped ({deadline.remaining_ms():.0f} ms left)")
+        else:
+            with deadline.stage('similar_species'):
+                similar_species = get_similar_species_from_predictions(predictions_copy, top_k=5,
+                                                                       exclude_idx=predicted_class_idx,
+                                                                       names=class_names)
             print(f"✅ Similar species found: {len(similar_species)} items")
             if len(similar_species) > 0:
                 print(f"   First item: {similar_species[0]}")
@@ -1299,92 +1637,239 @@ def predict():
                 for idx in top_indices:
                     if idx != predicted_class_idx:
                         print(f"      {idx}: {class_names[idx] if idx < len(class_names) else f'Class_{idx}'} = {predictions_copy[idx]:.6f}")
+    except Exception as e:
+        print(f"❌ Error: Failed to get similar species: {e}")
+        import traceback
+        traceback.print_exc()
+        similar_species = []  # Return empty list on error
+    yield 'similar_species', {'similar_species': similar_species}
+    if include_catalog:
+        with deadline.stage('catalog', cost_key=False):
+            catalog_info = _species_catalog_entry(predicted_class)
+        yield 'catalog', {'species': predicted_class, 'info': catalog_info}
+
+    # Clear processed_image and predictions from memory immediately
+    del processed_image
+    del predictions
+    del predictions_copy
+    
+    # Clean up uploaded file immediately to save disk space and memory
+    upload_id = _discard_upload(filepath)
+    
+    # Skip image quality analysis to save memory (causes OOM)
+    # Image quality analysis loads the image again, doubling memory usage
+    # If needed, users can call /api/analyze-quality endpoint separately
+    quality_analysis = None
+    
+    # Aggressive memory cleanup for Koyeb (free tier has limited memory)
+    # Clear TensorFlow session cache
+    _clear_keras_session()
+    # Force garbage collection multiple times to ensure memory is freed
+    for _ in range(2):
+        gc.collect()
+    
+    # Debug: Log similar species before returning
+    print(f"Returning {len(similar_species)} similar species")
+    if len(similar_species) > 0:
+        print(f"First similar species: {similar_species[0]}")
+    
+    payload = {
+        'success': True,
+        'prediction': {
+            'class': predicted_class,
+            'confidence': confidence,
+            'top_predictions': top_predictions
+        },
+        'similar_species': similar_species,
+        'quality_analysis': quality_analysis,
+        'warning': warning_message,  # 添加警告信息
+        'model_version': served.version,
+        'cascade': cascade_info,
+        'quality_mode': quality_mode
+    }
+    # Degraded results are not cached, so a repeat upload gets the full pipeline once load drops
+    if quality_mode == QUALITY_FULL and not deadline.degraded:
+        get_prediction_cache().put(cache_key, payload)
+    
+    print(f"Prediction successful: {predicted_class} ({confidence:.2%}) in {deadline.elapsed_ms():.0f} ms")
+    yield 'done', dict(payload, upload_id=upload_id, timing=deadline.report())
+
+
+def _discard_upload(filepath):
+    """
+    Delete a predicted upload, or keep it for feedback-driven retraining (FEEDBACK_UPLOAD_RETENTION > 0).
+    
+    Returns:
+        The random upload id feedback can refer to if kept, else None
+    """
+    try:
+        if os.path.exists(filepath):
+            upload_id = retain_upload(filepath)
+            if upload_id is None:
+                os.remove(filepath)
+            return upload_id
+    except Exception as e:
+        print(f"Warning: Failed to delete uploaded file: {e}")
+    return None
+
+
+def _record_prediction(payload):
+    """Record an image prediction in the user's history."""
+    prediction = payload['prediction']
+    _record_identification(
+        request.form.get('user_id'), prediction['class'], prediction['confidence'],
+        get_species_category_map().category(prediction['class'], payload['warning']), 'image',
+        client_key=request.form.get('history_id')
+    )
+
+
+def _prediction_response(payload):
+    """JSON response for an image prediction (fresh or cached); records it in the user's history."""
+    response = jsonify(payload)
+    
+    # Add CORS headers explicitly for mobile devices
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+    response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+    
+    _record_prediction(payload)
+    return response
+
+
+def _wants_prediction_stream():
+    """Did the client opt in to the streamed /api/predict (stream=1, or Accept: text/event-stream)?"""
+    if request.args.get('stream') == '1' or request.form.get('stream') == '1':
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def _prediction_stream(events, filepath):
+    """
+    Server-sent events response for a streamed prediction.
+    
+    Each pipeline event is sent as soon as it is produced; 'done' carries the
+    same payload as the JSON response. The request context is kept for the
+    whole stream (history recording, load governor accounting).
+    """
+    def generate():
+        try:
+            for event_type, data in events:
+                if event_type == 'done':
+                    _record_prediction(data)
+                yield _sse_event(event_type, data)
         except Exception as e:
-            print(f"❌ Error: Failed to get similar species: {e}")
+            print(f"Error during streamed prediction: {e}")
             import traceback
             traceback.print_exc()
-            similar_species = []  # Return empty list on error
-        
-        # Clear processed_image and predictions from memory immediately
-        del processed_image
-        del predictions
-        del predictions_copy
-        
-        # Clean up uploaded file immediately to save disk space and memory
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except Exception as e:
-            print(f"Warning: Failed to delete uploaded file: {e}")
-        
-        # Skip image quality analysis to save memory (causes OOM)
-        # Image quality analysis loads the image again, doubling memory usage
-        # If needed, users can call /api/analyze-quality endpoint separately
-        quality_analysis = None
-        
-        # Aggressive memory cleanup for Koyeb (free tier has limited memory)
-        # Clear TensorFlow session cache
-        tf.keras.backend.clear_session()
-        # Force garbage collection multiple times to ensure memory is freed
-        for _ in range(2):
-            gc.collect()
-        
-        # Debug: Log similar species before returning
-        print(f"Returning {len(similar_species)} similar species")
-        if len(similar_species) > 0:
-            print(f"First similar species: {similar_species[0]}")
-        
-        response = jsonify({
-            'success': True,
-            'prediction': {
-                'class': predicted_class,
-                'confidence': confidence,
-                'top_predictions': top_predictions
-            },
-            'similar_species': similar_species,
-            'image_path': filename,
-            'quality_analysis': quality_analysis,
-            'warning': warning_message  # 添加警告信息
-        })
-        
-        # Add CORS headers explicitly for mobile devices
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        
-        print(f"Prediction successful: {predicted_class} ({confidence:.2%})")
-        return response
-    
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error during prediction: {e}")
-        print(f"Traceback: {error_trace}")
-        
-        response = jsonify({
-            'error': str(e),
-            'message': 'Failed to process prediction. Please try again.'
-        })
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response, 500
+            yield _sse_event('error', {
+                'error': str(e),
+                'message': 'Failed to process prediction. Please try again.'
+            })
+        finally:
+            # Also runs when the client disconnects mid-stream
+            events.close()
+            _discard_upload(filepath)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+# Monitoring endpoints are not counted as load
+GOVERNOR_UNTRACKED_PATHS = ('/api/health', '/api/metrics')
+
+
+@app.before_request
+def governor_request_started():
+    """Count in-flight API requests (and predictions) for the load governor."""
+    if (request.path.startswith('/api/') and request.method != 'OPTIONS'
+            and request.path not in GOVERNOR_UNTRACKED_PATHS):
+        g.governor_predict = request.path == '/api/predict'
+        get_load_governor().request_started(predict=g.governor_predict)
+
+
+@app.teardown_request
+def governor_request_finished(exc=None):
+    predict = g.pop('governor_predict', None)
+    if predict is not None:
+        get_load_governor().request_finished(predict=predict)
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Load governor state (quality mode, transitions, time per mode) in Prometheus text format."""
+    return Response(get_load_governor().metrics_text(), mimetype='text/plain; version=0.0.4')
+
+
+@app.after_request
+def add_model_version_header(response):
+    """X-Model-Version on every API response: the version that served the request, else the current image model."""
+    version = g.get('model_version')
+    if version is None:
+        registry = _get_image_registry()
+        version = registry.version if registry is not None else None
+    if version is not None:
+        response.headers['X-Model-Version'] = version
+    return response
 
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    """Health check with model status - Fast response for monitoring (Koyeb health check endpoint)"""
+    """
+    Health check with model status - Fast response for monitoring (Koyeb health check endpoint)
+    
+    Includes per-subsystem warm-up readiness. Load balancers that should only
+    route to warmed instances can call /api/health?require_ready=1, which
+    returns 503 until warm-up has finished.
+    """
     try:
         # Quick health check - don't do heavy operations here
         # This endpoint is critical for Koyeb to determine if service is healthy
+        warmup_manager = get_warmup_manager()
+        ready = warmup_manager.is_ready()
         health_status = {
             'status': 'healthy',
+            'ready': ready,
+            'warmup': warmup_manager.get_status(),
             'model_loaded': model is not None,
             'num_classes': len(class_names) if class_names else 0,
             'bird_sound_model_loaded': bird_sound_model is not None,
             'bird_sound_classes': len(bird_sound_class_names) if bird_sound_class_names else 0,
             'message': 'Service is running'
         }
+        if SEMANTIC_MATCHER_AVAILABLE:
+            health_status['semantic_cache'] = get_semantic_cache_stats()
+        health_status['description_sessions'] = get_session_store().stats()
+        try:
+            from enhanced_ai_assistant import get_assistant_session_stats
+            health_status['assistant_sessions'] = get_assistant_session_stats()
+        except Exception as e:
+            health_status['assistant_sessions'] = {'error': str(e)}
+        try:
+            from interpretation_cache import get_interpretation_cache
+            health_status['interpretation_cache'] = get_interpretation_cache().stats()
+        except Exception as e:
+            health_status['interpretation_cache'] = {'error': str(e)}
+        health_status['model_versions'] = {kind: registry.stats()
+                                           for kind, registry in all_model_registries().items()}
+        health_status['prediction_cache'] = get_prediction_cache().stats()
+        health_status['load_governor'] = get_load_governor().stats()
+        health_status['stage_costs'] = get_stage_costs().stats()
+        health_status['cascade'] = dict(get_model_cascade().stats(), enabled=CASCADE_ENABLED,
+                                        student_loaded=_served_model(_get_student_registry()) is not None)
+        health_status['shadow_evaluation'] = {kind: evaluator.stats()
+                                              for kind, evaluator in all_shadow_evaluators().items()}
+        health_status['feedback_log'] = get_feedback_log().stats()
+        health_status['feedback_uploads'] = get_feedback_upload_stats()
+        try:
+            health_status['identification_history'] = get_history_store().stats()
+        except Exception as e:
+            health_status['identification_history'] = {'error': str(e)}
+        if request.args.get('require_ready') == '1' and not ready:
+            return jsonify(health_status), 503
         # Always return 200, even if models aren't loaded (degraded state)
         return jsonify(health_status), 200
     except Exception as e:
@@ -1404,6 +1889,99 @@ def health():
         }), 200
 
 
+def _is_admin_request():
+    """True if the request carries MODEL_ADMIN_TOKEN as a bearer token (always False when it is unset)."""
+    if not MODEL_ADMIN_TOKEN:
+        return False
+    auth = request.headers.get('Authorization', '')
+    token = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+    return hmac.compare_digest(token.encode('utf-8'), MODEL_ADMIN_TOKEN.encode('utf-8'))
+
+
+@app.route('/api/admin/models', methods=['GET'])
+def get_model_versions():
+    """Served, loading and registered versions of each model kind"""
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({
+        kind: dict(registry.stats(), versions=[
+            {key: manifest[key] for key in ('version', 'created_at', 'sha256', 'input_shape', 'source')}
+            for manifest in registry.versions()
+        ])
+        for kind, registry in all_model_registries().items()
+    })
+
+
+@app.route('/api/admin/models/activate', methods=['POST'])
+def activate_model_version():
+    """
+    Load a registered model version in the background and hot-swap it in
+    
+    Body: {"kind": "image" | "bird_sound", "version": "<version>"}. Returns
+    202 once loading has started; poll GET /api/admin/models for the result.
+    """
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    registry = all_model_registries().get(data.get('kind', 'image'))
+    if registry is None:
+        return jsonify({'error': f"Unknown model kind: {data.get('kind')}"}), 404
+    try:
+        started = registry.activate(str(data.get('version', '')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    if not started:
+        return jsonify({'error': f'Version {registry.loading} is still loading'}), 409
+    return jsonify({'status': 'loading', 'kind': registry.kind, 'version': data.get('version'),
+                    'serving': registry.version}), 202
+
+
+@app.route('/api/admin/shadow', methods=['GET', 'POST'])
+def shadow_evaluation():
+    """
+    Shadow evaluation of candidate model versions
+    
+    GET: evaluator state per model kind and the candidates with stored results.
+    POST {"kind": "image" | "bird_sound", "version": "<version>", "sample_rate": 0.1}
+    starts shadowing a registered version (version null stops).
+    """
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        evaluator = get_shadow_evaluator(data.get('kind', 'image'))
+        if evaluator is None:
+            return jsonify({'error': f"Unknown model kind: {data.get('kind')}"}), 404
+        if not data.get('version'):
+            evaluator.stop()
+        else:
+            try:
+                evaluator.start(str(data['version']), data.get('sample_rate'))
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'evaluators': {kind: evaluator.stats() for kind, evaluator in all_shadow_evaluators().items()},
+        'results': [{'kind': kind, 'candidate_version': version, 'samples': count}
+                    for kind, version, count in get_shadow_store().candidates()]
+    })
+
+
+@app.route('/api/admin/shadow/report', methods=['GET'])
+def shadow_evaluation_report():
+    """Agreement, confidence delta and latency report for a candidate (?kind=image&version=..., default: current candidate)"""
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    kind = request.args.get('kind', 'image')
+    version = request.args.get('version')
+    if not version:
+        evaluator = get_shadow_evaluator(kind)
+        version = evaluator.candidate_version if evaluator is not None else None
+    report = get_shadow_store().report(kind, version) if version else None
+    if report is None:
+        return jsonify({'error': 'No shadow results for this candidate'}), 404
+    return jsonify(report)
+
+
 @app.route('/api/classes', methods=['GET'])
 def get_classes():
     """Get list of all class names"""
@@ -1439,31 +2017,16 @@ def submit_feedback():
         if 'timestamp' not in feedback_data:
             feedback_data['timestamp'] = datetime.now().isoformat()
         
-        # Save feedback to file (JSON format for easy analysis)
-        feedback_dir = 'feedback'
-        os.makedirs(feedback_dir, exist_ok=True)
-        
-        feedback_file = os.path.join(feedback_dir, 'feedback.json')
+        # Append to the feedback log (one JSON line per entry, written by a single writer thread)
+        get_feedback_log().append(feedback_data)
         
-        # Load existing feedback
-        existing_feedback = []
-        if os.path.exists(feedback_file):
+        # Keep the uploaded image, labeled with its true species, for head retraining
+        labels = feedback_labels(feedback_data)
+        if labels and labels[1] and feedback_data.get('upload_id'):
             try:
-                with open(feedback_file, 'r', encoding='utf-8') as f:
-                    existing_feedback = json.load(f)
+                label_upload(feedback_data['upload_id'], labels[1], get_species_category_map().class_names)
             except Exception as e:
-                print(f"Warning: Failed to load existing feedback: {e}")
-                existing_feedback = []
-        
-        # Add new feedback
-        existing_feedback.append(feedback_data)
-        
-        # Save updated feedback (keep last 1000 entries to prevent file from growing too large)
-        if len(existing_feedback) > 1000:
-            existing_feedback = existing_feedback[-1000:]
-        
-        with open(feedback_file, 'w', encoding='utf-8') as f:
-            json.dump(existing_feedback, f, indent=2, ensure_ascii=False)
+                print(f"Warning: Failed to label feedback upload: {e}")
         
         print(f"✅ Feedback received: {feedback_data['feedback_type']} for {feedback_data['predicted_species']}")
         if feedback_data.get('correct_species'):
@@ -1493,6 +2056,39 @@ def submit_feedback():
         return response, 500
 
 
+@app.route('/api/feedback/confused-pairs', methods=['GET'])
+def get_confused_pairs():
+    """Species pairs most often confused according to user feedback"""
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        analytics = get_feedback_analytics()
+        return jsonify({
+            'success': True,
+            'pairs': analytics.worst_confused_pairs(limit),
+            'summary': analytics.summary()
+        })
+    except Exception as e:
+        print(f"Error getting confused pairs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/feedback/analytics', methods=['GET'])
+def get_feedback_analytics_report():
+    """Per-species accuracy and confidence calibration from user feedback"""
+    try:
+        min_feedback = request.args.get('min_feedback', 1, type=int)
+        analytics = get_feedback_analytics()
+        return jsonify({
+            'success': True,
+            'summary': analytics.summary(),
+            'species_accuracy': analytics.species_accuracy(min_feedback),
+            'calibration': analytics.calibration()
+        })
+    except Exception as e:
+        print(f"Error getting feedback analytics: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/predict-sound', methods=['POST', 'OPTIONS'])
 def predict_sound():
     """Handle audio file upload and bird sound identification"""
@@ -1504,10 +2100,14 @@ def predict_sound():
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response
     
-    if bird_sound_model is None:
+    # Use one model version for the whole request, even if a new one is swapped in meanwhile
+    served = _served_model(_get_bird_sound_registry())
+    if served is None:
         return jsonify({
             'error': 'Bird sound model not loaded. Please ensure the model file exists.'
         }), 503
+    bird_sound_model, bird_sound_class_names = served.model, served.class_names
+    g.model_version = served.version
     
     if 'audio' not in request.files:
         return jsonify({'error': 'No audio file provided'}), 400
@@ -1564,7 +2164,9 @@ def predict_sound():
             }), 500
         
         # Make prediction
+        predict_start = time.perf_counter()
         predictions = bird_sound_model.predict(spectrogram, verbose=0)
+        predict_ms = (time.perf_counter() - predict_start) * 1000
         predicted_class_idx = np.argmax(predictions[0])
         confidence = float(predictions[0][predicted_class_idx])
         
@@ -1573,6 +2175,7 @@ def predict_sound():
             predicted_class = bird_sound_class_names[predicted_class_idx]
         else:
             predicted_class = f"Class_{predicted_class_idx}"
+        _submit_shadow('bird_sound', spectrogram, served, predicted_class, confidence, predict_ms)
         
         # Find Background class index for additional checking
         background_idx = None
@@ -1636,6 +2239,10 @@ def predict_sound():
         except:
             pass
         
+        _record_identification(request.form.get('user_id'), predicted_class, confidence,
+                               'birds' if is_bird_sound else 'others', 'sound',
+                               client_key=request.form.get('history_id'))
+        
         return jsonify({
             'status': 'success',
             'prediction': {
@@ -1644,7 +2251,8 @@ def predict_sound():
                 'top_predictions': top_predictions,
                 'is_bird_sound': is_bird_sound,
                 'message': message
-            }
+            },
+            'model_version': served.version
         })
     
     except Exception as e:
@@ -1692,139 +2300,76 @@ def analyze_quality():
         return jsonify({'error': str(e)}), 500
 
 
+def _history_records(history):
+    """Convert client (localStorage) history items to history store records"""
+    category_map = get_species_category_map()
+    records = []
+    for item in history:
+        prediction = item.get('prediction')
+        record = {
+            'species': None,
+            'confidence': None,
+            'category': 'others',
+            'source': 'import',
+            'timestamp': item.get('timestamp') or item.get('id'),
+            'client_key': item.get('id')
+        }
+        if prediction is not None:
+            record['confidence'] = prediction.get('confidence', 0)
+            record['species'] = prediction.get('class')
+            record['category'] = category_map.category(prediction.get('class', ''), item.get('warning'))
+        records.append(record)
+    return records
+
+
+def _record_identification(user_id, species, confidence, category, source, client_key=None):
+    """
+    Append a prediction to the user's server-side history (never fails the request)
+    
+    client_key is the id of the client's localStorage history item (form field
+    history_id), so importing that history later does not count it twice.
+    """
+    if not user_id:
+        return
+    try:
+        get_history_store().record(user_id, species, confidence, category, source=source, client_key=client_key)
+    except Exception as e:
+        print(f"⚠️ Failed to record identification history: {e}")
+
+
 @app.route('/api/statistics', methods=['POST'])
 def get_statistics():
-    """Calculate statistics from identification history"""
+    """
+    Calculate statistics from identification history
+    
+    With a user_id, statistics come from the server-side history store (any
+    history sent along is imported first). Without one, the posted history
+    is aggregated as before.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
+        user_id = data.get('user_id')
         history = data.get('history', [])
         
+        if user_id:
+            store = get_history_store()
+            if history:
+                store.record_many(user_id, _history_records(history[:MAX_IMPORT_ITEMS]))
+            statistics = store.get_statistics(user_id)
+            if statistics is None:
+                return jsonify({
+                    'error': 'No history data recorded'
+                }), 404
+            return jsonify({'success': True, 'statistics': statistics})
+        
         if not history:
             return jsonify({
                 'error': 'No history data provided'
             }), 400
         
-        # Calculate statistics
-        total_identifications = len(history)
-        
-        # Species frequency
-        species_count = {}
-        confidence_sum = {}
-        for item in history:
-            if 'prediction' in item and 'class' in item['prediction']:
-                species = item['prediction']['class']
-                confidence = item['prediction'].get('confidence', 0)
-                
-                species_count[species] = species_count.get(species, 0) + 1
-                confidence_sum[species] = confidence_sum.get(species, 0) + confidence
-        
-        # Top species
-        top_species = sorted(species_count.items(), key=lambda x: x[1], reverse=True)[:10]
-        top_species_list = [{'species': s, 'count': c, 'avg_confidence': (confidence_sum[s] / c * 100) if c > 0 else 0} 
-                           for s, c in top_species]
-        
-        # Average confidence
-        all_confidences = [item['prediction'].get('confidence', 0) * 100 
-                          for item in history if 'prediction' in item]
-        avg_confidence = sum(all_confidences) / len(all_confidences) if all_confidences else 0
-        
-        # Confidence distribution
-        high_confidence = sum(1 for c in all_confidences if c >= 90)
-        medium_confidence = sum(1 for c in all_confidences if 70 <= c < 90)
-        low_confidence = sum(1 for c in all_confidences if c < 70)
-        
-        # Time-based statistics (if timestamps available)
-        time_stats = {}
-        for item in history:
-            if 'timestamp' in item:
-                # Extract date from timestamp
-                try:
-                    date_str = item['timestamp'].split(',')[0]  # Get date part
-                    time_stats[date_str] = time_stats.get(date_str, 0) + 1
-                except:
-                    pass
-        
-        # Bird vs Butterfly classification
-        bird_count = 0
-        butterfly_count = 0
-        
-        # Get class names to determine category by index
-        # Use the same logic as load_model() to find base directory
-        current_file = os.path.abspath(__file__)
-        current_dir = os.path.dirname(current_file)
-        working_dir = os.getcwd()
-        
-        # Try to find base directory (same logic as load_model)
-        if 'backend' in working_dir:
-            base_dir = os.path.dirname(os.path.dirname(working_dir))
-        else:
-            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_file)))
-        
-        class_names_path = os.path.join(base_dir, 'models', 'trained', 'class_names.json')
-        class_names_list = []
-        if os.path.exists(class_names_path):
-            try:
-                with open(class_names_path, 'r', encoding='utf-8') as f:
-                    class_names_list = json.load(f)
-            except:
-                pass
-        
-        for item in history:
-            # 如果檢測到非蝴蝶/鳥類圖片（有 warning），直接歸類為 others
-            if 'warning' in item and item['warning'] is not None:
-                # 跳過，讓它歸類到 others（通過計算 total - bird_count - butterfly_count）
-                continue
-            
-            if 'prediction' in item:
-                species = item['prediction'].get('class', '')
-                species_lower = species.lower()
-                
-                # Method 1: Check if species name starts with number (001-200 are birds)
-                if species and species[0].isdigit():
-                    bird_count += 1
-                    continue
-                
-                # Method 2: Check index in class_names list (first 200 are birds, rest are butterflies/moths)
-                if class_names_list:
-                    try:
-                        species_index = class_names_list.index(species)
-                        if species_index < 200:  # First 200 are birds
-                            bird_count += 1
-                            continue
-                        else:  # Rest are butterflies/moths
-                            butterfly_count += 1
-                            continue
-                    except ValueError:
-                        pass  # Species not found in list, try keyword matching
-                
-                # Method 3: Fallback to keyword matching
-                bird_keywords = ['bird', 'albatross', 'auklet', 'blackbird', 'bunting', 'crow', 'finch', 'gull', 'hummingbird', 'jay', 'kingfisher', 'lark', 'loon', 'merganser', 'nuthatch', 'oriole', 'pelican', 'raven', 'shrike', 'sparrow', 'starling', 'swallow', 'tanager', 'tern', 'thrasher', 'vireo', 'warbler', 'waterthrush', 'waxwing', 'woodpecker', 'wren', 'yellowthroat']
-                butterfly_keywords = ['butterfly', 'moth', 'swallowtail', 'pansy', 'tiger', 'morpho', 'monarch', 'admiral', 'hairstreak', 'skipper', 'sulphur', 'copper', 'elfin', 'pierrot', 'comma', 'white', 'blue', 'orange', 'red', 'yellow', 'peacock', 'lady', 'cabbage', 'painted', 'wood-nymph', 'argus', 'eggfly', 'brown', 'green', 'purple', 'malachite', 'metalmark', 'tortoiseshell', 'mourning', 'cloak', 'question', 'mark', 'cracker', 'postman', 'leafwing', 'popinjay', 'ulyses', 'viceroy', 'satyr', 'zebra', 'long', 'wing', 'banded', 'heliconian', 'birdwing', 'atlas', 'luna', 'polyphemus', 'io', 'hercules', 'emperor', 'gum', 'cinnabar', 'garden', 'tiger', 'clearwing', 'arcigera', 'flower', 'sixspot', 'burnet', 'white', 'lined', 'sphinx', 'oleander', 'hawk', 'humming', 'bird', 'hawk', 'moth', 'madagascan', 'sunset', 'comet', 'rosy', 'maple', 'giant', 'leopard', 'banded', 'tiger', 'bird', 'cherry', 'ermine', 'adonis', 'apollo', 'atala', 'beckers', 'chalk', 'hill', 'checquered', 'chestnut', 'cleopatra', 'clodius', 'parnassian', 'clouded', 'common', 'copper', 'tail', 'crescent', 'crimson', 'patch', 'danaid', 'eastern', 'dapple', 'eastern', 'pine', 'elbowed', 'glittering', 'sapphire', 'gold', 'great', 'green', 'celled', 'cattleheart', 'grey', 'indra', 'julia', 'large', 'marble', 'mestra', 'milberts', 'orange', 'oakleaf', 'paper', 'kite', 'pine', 'pipevine', 'purple', 'hairstreak', 'purplish', 'scarce', 'silver', 'spot', 'sleepy', 'sootywing', 'southern', 'dogface', 'straited', 'queen', 'tropical', 'two', 'barred', 'flasher', 'wood', 'yellow']
-                
-                if any(keyword in species_lower for keyword in bird_keywords):
-                    bird_count += 1
-                elif any(keyword in species_lower for keyword in butterfly_keywords):
-                    butterfly_count += 1
-        
         return jsonify({
             'success': True,
-            'statistics': {
-                'total_identifications': total_identifications,
-                'unique_species': len(species_count),
-                'average_confidence': round(avg_confidence, 2),
-                'top_species': top_species_list,
-                'confidence_distribution': {
-                    'high': high_confidence,
-                    'medium': medium_confidence,
-                    'low': low_confidence
-                },
-                'category_distribution': {
-                    'birds': bird_count,
-                    'butterflies': butterfly_count,
-                    'others': total_identifications - bird_count - butterfly_count
-                },
-                'time_distribution': dict(sorted(time_stats.items(), reverse=True)[:7])  # Last 7 days
-            }
+            'statistics': compute_statistics(history, get_species_category_map())
         })
     
     except Exception as e:
@@ -1832,6 +2377,29 @@ def get_statistics():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/history/import', methods=['POST'])
+def import_history():
+    """Bulk-import a client's localStorage identification history (idempotent per item id)"""
+    try:
+        data = request.get_json() or {}
+        user_id = data.get('user_id')
+        history = data.get('history', [])
+        if not user_id:
+            return jsonify({'error': 'user_id is required'}), 400
+        if len(history) > MAX_IMPORT_ITEMS:
+            return jsonify({'error': f'At most {MAX_IMPORT_ITEMS} items can be imported at once'}), 400
+        
+        imported = get_history_store().record_many(user_id, _history_records(history))
+        return jsonify({
+            'success': True,
+            'imported': imported,
+            'skipped': len(history) - imported
+        })
+    except Exception as e:
+        print(f"Error importing history: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/birds', methods=['GET'])
 def get_birds():
     """Get all bird species information"""
@@ -2032,6 +2600,57 @@ def chat():
         return jsonify({'error': str(e)}), 500
 
 
+def _sse_event(event_type, payload):
+    """Format one server-sent event"""
+    return f"event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /api/chat (server-sent events).
+    
+    Takes the same JSON body as /api/chat. Events:
+    - response: the knowledge-base/feature reply, sent as soon as it is built
+    - token: pieces of the model-generated interpretation as they are produced
+    - done: the complete reply
+    - error: the assistant failed
+    
+    When the client disconnects the stream is closed, which stops the
+    interpretation generator loop.
+    """
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '').strip()
+    context = data.get('context', {})
+    user_id = data.get('user_id', 'default')
+    
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    def generate():
+        stream = None
+        try:
+            from enhanced_ai_assistant import get_enhanced_assistant
+            stream = get_enhanced_assistant().generate_response_stream(message, context, user_id)
+            for event in stream:
+                event_type = event.pop('type')
+                yield _sse_event(event_type, event)
+        except Exception as e:
+            print(f"⚠️ Chat stream error: {e}")
+            import traceback
+            traceback.print_exc()
+            yield _sse_event('error', {'error': str(e)})
+        finally:
+            # Runs on client disconnect too (the server closes this generator)
+            if stream is not None:
+                stream.close()
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+    })
+
+
 def generate_chat_response(message, context):
     """Generate response based on user message - Supports Chinese input but always responds in English"""
     import random
@@ -2259,6 +2878,21 @@ def load_species_database():
     return species_db
 
 
+# Species catalog (bird / butterfly info templates) by class name, loaded on first use
+_species_catalog = None
+_species_catalog_lock = threading.Lock()
+
+
+def _species_catalog_entry(class_name):
+    """Catalog entry (description, habitat, size, ...) of a predicted class, or None"""
+    global _species_catalog
+    with _species_catalog_lock:
+        if _species_catalog is None:
+            species_db = load_species_database()
+            _species_catalog = {**species_db['butterflies'], **species_db['birds']}
+        return _species_catalog.get(class_name)
+
+
 def check_length_match(user_description, species_size):
     """
     Check if user-specified length matches species size.
@@ -2965,11 +3599,13 @@ def calculate_match_score(description, species_info):
     return score, matched_fields
 
 
-def identify_by_description(description, category=None, conversation_history=None, current_matches=None):
+def identify_by_description(description, category=None, conversation_history=None, current_matches=None,
+                            query_embedding=None, query_colors=None):
     """
     Identify species based on text description.
     Uses semantic matching (if available) or falls back to keyword matching.
     If current_matches is provided, only re-score those matches (progressive narrowing).
+    If query_embedding is provided, semantic matching uses it instead of encoding the description.
     Returns matches and follow-up questions if needed.
     """
     
@@ -3126,7 +3762,10 @@ def identify_by_description(description, category=None, conversation_history=Non
     # Try semantic matching first (more accurate)
     if SEMANTIC_MATCHER_AVAILABLE:
         try:
-            semantic_result = identify_species_semantic(description, category, conversation_history)
+            semantic_result = identify_species_semantic(
+                description, category, conversation_history,
+                query_embedding=query_embedding, query_colors=query_colors
+            )
             if semantic_result is not None:
                 # Convert semantic results to standard format
                 species_db = load_species_database()
@@ -3448,17 +4087,58 @@ def identify_species_by_description():
         }), 500
 
 
+def _description_chat_turn(session, message, category=None):
+    """
+    Process one description-chat message against a session.
+    
+    Only the new message is parsed (and, when a full search is needed, encoded);
+    surviving candidates from the previous turn are re-scored instead of
+    searching the whole catalog again.
+    """
+    semantic_ready = SEMANTIC_MATCHER_AVAILABLE and init_semantic_matcher()
+    colors = extract_colors_from_query(message) if SEMANTIC_MATCHER_AVAILABLE else None
+    session.add_turn(message, colors)
+    
+    # Explicit category > category mentioned in conversation > category of surviving candidates
+    effective_category = category or session.detected_category() or session.inferred_category()
+    
+    if session.candidates:
+        # Progressive narrowing over the surviving candidates only
+        result = identify_by_description(
+            session.full_description,
+            effective_category,
+            current_matches=session.candidates
+        )
+    else:
+        query_embedding = session.query_embedding(encode_query) if semantic_ready else None
+        result = identify_by_description(
+            session.full_description,
+            effective_category,
+            query_embedding=query_embedding,
+            query_colors=session.colors if query_embedding is not None else None
+        )
+    
+    session.set_candidates(result['matches'])
+    return result
+
+
 @app.route('/api/description-chat', methods=['POST'])
 def description_chat():
     """
     Interactive chat for species identification by description.
     Maintains conversation context and progressively narrows down matches.
+    
+    Conversation state lives in a server-side session: clients send the
+    returned session_id with each new message instead of resending the full
+    conversation_history and current_matches. Legacy payloads (and retries
+    after a 410 session_expired response) seed a new session.
     """
     try:
         data = request.get_json()
         message = data.get('message', '').strip()
+        session_id = data.get('session_id')
         conversation_history = data.get('conversation_history', [])
-        current_matches = data.get('current_matches', [])  # Previous matches to narrow down
+        current_matches = data.get('current_matches', [])  # Legacy clients only
         category = data.get('category', None)
         
         if not message:
@@ -3467,53 +4147,25 @@ def description_chat():
                 'success': False
             }), 400
         
-        # Build full description from conversation history
-        full_description = ' '.join([
-            msg.get('content', '') 
-            for msg in conversation_history 
-            if msg.get('role') == 'user'
-        ])
-        full_description += ' ' + message
-        
-        # Detect category from conversation if not explicitly set
-        detected_category = category
-        if not detected_category:
-            # Check if user mentioned bird or butterfly in any message
-            full_text_lower = full_description.lower()
-            if 'bird' in full_text_lower and 'butterfly' not in full_text_lower:
-                detected_category = 'bird'
-            elif 'butterfly' in full_text_lower and 'bird' not in full_text_lower:
-                detected_category = 'butterfly'
-            elif 'moth' in full_text_lower:
-                detected_category = 'butterfly'
-        
-        # If we have previous matches, extract the category from them
-        inferred_category = None
-        if current_matches and len(current_matches) > 0:
-            # Get categories from previous matches
-            prev_categories = set()
-            for m in current_matches:
-                cat = m.get('category', '')
-                if 'Bird' in cat:
-                    prev_categories.add('bird')
-                elif 'Butterfly' in cat or 'Moth' in cat:
-                    prev_categories.add('butterfly')
-            
-            # If all previous matches were one category, stick with it
-            if len(prev_categories) == 1:
-                inferred_category = list(prev_categories)[0]
-        
-        # Use inferred category if no explicit category and we have previous context
-        effective_category = detected_category or inferred_category
-        
-        # Perform identification with accumulated description
-        # If we have previous matches, pass them to enable progressive narrowing
-        result = identify_by_description(
-            full_description, 
-            effective_category, 
-            conversation_history,
-            current_matches=current_matches if current_matches and len(current_matches) > 0 else None
-        )
+        session_store = get_session_store()
+        session = session_store.get(session_id)
+        if session is None:
+            if session_id and not conversation_history:
+                # Session expired and the client sent no history to rebuild it from
+                return jsonify({
+                    'error': 'Session expired, please resend the conversation history',
+                    'session_expired': True,
+                    'success': False
+                }), 410
+            session = session_store.create()
+            session.seed(
+                conversation_history,
+                current_matches,
+                extract_colors_from_query if SEMANTIC_MATCHER_AVAILABLE else None
+            )
+        
+        with session.lock:
+            result = _description_chat_turn(session, message, category)
         
         # Generate appropriate response
         if result['matches']:
@@ -3581,6 +4233,7 @@ Is this the species you were looking for? If not, please tell me what's differen
         
         return jsonify({
             'success': True,
+            'session_id': session.session_id,
             'response': response_text,
             'matches': result['matches'],
             'needs_more_info': needs_more_info,
@@ -3597,6 +4250,142 @@ Is this the species you were looking for? If not, please tell me what's differen
         }), 500
 
 
+def _dummy_model_input(keras_model, default_shape):
+    """Zero batch matching a Keras model's input shape (falls back to default_shape)."""
+    try:
+        shape = tuple(dim or 1 for dim in keras_model.input_shape[1:])
+    except Exception:
+        shape = default_shape
+    return np.zeros((1,) + shape, dtype=np.float32)
+
+
+def _warm_up_image_handle(handle):
+    """Trace a version's classifier and feature extractor graphs with a dummy image."""
+    handle.model.predict(_dummy_model_input(handle.model, (224, 224, 3)), verbose=0, batch_size=1)
+    extractor = handle.extras.get('feature_extractor')
+    if extractor is not None and extractor is not handle.model:
+        extractor.predict(_dummy_model_input(extractor, (224, 224, 3)), verbose=0)
+
+
+def warm_up_image_model():
+    """Trace the served classifier and feature extractor graphs with a dummy image."""
+    served = _served_model(_get_image_registry())
+    if served is None:
+        return False
+    _warm_up_image_handle(served)
+    return True
+
+
+def warm_up_student_model():
+    """Trace the cascade student's graph with a dummy image."""
+    served = _served_model(_get_student_registry())
+    if served is None:
+        return False
+    _warm_up_student_handle(served)
+    return True
+
+
+def warm_up_general_model():
+    """Trace the ImageNet verification model with a dummy image."""
+    if general_model is None:
+        return False
+    general_model.predict(_dummy_model_input(general_model, (224, 224, 3)), verbose=0)
+    return True
+
+
+def _warm_up_bird_sound_handle(handle):
+    """Run a short silent clip through the audio pipeline and a bird sound model version."""
+    import wave
+    warmup_audio = os.path.join(app.config['UPLOAD_FOLDER'], '_warmup.wav')
+    try:
+        # 1 second of silence: loads librosa and JIT-compiles its feature code
+        with wave.open(warmup_audio, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(22050)
+            wav.writeframes(b'\x00\x00' * 22050)
+        spectrogram = audio_to_spectrogram(warmup_audio)
+    finally:
+        if os.path.exists(warmup_audio):
+            os.remove(warmup_audio)
+    if spectrogram is None:
+        spectrogram = _dummy_model_input(handle.model, (128, 128, 1))
+    handle.model.predict(spectrogram, verbose=0)
+
+
+def warm_up_bird_sound_model():
+    """Warm up the served bird sound model and the audio pipeline."""
+    served = _served_model(_get_bird_sound_registry())
+    if served is None:
+        return False
+    _warm_up_bird_sound_handle(served)
+    return True
+
+
+def warm_up_semantic_matcher():
+    """Load the description embeddings and sentence encoder, then encode a sample query."""
+    if not SEMANTIC_MATCHER_AVAILABLE or not init_semantic_matcher():
+        return False
+    encode_query("small blue butterfly with orange spots")
+    return True
+
+
+def warm_up_chat_assistant():
+    """Build the EnhancedAIAssistant and run a sample message through its models."""
+    from enhanced_ai_assistant import get_enhanced_assistant
+    get_enhanced_assistant().warm_up()
+    return True
+
+
+def warm_up_statistics():
+    """Build the species category map, open the history store and replay the feedback log."""
+    get_species_category_map()
+    get_history_store()
+    get_feedback_analytics()
+    return True
+
+
+def start_warmup():
+    """Register warm-up tasks and run them in a background thread."""
+    if os.environ.get('WARMUP_ENABLED', '1') == '0':
+        print("ℹ️ Warm-up disabled (WARMUP_ENABLED=0)")
+        get_load_governor().set_rss_baseline()
+        return
+    manager = get_warmup_manager()
+    manager.register('image_model', warm_up_image_model)
+    manager.register('student_model', warm_up_student_model)
+    manager.register('general_model', warm_up_general_model)
+    manager.register('bird_sound_model', warm_up_bird_sound_model)
+    manager.register('semantic_matcher', warm_up_semantic_matcher)
+    manager.register('chat_assistant', warm_up_chat_assistant)
+    manager.register('statistics', warm_up_statistics)
+    # Last: the load governor measures memory growth from the fully warmed process
+    manager.register('load_governor_baseline', lambda: get_load_governor().set_rss_baseline())
+    # Small delay so app.run() has bound the port before the CPU-heavy work starts
+    manager.start(delay_seconds=float(os.environ.get('WARMUP_DELAY_SECONDS', 1.0)))
+
+
+def start_shadow_evaluation():
+    """Create a shadow evaluator per model kind; SHADOW_<KIND>_VERSION starts shadowing a candidate at startup."""
+    for kind, registry in all_model_registries().items():
+        if kind == 'image_student':
+            continue  # the cascade audits the student against the full model instead
+        evaluator = get_shadow_evaluator(kind, registry)
+        version = os.environ.get(f'SHADOW_{kind.upper()}_VERSION')
+        if version:
+            try:
+                evaluator.start(version)
+            except ValueError as e:
+                print(f"⚠️ Shadow evaluation not started: {e}")
+
+
+def start_model_watchers():
+    """Poll each registry's ACTIVE file so rewriting it hot-swaps the model (MODEL_WATCH_INTERVAL=0 disables)."""
+    for registry in all_model_registries().values():
+        if registry.watch() is not None:
+            print(f"👀 Watching {os.path.join(registry.versions_dir, 'ACTIVE')} for {registry.kind} model versions")
+
+
 if __name__ == '__main__':
     print("=" * 50)
     print("Starting Butterfly & Bird Identification API")
@@ -3605,6 +4394,8 @@ if __name__ == '__main__':
     try:
         print("Loading image identification model...")
         load_model()
+        print("Loading cascade student model...")
+        load_student_model()
         print("Loading bird sound model...")
         load_bird_sound_model()
         print("Loading general image recognition model...")
@@ -3621,6 +4412,11 @@ if __name__ == '__main__':
         print(f"API will be available at: http://0.0.0.0:{port}")
         print("=" * 50)
         
+        # Warm up lazy subsystems in the background once the port is open
+        start_warmup()
+        start_model_watchers()
+        start_shadow_evaluation()
+        
         app.run(debug=debug, host='0.0.0.0', port=port, threaded=True)
     except Exception as e:
         print(f"❌ Fatal error starting server: {e}")
@@ -0,0 +1,197 @@
+"""
+Confidence-gated student -> full model cascade for /api/predict.
+
+A compact student classifier (distilled from model.h5 by
+models/training/train_model.py --distill, same class list, possibly a lower
+input resolution) sees every upload first. When the margin between its
+top two probabilities is at least CASCADE_MARGIN its answer is used;
+otherwise the request escalates to the full model (and the verification
+stages that follow it).
+
+ModelCascade keeps the numbers needed to judge the trade-off:
+
+- escalation rate and mean latency per path, against the mean latency of
+  the full model alone (measured on escalations and audits)
+- agreement with the full model: a sampled fraction (CASCADE_AUDIT_RATE)
+  of student-answered requests is re-run through the full model on a
+  background worker with a CPU budget, like shadow evaluation
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+CASCADE_ENABLED = os.environ.get('CASCADE_ENABLED', '1') != '0'
+CASCADE_MARGIN = float(os.environ.get('CASCADE_MARGIN', 0.6))  # top-1 minus top-2 probability
+CASCADE_AUDIT_RATE = float(os.environ.get('CASCADE_AUDIT_RATE', 0.05))
+CASCADE_AUDIT_MAX_PENDING = 8
+CASCADE_AUDIT_CPU_BUDGET = float(os.environ.get('CASCADE_AUDIT_CPU_BUDGET', 0.25))
+STUDENT = 'student'
+FULL = 'full'
+
+
+def top2_margin(probabilities):
+    """Top-1 minus top-2 probability."""
+    if len(probabilities) < 2:
+        return float(probabilities[0]) if len(probabilities) else 0.0
+    top2 = np.partition(probabilities, -2)[-2:]
+    return float(top2[1] - top2[0])
+
+
+def image_input_size(handle, default=(224, 224)):
+    """(height, width) a model version expects, or default for flexible inputs."""
+    shape = handle.input_shape or []
+    if len(shape) >= 2 and shape[0] and shape[1]:
+        return int(shape[0]), int(shape[1])
+    return default
+
+
+class _RunningMean:
+    __slots__ = ('count', 'total')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class ModelCascade:
+    """Gating decision, per-path latency stats and background audits against the full model."""
+
+    def __init__(self, margin=CASCADE_MARGIN, audit_rate=CASCADE_AUDIT_RATE,
+                 audit_cpu_budget=CASCADE_AUDIT_CPU_BUDGET):
+        self.margin = margin
+        self.audit_rate = audit_rate
+        self.audit_cpu_budget = min(max(audit_cpu_budget, 0.01), 1.0)
+        self._lock = threading.Lock()
+        self._audits = queue.Queue(maxsize=CASCADE_AUDIT_MAX_PENDING)
+        self._worker = None
+        self.requests = {STUDENT: 0, FULL: 0}
+        self.latency = {STUDENT: _RunningMean(), FULL: _RunningMean()}
+        self.full_model_latency = _RunningMean()  # full model alone: preprocessing + inference
+        self.audited = 0
+        self.audit_agreed = 0
+        self.audit_failures = 0
+        self.audit_dropped = 0
+
+    def accepts(self, probabilities):
+        """(answer with the student?, margin)"""
+        margin = top2_margin(probabilities)
+        return margin >= self.margin, margin
+
+    def record(self, stage, latency_ms, full_model_ms=None):
+        """
+        Count a request answered at stage (STUDENT or FULL, i.e. escalated).
+
+        latency_ms covers every cascade stage the request went through;
+        full_model_ms is the full model's share when it ran.
+        """
+        with self._lock:
+            self.requests[stage] += 1
+            self.latency[stage].add(latency_ms)
+            if full_model_ms is not None:
+                self.full_model_latency.add(full_model_ms)
+
+    def should_audit(self):
+        return not self._audits.full() and random.random() < self.audit_rate
+
+    def submit_audit(self, image_source, student_class, full_handle, preprocess):
+        """
+        Queue a student-answered request for a full model re-run; never blocks.
+
+        image_source is what preprocess(image_source, target_size) accepts
+        (e.g. the upload's bytes in a BytesIO, since the file itself is moved
+        once the request finishes).
+        """
+        try:
+            self._audits.put_nowait((image_source, student_class, full_handle, preprocess))
+        except queue.Full:
+            self.audit_dropped += 1
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_audits, name='cascade-audit', daemon=True)
+                self._worker.start()
+
+    def _run_audits(self):
+        while True:
+            image_source, student_class, full_handle, preprocess = self._audits.get()
+            start = time.perf_counter()
+            try:
+                image = preprocess(image_source, target_size=image_input_size(full_handle))
+                if image is None:
+                    raise ValueError('preprocessing failed')
+                probabilities = full_handle.model.predict(image, verbose=0, batch_size=1)[0]
+                full_ms = (time.perf_counter() - start) * 1000
+                idx = int(np.argmax(probabilities))
+                full_class = full_handle.class_names[idx] if idx < len(full_handle.class_names) else None
+                with self._lock:
+                    self.audited += 1
+                    self.audit_agreed += int(full_class == student_class)
+                    self.full_model_latency.add(full_ms)
+            except Exception as e:
+                self.audit_failures += 1
+                print(f"⚠️ Cascade audit failed: {e}")
+            busy = time.perf_counter() - start
+            time.sleep(busy * (1.0 / self.audit_cpu_budget - 1.0))
+
+    def stats(self):
+        with self._lock:
+            total = self.requests[STUDENT] + self.requests[FULL]
+            escalation_rate = self.requests[FULL] / total if total else None
+            cascade_latency = ((self.latency[STUDENT].total + self.latency[FULL].total) / total
+                               if total else None)
+            full_only = self.full_model_latency.mean
+            audit_agreement = self.audit_agreed / self.audited if self.audited else None
+            return {
+                'margin': self.margin,
+                'requests': total,
+                'answered_by_student': self.requests[STUDENT],
+                'escalated': self.requests[FULL],
+                'escalation_rate': escalation_rate,
+                'mean_latency_ms': {
+                    'cascade': cascade_latency,
+                    'student_path': self.latency[STUDENT].mean,
+                    'escalated_path': self.latency[FULL].mean,
+                    'full_model_only': full_only
+                },
+                'speedup_vs_full_model': (full_only / cascade_latency
+                                          if full_only and cascade_latency else None),
+                'audit': {
+                    'rate': self.audit_rate,
+                    'audited': self.audited,
+                    'student_agreement': audit_agreement,
+                    'failures': self.audit_failures,
+                    'dropped': self.audit_dropped
+                },
+                # Escalated requests get the full model's answer by construction
+                'estimated_agreement_with_full_model': (
+                    escalation_rate + (1 - escalation_rate) * audit_agreement
+                    if escalation_rate is not None and audit_agreement is not None else None
+                )
+            }
+
+
+# Global instance
+_model_cascade = None
+_model_cascade_lock = threading.Lock()
+
+
+def get_model_cascade():
+    """Get or create the model cascade."""
+    global _model_cascade
+    with _model_cascade_lock:
+        if _model_cascade is None:
+            _model_cascade = ModelCascade()
+        return _model_cascade
@@ -0,0 +1,211 @@
+"""
+Server-side conversation state for description-based identification.
+
+Each session keeps the per-turn texts and embeddings, the constraints parsed
+from them (category mentions, colors) and the surviving candidate set, so
+/api/description-chat only has to process the newest message instead of
+rebuilding everything from the history the client resends.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+SESSION_TTL_SECONDS = int(os.environ.get('DESCRIPTION_SESSION_TTL', 1800))  # 30 minutes
+MAX_SESSIONS = int(os.environ.get('DESCRIPTION_SESSION_MAX', 2000))
+MAX_TURNS = 20  # Oldest turns are dropped beyond this
+
+
+class DescriptionSession:
+    """Incremental state for one description-chat conversation."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.lock = threading.Lock()  # Serializes turns within one session
+        self.turns = []  # [{'text': str, 'embedding': np.ndarray or None}]
+        self.full_description = ''
+        self.mentions = {'bird': False, 'butterfly': False, 'moth': False}
+        self.colors = []
+        self.candidates = []  # [{'key': str, 'category': str}]
+        self._embedding_sum = None
+
+    def add_turn(self, text, colors=None):
+        """Record a new user message and update the parsed constraints."""
+        text = (text or '').strip()
+        self.turns.append({'text': text, 'embedding': None})
+
+        if len(self.turns) > MAX_TURNS:
+            dropped = self.turns.pop(0)
+            if dropped['embedding'] is not None and self._embedding_sum is not None:
+                self._embedding_sum = self._embedding_sum - dropped['embedding']
+            self.full_description = ' '.join(turn['text'] for turn in self.turns)
+            self._recompute_mentions()
+        else:
+            self.full_description = f"{self.full_description} {text}".strip()
+            self._update_mentions(text)
+
+        for color in colors or []:
+            if color not in self.colors:
+                self.colors.append(color)
+
+    def _update_mentions(self, text):
+        text_lower = text.lower()
+        for word in self.mentions:
+            if word in text_lower:
+                self.mentions[word] = True
+
+    def _recompute_mentions(self):
+        self.mentions = {word: False for word in self.mentions}
+        for turn in self.turns:
+            self._update_mentions(turn['text'])
+
+    def detected_category(self):
+        """Category the user mentioned across the conversation, if unambiguous."""
+        if self.mentions['bird'] and not self.mentions['butterfly']:
+            return 'bird'
+        if self.mentions['butterfly'] and not self.mentions['bird']:
+            return 'butterfly'
+        if self.mentions['moth']:
+            return 'butterfly'
+        return None
+
+    def inferred_category(self):
+        """Category shared by all surviving candidates, if any."""
+        categories = set()
+        for candidate in self.candidates:
+            category = candidate.get('category', '')
+            if 'Bird' in category:
+                categories.add('bird')
+            elif 'Butterfly' in category or 'Moth' in category:
+                categories.add('butterfly')
+        if len(categories) == 1:
+            return next(iter(categories))
+        return None
+
+    def query_embedding(self, encode_fn):
+        """
+        Return the normalized conversation vector (mean of turn embeddings).
+
+        Only turns that have not been encoded yet are passed to encode_fn.
+        """
+        for turn in self.turns:
+            if turn['embedding'] is None and turn['text']:
+                embedding = encode_fn(turn['text'])
+                if embedding is None:
+                    return None
+                turn['embedding'] = np.asarray(embedding, dtype=np.float32)
+                if self._embedding_sum is None:
+                    self._embedding_sum = turn['embedding'].copy()
+                else:
+                    self._embedding_sum = self._embedding_sum + turn['embedding']
+
+        if self._embedding_sum is None:
+            return None
+        norm = np.linalg.norm(self._embedding_sum)
+        return self._embedding_sum / norm if norm > 0 else self._embedding_sum
+
+    def set_candidates(self, matches):
+        """Keep only the keys and categories of the current matches."""
+        self.candidates = [
+            {
+                'key': match.get('key') or match.get('species_id') or match.get('common_name', ''),
+                'category': match.get('category', '')
+            }
+            for match in matches or []
+        ]
+
+    def candidate_keys(self):
+        return {candidate['key'] for candidate in self.candidates if candidate['key']}
+
+    def seed(self, conversation_history, current_matches, colors_fn=None):
+        """Rebuild state from a client-supplied history (legacy clients or expired sessions)."""
+        for msg in conversation_history or []:
+            if msg.get('role') == 'user' and msg.get('content'):
+                text = msg['content']
+                self.add_turn(text, colors_fn(text) if colors_fn else None)
+        self.set_candidates(current_matches)
+
+
+class DescriptionSessionStore:
+    """Bounded in-memory session store with TTL expiry and LRU eviction."""
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def create(self):
+        """Create and register a new session."""
+        session = DescriptionSession(uuid.uuid4().hex)
+        with self._lock:
+            self._purge_expired()
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            self.created += 1
+        return session
+
+    def get(self, session_id):
+        """Return a live session, or None if it is unknown or expired."""
+        if not session_id:
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            now = time.time()
+            if now - session.last_access > self.ttl_seconds:
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _purge_expired(self):
+        # Sessions are ordered by last access, so expired ones are at the front
+        cutoff = time.time() - self.ttl_seconds
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_access >= cutoff:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active_sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'ttl_seconds': self.ttl_seconds,
+                'created': self.created,
+                'expired': self.expired,
+                'evicted': self.evicted
+            }
+
+
+# Global instance
+_session_store = None
+
+
+def get_session_store():
+    """Get or create the description session store."""
+    global _session_store
+    if _session_store is None:
+        _session_store = DescriptionSessionStore()
+    return _session_store
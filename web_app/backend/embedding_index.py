@@ -0,0 +1,229 @@
+"""
+Approximate nearest-neighbour index for species text embeddings.
+
+An inverted-file (IVF) index in pure numpy: embeddings are clustered with
+k-means, and a query only scores the rows of the clusters whose centroids
+are closest to it. Rows are stored grouped by (cluster, category), so a
+category filter only touches rows of that category and never falls back
+to a full scan. FAISS is used for k-means training when it is installed.
+
+Built by train_description_model.py, loaded by semantic_matcher.py.
+"""
+
+import time
+import numpy as np
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+INDEX_FORMAT_VERSION = 1
+
+
+def _kmeans(embeddings, n_lists, n_iter=20, seed=0):
+    """Spherical k-means; returns L2-normalized centroids of shape (n_lists, dim)."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if FAISS_AVAILABLE:
+        kmeans = faiss.Kmeans(embeddings.shape[1], n_lists, niter=n_iter, seed=seed, spherical=True)
+        kmeans.train(embeddings)
+        return kmeans.centroids.astype(np.float32)
+
+    rng = np.random.default_rng(seed)
+    centroids = embeddings[rng.choice(len(embeddings), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+        for list_id in range(n_lists):
+            members = embeddings[assignments == list_id]
+            if len(members):
+                centroids[list_id] = members.mean(axis=0)
+            else:
+                # Re-seed empty clusters with a random row
+                centroids[list_id] = embeddings[rng.integers(len(embeddings))]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.maximum(norms, 1e-12)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over normalized embeddings with per-category posting ranges."""
+
+    def __init__(self, centroids, row_ids, offsets, categories, n_probe=8):
+        self.centroids = centroids  # (n_lists, dim)
+        self.row_ids = row_ids  # original embedding row for each stored position
+        self.offsets = offsets  # (n_lists, n_categories + 1) start positions into row_ids
+        self.categories = list(categories)
+        self.category_ids = {name: i for i, name in enumerate(self.categories)}
+        self.n_probe = n_probe
+        self.vectors = None  # embeddings reordered to match row_ids (set by attach)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings, row_categories, n_lists=None, n_iter=20, seed=0):
+        """
+        Build an index from normalized embeddings.
+
+        Args:
+            embeddings: (n, dim) float array, rows L2-normalized
+            row_categories: category name ('bird', 'butterfly', ...) for each row
+            n_lists: number of clusters (default: ~sqrt(n))
+        """
+        n = len(embeddings)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+
+        centroids = _kmeans(embeddings, n_lists, n_iter=n_iter, seed=seed)
+        assignments = np.argmax(np.asarray(embeddings, dtype=np.float32) @ centroids.T, axis=1)
+
+        categories = sorted(set(str(c) for c in row_categories))
+        category_ids = {name: i for i, name in enumerate(categories)}
+        row_category_ids = np.array([category_ids[str(c)] for c in row_categories], dtype=np.int64)
+
+        # Group rows by (cluster, category) so each posting range is contiguous
+        order = np.lexsort((row_category_ids, assignments))
+        counts = np.zeros((n_lists, len(categories)), dtype=np.int64)
+        np.add.at(counts, (assignments, row_category_ids), 1)
+        flat_starts = np.concatenate([[0], np.cumsum(counts.ravel())])[:-1].reshape(counts.shape)
+        offsets = np.concatenate([flat_starts, (flat_starts[:, -1] + counts[:, -1])[:, None]], axis=1)
+
+        index = cls(centroids, order.astype(np.int64), offsets, categories)
+        index.attach(embeddings)
+        return index
+
+    def attach(self, embeddings):
+        """Attach the embedding matrix (stored in posting order for contiguous scans)."""
+        self.vectors = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32)[self.row_ids])
+
+    def _posting_range(self, list_id, category_id=None):
+        if category_id is None:
+            return self.offsets[list_id, 0], self.offsets[list_id, -1]
+        return self.offsets[list_id, category_id], self.offsets[list_id, category_id + 1]
+
+    def search(self, query, k, n_probe=None, category=None, min_candidates=None):
+        """
+        Approximate top-k search.
+
+        Args:
+            query: normalized query vector (dim,)
+            k: number of rows to return
+            n_probe: clusters to scan (default: self.n_probe)
+            category: optional category name to restrict the search to
+            min_candidates: keep probing further clusters until at least this
+                many rows have been scored (default: k)
+
+        Returns:
+            (row_indices, scores) sorted by descending score
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        n_probe = n_probe or self.n_probe
+        min_candidates = min_candidates or k
+
+        category_id = None
+        if category is not None:
+            category_id = self.category_ids.get(category)
+            if category_id is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        centroid_order = np.argsort(self.centroids @ query)[::-1]
+        ranges = []
+        scanned = 0
+        for probed, list_id in enumerate(centroid_order):
+            if probed >= n_probe and scanned >= min_candidates:
+                break
+            start, end = self._posting_range(list_id, category_id)
+            if end > start:
+                ranges.append((start, end))
+                scanned += end - start
+
+        if not ranges:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = self.vectors[positions] @ query
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(scores[top])[::-1]]
+        return self.row_ids[positions[top]], scores[top]
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            format_version=np.array(INDEX_FORMAT_VERSION),
+            centroids=self.centroids,
+            row_ids=self.row_ids,
+            offsets=self.offsets,
+            categories=np.array(self.categories, dtype=object),
+            n_probe=np.array(self.n_probe)
+        )
+
+    @classmethod
+    def load(cls, path, embeddings=None):
+        data = np.load(path, allow_pickle=True)
+        if int(data['format_version']) != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported ANN index format: {int(data['format_version'])}")
+        index = cls(
+            data['centroids'].astype(np.float32),
+            data['row_ids'].astype(np.int64),
+            data['offsets'].astype(np.int64),
+            [str(c) for c in data['categories']],
+            n_probe=int(data['n_probe'])
+        )
+        if embeddings is not None:
+            index.attach(embeddings)
+        return index
+
+
+def brute_force_search(embeddings, query, k, row_mask=None):
+    """Exact top-k by inner product (reference for recall measurements)."""
+    scores = embeddings @ query
+    if row_mask is not None:
+        scores = np.where(row_mask, scores, -np.inf)
+    top = np.argpartition(scores, -k)[-k:] if len(scores) > k else np.arange(len(scores))
+    top = top[np.argsort(scores[top])[::-1]]
+    return top[np.isfinite(scores[top])]
+
+
+def benchmark(index, embeddings, queries, k=20, n_probe_values=(1, 2, 4, 8, 16, 32), row_categories=None,
+              category=None):
+    """
+    Measure recall@k and mean latency of the index against brute force.
+
+    Returns:
+        List of dicts: {'n_probe', 'recall', 'ann_ms', 'brute_force_ms'}
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    row_mask = None
+    if category is not None and row_categories is not None:
+        row_mask = np.array([str(c) == category for c in row_categories])
+
+    start = time.perf_counter()
+    exact = [set(brute_force_search(embeddings, q, k, row_mask).tolist()) for q in queries]
+    brute_force_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    report = []
+    for n_probe in n_probe_values:
+        if n_probe > index.n_lists:
+            break
+        hits = 0
+        total = 0
+        start = time.perf_counter()
+        results = [index.search(q, k, n_probe=n_probe, category=category)[0] for q in queries]
+        ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        for truth, found in zip(exact, results):
+            hits += len(truth & set(found.tolist()))
+            total += len(truth)
+        report.append({
+            'n_probe': n_probe,
+            'recall': hits / total if total else 0.0,
+            'ann_ms': ann_ms,
+            'brute_force_ms': brute_force_ms
+        })
+    return report
@@ -8,27 +8,49 @@ Enhanced AI Assistant with Advanced Features
 
 import json
 import os
+import queue
 import re
+import threading
 from datetime import datetime
-from collections import defaultdict
 import random
 
+from intent_scorer import INTENT_MODEL_PATH, IntentScorer
+from interpretation_cache import CATEGORIES as INTERPRETATION_CATEGORIES, get_interpretation_cache
+from knowledge_matcher import CompiledKnowledgeBase, WEBSITE_KEYWORDS, file_signature
+from message_analyzer import MessageAnalyzer
+from resource_index import ResourceIndex
+from session_store import create_session_store
+
+# Session store namespaces for per-user state
+CONVERSATION_NS = 'conversation'  # Conversation history: [{'role', 'content', 'timestamp'}]
+PROFILE_NS = 'profile'  # User preferences and history
+QUIZ_NS = 'quiz'  # Quiz state: {'quiz_id': int, 'waiting_for_answer': bool}
+LANGUAGE_NS = 'language'  # Language preference: 'zh' or 'en'
+
+
 class EnhancedAIAssistant:
-    def __init__(self, knowledge_base_path='knowledge_base.json', resource_library_path='resource_library.json'):
+    def __init__(self, knowledge_base_path='knowledge_base.json', resource_library_path='resource_library.json',
+                 session_store=None):
         self.knowledge_base_path = knowledge_base_path
         self.resource_library_path = resource_library_path
         self.knowledge_base = self._load_knowledge_base()
+        self._knowledge_base_signature = file_signature(self.knowledge_base_path)
+        self.compiled_knowledge_base = CompiledKnowledgeBase(self.knowledge_base)
         self.resource_library = self._load_resource_library()
-        self.conversation_memory = {}  # Store conversation history per user
-        self.user_profiles = {}  # Store user preferences and history
+        self._resource_library_signature = file_signature(self.resource_library_path)
+        self.resource_index = ResourceIndex(self.resource_library)
+        # Per-user state (conversation memory, profiles, quiz state, language),
+        # bounded and optionally shared between worker processes
+        self.sessions = session_store or create_session_store()
         # Load trained intent classification model
         self.intent_model, self.intent_vectorizer = self._load_intent_model()
-        # Quiz state for each user: {user_id: {'current_quiz': quiz_dict, 'waiting_for_answer': bool}}
-        self.quiz_states = {}
-        # Language preference for each user: {user_id: 'zh' or 'en'}
-        self.user_languages = {}
-        # Interpretation model generator (lazy loading)
+        # Keyword families compiled into one automaton; see message_analyzer.py
+        self.message_analyzer = MessageAnalyzer(self.intent_vectorizer)
+        self._analysis_cache = threading.local()
+        # Interpretation model generator (lazy loading, used only in the background
+        # to fill misses of the pre-generated table; see interpretation_cache.py)
         self.interpretation_generator = None
+        self.interpretation_generator_unavailable = False
         
     def _load_knowledge_base(self):
         """Load knowledge base from file"""
@@ -40,6 +62,16 @@ class EnhancedAIAssistant:
                 print(f"Error loading knowledge base: {e}")
         return {}
     
+    def _refresh_knowledge_base(self):
+        """Reload and recompile the knowledge base if knowledge_base.json changed"""
+        signature = file_signature(self.knowledge_base_path)
+        if signature == self._knowledge_base_signature:
+            return
+        self._knowledge_base_signature = signature
+        self.knowledge_base = self._load_knowledge_base()
+        self.compiled_knowledge_base = CompiledKnowledgeBase(self.knowledge_base)
+        print(f"🔄 Knowledge base reloaded: {len(self.knowledge_base)} categories")
+    
     def _load_resource_library(self):
         """Load resource library from file"""
         if os.path.exists(self.resource_library_path):
@@ -57,6 +89,15 @@ class EnhancedAIAssistant:
             print(f"⚠️ Resource library file not found: {self.resource_library_path}")
         return []
     
+    def _refresh_resource_library(self):
+        """Reload and re-index the resource library if resource_library.json changed"""
+        signature = file_signature(self.resource_library_path)
+        if signature == self._resource_library_signature:
+            return
+        self._resource_library_signature = signature
+        self.resource_library = self._load_resource_library()
+        self.resource_index = ResourceIndex(self.resource_library)
+    
     def detect_language(self, text):
         """
         检测文本语言
@@ -67,27 +108,21 @@ class EnhancedAIAssistant:
         Returns:
             'zh' 如果主要是中文，'en' 如果主要是英文
         """
-        if not text or not text.strip():
-            return 'en'  # 默认英文
-        
-        # 检测中文字符（Unicode范围：\u4e00-\u9fff）
-        chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-        total_chars = len(re.findall(r'[a-zA-Z\u4e00-\u9fff]', text))
-        
-        if total_chars == 0:
-            return 'en'  # 如果没有可识别的字符，默认英文
-        
-        # 如果中文字符占比超过30%，判定为中文
-        chinese_ratio = chinese_chars / total_chars if total_chars > 0 else 0
-        
-        # 也可以检查常见的中文词汇
-        chinese_keywords = ['的', '是', '在', '有', '了', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这']
-        has_chinese_keywords = any(keyword in text for keyword in chinese_keywords)
+        return self.analyze_message(text).language
+    
+    def analyze_message(self, message):
+        """
+        Analyze a message once (language, sentiment, triggers, topics, TF-IDF)
         
-        if chinese_ratio > 0.3 or has_chinese_keywords:
-            return 'zh'
-        else:
-            return 'en'
+        The last analysis is cached per thread, so every detector called while
+        handling the same message reuses it instead of rescanning the text.
+        """
+        cached = getattr(self._analysis_cache, 'analysis', None)
+        if cached is not None and cached.message == message:
+            return cached
+        analysis = self.message_analyzer.analyze(message)
+        self._analysis_cache.analysis = analysis
+        return analysis
     
     def _get_user_language(self, user_id, message=None):
         """
@@ -104,12 +139,14 @@ class EnhancedAIAssistant:
         if message:
             detected_lang = self.detect_language(message)
             # 更新用户语言偏好（但每次对话都根据当前消息更新）
-            self.user_languages[user_id] = detected_lang
+            if self.sessions.get(LANGUAGE_NS, user_id) != detected_lang:
+                self.sessions.set(LANGUAGE_NS, user_id, detected_lang)
             return detected_lang
         
         # 如果用户已有语言偏好且没有当前消息，使用它
-        if user_id in self.user_languages:
-            return self.user_languages[user_id]
+        stored_lang = self.sessions.get(LANGUAGE_NS, user_id)
+        if stored_lang:
+            return stored_lang
         
         # 默认英文
         return 'en'
@@ -141,6 +178,18 @@ class EnhancedAIAssistant:
             print(f"⚠️ Interpretation generation model loading failed: {e}")
             return None
     
+    def warm_up(self, sample_message="What do birds eat?"):
+        """
+        Run a sample message through the intent model and knowledge base matching
+        and load the interpretation table, so their first real use is fast.
+        Does not touch any user state.
+        """
+        self._predict_intent(sample_message)
+        self._match_knowledge_base(sample_message)
+        self._detect_sentiment(sample_message)
+        get_interpretation_cache()
+        return True
+    
     def _check_cuda_available(self):
         """檢查CUDA是否可用"""
         try:
@@ -164,6 +213,8 @@ class EnhancedAIAssistant:
         # Load generator (lazy loading)
         generator = self._load_interpretation_generator()
         if generator is None:
+            # Stop queueing background generations that cannot succeed
+            self.interpretation_generator_unavailable = True
             return None
         
         try:
@@ -218,6 +269,33 @@ class EnhancedAIAssistant:
         
         return None
     
+    def _interpretation_species(self, message, context):
+        """
+        Species to add a model interpretation for, or None if the message is
+        not a species information question
+        """
+        # Check if it's a species information related question (works for both Chinese and English)
+        species_info_keywords_zh = ['物種', '種類', '信息', '資訊', '介紹', '特徵', '特點', '習性', '行為', '棲息地']
+        species_info_keywords_en = ['species', 'information', 'about', 'tell me', 'characteristics', 'features', 'behavior', 'habitat', 'facts']
+        
+        has_species_keyword = any(keyword in message for keyword in species_info_keywords_zh) or \
+                             any(keyword in message.lower() for keyword in species_info_keywords_en)
+        
+        if not has_species_keyword:
+            return None
+        
+        # Extract species name
+        return self._extract_species_from_message(message, context)
+    
+    def _interpretation_title(self, category):
+        """Section title for a generated interpretation (in English)"""
+        category_titles = {
+            'fun_fact': '💡 **Fun Fact**',
+            'behavior': '🎯 **Behavior**',
+            'habitat': '🌳 **Habitat**'
+        }
+        return category_titles.get(category, '📝 **Additional Information**')
+    
     def _enhance_response_with_interpretation(self, base_response, message, context, language):
         """
         Enhance response with model-generated interpretation text
@@ -231,54 +309,91 @@ class EnhancedAIAssistant:
         Returns:
             enhanced_response: Enhanced response
         """
-        # Check if it's a species information related question (works for both Chinese and English)
-        species_info_keywords_zh = ['物種', '種類', '信息', '資訊', '介紹', '特徵', '特點', '習性', '行為', '棲息地']
-        species_info_keywords_en = ['species', 'information', 'about', 'tell me', 'characteristics', 'features', 'behavior', 'habitat', 'facts']
-        
-        has_species_keyword = any(keyword in message for keyword in species_info_keywords_zh) or \
-                             any(keyword in message.lower() for keyword in species_info_keywords_en)
-        
-        if not has_species_keyword:
-            return base_response
-        
-        # Extract species name
-        species = self._extract_species_from_message(message, context)
+        species = self._interpretation_species(message, context)
         if not species:
             return base_response
         
-        # Try to generate interpretation for different categories
-        categories_to_try = ['fun_fact', 'behavior', 'habitat']
-        generated_interpretations = []
+        # Look up a pre-generated interpretation for the first category that has one
+        cache = get_interpretation_cache()
         
-        for category in categories_to_try:
-            interpretation = self._generate_interpretation_with_model(species, category, language='en')
+        for category in INTERPRETATION_CATEGORIES:
+            interpretation = cache.get(species, category)
             if interpretation:
-                generated_interpretations.append((category, interpretation))
-                # Only generate the first successful one to avoid overly long responses
-                break
+                enhanced = f"{base_response}\n\n{self._interpretation_title(category)}:\n{interpretation}"
+                print(f"✅ Enhanced response with model-generated interpretation: {species} - {category}")
+                return enhanced
         
-        # If successfully generated, add to response
-        if generated_interpretations:
-            category, interpretation = generated_interpretations[0]
-            
-            # Add title based on category (in English)
-            category_titles = {
-                'fun_fact': '💡 **Fun Fact**',
-                'behavior': '🎯 **Behavior**',
-                'habitat': '🌳 **Habitat**'
-            }
-            title = category_titles.get(category, '📝 **Additional Information**')
-            
-            # Combine response
-            enhanced = f"{base_response}\n\n{title}:\n{interpretation}"
-            print(f"✅ Enhanced response with model-generated interpretation: {species} - {category}")
-            return enhanced
+        # On a miss, generate in the background so later requests can use it;
+        # this response is returned without waiting for the model
+        if not self.interpretation_generator_unavailable:
+            cache.request_generation(species, INTERPRETATION_CATEGORIES[0], self._generate_interpretation_with_model)
         
-        # If model generation fails, return original response (fallback logic)
+        # If no interpretation is available, return original response (fallback logic)
         return base_response
     
+    def _stream_interpretation(self, species, should_stop):
+        """
+        Yield the interpretation section for a species piece by piece.
+        
+        A pre-generated text is yielded at once; otherwise the model generates
+        live and each new piece of text is yielded as it is produced.
+        Generation stops when should_stop() returns True.
+        """
+        cache = get_interpretation_cache()
+        for category in INTERPRETATION_CATEGORIES:
+            interpretation = cache.get(species, category)
+            if interpretation:
+                yield f"\n\n{self._interpretation_title(category)}:\n"
+                yield interpretation
+                return
+        
+        if self.interpretation_generator_unavailable:
+            return
+        generator = self._load_interpretation_generator()
+        if generator is None:
+            self.interpretation_generator_unavailable = True
+            return
+        
+        category = INTERPRETATION_CATEGORIES[0]
+        pieces = queue.Queue()
+        finished = object()
+        
+        def _run():
+            result = None
+            try:
+                result = generator.generate(species, category, max_length=256, temperature=0.7, top_p=0.9,
+                                            on_token=pieces.put, should_stop=should_stop, return_details=True)
+            finally:
+                pieces.put((finished, result))
+        
+        threading.Thread(target=_run, name='interpretation-stream', daemon=True).start()
+        yield f"\n\n{self._interpretation_title(category)}:\n"
+        while True:
+            piece = pieces.get()
+            if isinstance(piece, tuple) and piece[0] is finished:
+                result = piece[1]
+                break
+            yield piece
+        
+        # Keep complete generations for later requests
+        if result and not result['truncated'] and len(result['text']) > 10:
+            cache.put(species, category, result['text'])
+    
     def _load_intent_model(self):
-        """Load trained intent classification model"""
+        """
+        Load trained intent classification model.
+
+        Prefers the numpy export (intent_model.npz, no sklearn import); the
+        scorer then serves as both model and vectorizer. Falls back to the
+        pickled sklearn model and vectorizer.
+        """
+        if os.path.exists(INTENT_MODEL_PATH):
+            try:
+                scorer = IntentScorer(INTENT_MODEL_PATH)
+                print(f"✅ Intent classification model loaded ({INTENT_MODEL_PATH})")
+                return scorer, scorer
+            except Exception as e:
+                print(f"⚠️ Error loading {INTENT_MODEL_PATH}: {e}, trying pickled model")
         try:
             import pickle
             model_path = 'intent_classifier_model.pkl'
@@ -304,8 +419,9 @@ class EnhancedAIAssistant:
             return None, 0.0
         
         try:
-            import numpy as np
-            text_vectorized = self.intent_vectorizer.transform([message.lower()])
+            text_vectorized = self.analyze_message(message).tfidf_vector()
+            if isinstance(self.intent_model, IntentScorer):
+                return self.intent_model.predict_features(text_vectorized[0])
             prediction = self.intent_model.predict(text_vectorized)[0]
             probabilities = self.intent_model.predict_proba(text_vectorized)[0]
             confidence = float(max(probabilities))
@@ -319,34 +435,7 @@ class EnhancedAIAssistant:
         Detect user sentiment from message
         Returns: 'positive', 'negative', 'neutral', 'curious', 'frustrated'
         """
-        message_lower = message.lower()
-        
-        # Positive indicators
-        positive_words = ['great', 'good', 'excellent', 'amazing', 'wonderful', 
-                         'thanks', 'thank you', 'helpful', 'love', 'awesome',
-                         '太好了', '很棒', '謝謝', '感謝', '喜歡']
-        if any(word in message_lower for word in positive_words):
-            return 'positive'
-        
-        # Negative/Frustrated indicators
-        negative_words = ['bad', 'wrong', 'incorrect', 'not working', 'error',
-                         'problem', 'issue', 'confused', 'difficult', 'hard',
-                         '不好', '錯誤', '問題', '困難', '不懂', '不會']
-        if any(word in message_lower for word in negative_words):
-            return 'frustrated'
-        
-        # Curious indicators
-        curious_words = ['why', 'how', 'what', 'when', 'where', 'explain',
-                        'tell me', 'can you', 'could you', 'please',
-                        '為什麼', '如何', '什麼', '怎麼', '請']
-        if any(word in message_lower for word in curious_words):
-            return 'curious'
-        
-        # Question marks indicate curiosity
-        if '?' in message:
-            return 'curious'
-        
-        return 'neutral'
+        return self.analyze_message(message).sentiment
     
     def _get_sentiment_style(self, sentiment):
         """Get response style based on sentiment"""
@@ -376,52 +465,37 @@ class EnhancedAIAssistant:
     
     def _update_conversation_memory(self, user_id, role, content):
         """Update conversation memory for a user"""
-        if user_id not in self.conversation_memory:
-            self.conversation_memory[user_id] = []
-        
-        self.conversation_memory[user_id].append({
+        memory = self.sessions.get(CONVERSATION_NS, user_id, [])
+        memory.append({
             'role': role,
             'content': content,
             'timestamp': datetime.now().isoformat()
         })
         
         # Keep only last 10 messages to avoid memory bloat
-        if len(self.conversation_memory[user_id]) > 10:
-            self.conversation_memory[user_id] = self.conversation_memory[user_id][-10:]
+        self.sessions.set(CONVERSATION_NS, user_id, memory[-10:])
     
     def _get_conversation_context(self, user_id):
         """Get recent conversation context"""
-        if user_id not in self.conversation_memory:
-            return []
-        return self.conversation_memory[user_id][-5:]  # Last 5 messages
+        return self.sessions.get(CONVERSATION_NS, user_id, [])[-5:]  # Last 5 messages
     
     def _update_user_profile(self, user_id, message, response, context):
         """Update user profile based on interaction"""
-        if user_id not in self.user_profiles:
-            self.user_profiles[user_id] = {
-                'topics_asked': defaultdict(int),
+        profile = self.sessions.get(PROFILE_NS, user_id)
+        if profile is None:
+            profile = {
+                'topics_asked': {},
                 'preferred_category': None,
                 'interaction_count': 0,
                 'last_interaction': None
             }
         
-        profile = self.user_profiles[user_id]
         profile['interaction_count'] += 1
         profile['last_interaction'] = datetime.now().isoformat()
         
         # Track topics
-        message_lower = message.lower()
-        topics = {
-            'identification': ['identify', 'recognize', 'tell', 'what is', '識別', '辨識'],
-            'photography': ['photo', 'camera', 'picture', 'image', '拍照', '攝影'],
-            'habitat': ['where', 'habitat', 'location', 'find', '哪裡', '棲息地'],
-            'behavior': ['behavior', 'behaviour', 'do', 'act', '行為', '習性'],
-            'species_info': ['species', 'type', 'kind', '物種', '種類']
-        }
-        
-        for topic, keywords in topics.items():
-            if any(keyword in message_lower for keyword in keywords):
-                profile['topics_asked'][topic] += 1
+        for topic in self.analyze_message(message).topics:
+            profile['topics_asked'][topic] = profile['topics_asked'].get(topic, 0) + 1
         
         # Detect preferred category from context
         if context.get('lastPrediction'):
@@ -430,13 +504,15 @@ class EnhancedAIAssistant:
                 profile['preferred_category'] = 'bird'
             elif 'butterfly' in category.lower():
                 profile['preferred_category'] = 'butterfly'
+        
+        self.sessions.set(PROFILE_NS, user_id, profile)
     
     def _get_personalized_recommendation(self, user_id, context):
         """Get personalized recommendation based on user profile"""
-        if user_id not in self.user_profiles:
+        profile = self.sessions.get(PROFILE_NS, user_id)
+        if profile is None:
             return None
         
-        profile = self.user_profiles[user_id]
         
         # If user has a preferred category, mention it
         if profile['preferred_category']:
@@ -444,7 +520,7 @@ class EnhancedAIAssistant:
             return f"Since you're interested in {category_name}, you might want to explore more {category_name} species!"
         
         # If user asks a lot about photography, suggest photo tips
-        if profile['topics_asked']['photography'] > 2:
+        if profile['topics_asked'].get('photography', 0) > 2:
             return "I notice you're interested in photography. Would you like more advanced photography tips?"
         
         return None
@@ -456,93 +532,26 @@ class EnhancedAIAssistant:
         触发条件：包含地点、观察对象、行为、时间线索
         返回：是否应该触发，以及提取的关键信息
         """
-        message_lower = message.lower()
-        
-        # 地点关键词
-        location_keywords = [
-            '阳台', '陽台', 'balcony', 'park', '公园', '公園', 'garden', '花园', '花園',
-            'window', '窗户', '窗戶', 'yard', '院子', 'field', '田野', 'forest', '森林',
-            'tree', '树', '樹', 'branch', '树枝', '樹枝', 'roof', '屋顶', '屋頂',
-            'home', '家', 'house', '房子', 'outside', '外面', 'outdoor', '戶外', '户外'
-        ]
-        
-        # 观察对象关键词
-        subject_keywords = [
-            'bird', 'birds', '鸟', '鳥', '小鸟', '小鳥', 'butterfly', 'butterflies',
-            '蝴蝶', 'moth', '蛾', 'animal', '动物', '動物', 'creature', '生物'
-        ]
-        
-        # 行为关键词
-        behavior_keywords = [
-            '叫', 'sing', 'singing', 'chirp', 'chirping', 'call', 'calling',
-            '打架', 'fight', 'fighting', 'attack', 'attacking', 'chase', 'chasing',
-            '吃', 'eat', 'eating', 'feed', 'feeding', 'peck', 'pecking',
-            '停', 'stop', 'stopped', 'stand', 'standing', 'sit', 'sitting',
-            '飞', '飛', 'fly', 'flying', 'hover', 'hovering', 'land', 'landing',
-            '跳', 'jump', 'jumping', 'hop', 'hopping', 'move', 'moving',
-            '不动', '不動', 'still', 'motionless', 'quiet', '安静', '安靜',
-            '观察', '觀察', 'observe', 'watching', '看', 'see', 'saw'
-        ]
-        
-        # 时间线索关键词
-        time_keywords = [
-            'today', '今天', 'yesterday', '昨天', 'morning', '早晨', '早上',
-            'afternoon', '下午', 'evening', '晚上', 'night', '夜晚', 'night',
-            'season', '季节', '季節', 'spring', '春天', 'summer', '夏天',
-            'autumn', '秋天', 'winter', '冬天', 'now', '现在', '現在',
-            'recently', '最近', 'lately', '近来', '近來'
-        ]
-        
-        # 检测是否包含各类关键词
-        has_location = any(keyword in message_lower for keyword in location_keywords)
-        has_subject = any(keyword in message_lower for keyword in subject_keywords)
-        has_behavior = any(keyword in message_lower for keyword in behavior_keywords)
-        has_time = any(keyword in message_lower for keyword in time_keywords)
-        
-        # 还需要检测是否包含疑问词，表示用户在询问行为原因
-        question_indicators = [
-            'why', '为什么', '為什麼', '为何', '為何', '幹嘛', '干嘛', '做什麼', '做什么',
-            '可能', 'maybe', 'perhaps', 'might', 'could', 'would',
-            '在干嘛', '在做什麼', '在幹嘛', 'what', 'how', '可能',
-            '可能在做', '可能在', '可能', '？', '?'
-        ]
-        has_question = any(indicator in message_lower for indicator in question_indicators)
+        analysis = self.analyze_message(message)
         
         # 触发条件：至少包含观察对象和行为，并且（有疑问 或 包含地点/时间）
         # 这样可以捕获更多相关的问题
-        should_trigger = (has_subject and has_behavior) and (has_question or has_location or has_time)
-        
-        if should_trigger:
+        if analysis.behavior_trigger:
             # 提取关键信息
-            extracted_info = self._extract_behavior_keywords(message, location_keywords, 
-                                                             subject_keywords, behavior_keywords, 
-                                                             time_keywords)
+            extracted_info = self._extract_behavior_keywords(message, analysis)
             return True, extracted_info
         
         return False, None
     
-    def _extract_behavior_keywords(self, message, location_keywords, subject_keywords, 
-                                   behavior_keywords, time_keywords):
+    def _extract_behavior_keywords(self, message, analysis):
         """
         从消息中提取关键词：物种、行为、地点、时间
         """
-        message_lower = message.lower()
-        
-        # 提取地点
-        locations = [kw for kw in location_keywords if kw in message_lower]
-        location = locations[0] if locations else None
-        
-        # 提取观察对象
-        subjects = [kw for kw in subject_keywords if kw in message_lower]
-        subject = subjects[0] if subjects else None
-        
-        # 提取行为
-        behaviors = [kw for kw in behavior_keywords if kw in message_lower]
-        behavior = behaviors[0] if behaviors else None
-        
-        # 提取时间
-        times = [kw for kw in time_keywords if kw in message_lower]
-        time_clue = times[0] if times else None
+        # 地点、观察对象、行为、时间：各类关键词中第一个出现在消息中的
+        location = analysis.location
+        subject = analysis.subject
+        behavior = analysis.behavior
+        time_clue = analysis.time_clue
         
         # 尝试提取物种名称（从上下文或消息中）
         species = None
@@ -886,20 +895,7 @@ class EnhancedAIAssistant:
         
         触发条件：用户明确请求资源、网站、摄影技巧等
         """
-        message_lower = message.lower()
-        
-        resource_keywords = [
-            '推荐', '推薦', '網站', '网站', '資源', '资源', '連結', '链接', 'link',
-            '攝影', '摄影', '拍照', '技巧', 'technique', 'tip', 'tips',
-            '哪裡看', '哪里看', 'where to see', 'where to find',
-            '圖鑑', '图鉴', 'field guide', 'guide',
-            'platform', 'platform', 'database', '資料庫', '数据库',
-            'website', 'resource', 'recommend', 'recommendation',
-            'how to photograph', 'photography tips', 'photography guide',
-            '觀測', '观测', 'observation', 'watch'
-        ]
-        
-        should_trigger = any(keyword in message_lower for keyword in resource_keywords)
+        should_trigger = self.analyze_message(message).resource_trigger
         if should_trigger:
             print(f"🔍 [RESOURCE] 检测到资源请求关键词: {message[:50]}...")
         return should_trigger
@@ -945,62 +941,8 @@ class EnhancedAIAssistant:
         Returns:
             匹配的资源列表（最多3个）
         """
-        message_lower = message.lower()
-        matched = []
-        
-        for resource in self.resource_library:
-            # 计算匹配分数
-            score = 0
-            
-            # 语言支持检查（如果语言匹配，给予加分；如果不匹配但关键词匹配度高，仍可推荐）
-            language_support = resource.get('language_support', [])
-            language_match = language in language_support
-            if language_match:
-                score += 5  # 语言匹配加分
-            # 如果不匹配，但关键词匹配度高，仍然可以考虑（不直接跳过）
-            
-            # 关键词匹配
-            keywords = resource.get('keywords', [])
-            for keyword in keywords:
-                keyword_lower = keyword.lower()
-                if keyword_lower in message_lower:
-                    score += 3
-                elif any(word in message_lower for word in keyword_lower.split()):
-                    score += 1
-            
-            # 标签匹配
-            tags = resource.get('tags', [])
-            for tag in tags:
-                tag_lower = tag.lower()
-                if tag_lower in message_lower:
-                    score += 2
-            
-            # 类别匹配
-            category = resource.get('category', '')
-            category_keywords = {
-                'photography': ['photography', 'photo', 'camera', '拍照', '摄影', '相机'],
-                'field_guide': ['guide', 'field guide', 'identification', '图鉴', '指南', '识别'],
-                'observation_platform': ['platform', 'observation', 'watch', '观察', '平台', '观测'],
-                'mobile_app': ['app', 'mobile', 'application', '应用', '手机'],
-                'sound_database': ['sound', 'audio', 'call', '声音', '音频', '叫声']
-            }
-            if category in category_keywords:
-                for keyword in category_keywords[category]:
-                    if keyword in message_lower:
-                        score += 2
-                        break
-            
-            # 如果分数足够高（即使语言不完全匹配），也可以推荐
-            # 但如果语言匹配，优先推荐
-            if score > 0:
-                # 如果语言不匹配但分数很高，仍然可以推荐（但降低优先级）
-                if not language_match and score < 5:
-                    continue  # 分数太低且语言不匹配，跳过
-                matched.append((resource, score))
-        
-        # 按分数排序，返回前3个
-        matched.sort(key=lambda x: x[1], reverse=True)
-        return [resource for resource, score in matched[:3]]
+        self._refresh_resource_library()
+        return self.resource_index.match(message.lower(), language, limit=3)
     
     def _format_resource_response(self, resources, language):
         """
@@ -1048,21 +990,14 @@ class EnhancedAIAssistant:
         
         触发条件：用户明确请求玩游戏或挑战
         """
-        message_lower = message.lower()
-        
-        quiz_keywords = [
-            '玩游戏', '来点挑战', '挑战', '猜谜', 'quiz', 'game', 'challenge',
-            'play', 'guess', 'test', 'question', '题目', '问题', '小游戏',
-            '來點挑戰', '玩遊戲', '猜謎', '題目', '問題', '小遊戲'
-        ]
-        
-        return any(keyword in message_lower for keyword in quiz_keywords)
+        return self.analyze_message(message).quiz_trigger
     
     def _is_waiting_for_quiz_answer(self, user_id):
         """检查是否在等待用户回答挑战题目"""
-        if user_id not in self.quiz_states:
+        quiz_state = self.sessions.get(QUIZ_NS, user_id)
+        if quiz_state is None:
             return False
-        return self.quiz_states[user_id].get('waiting_for_answer', False)
+        return quiz_state.get('waiting_for_answer', False)
     
     def _start_quiz(self, user_id, message, language='en'):
         """
@@ -1093,11 +1028,8 @@ class EnhancedAIAssistant:
             # 格式化题目（使用用户语言）
             quiz_message = format_quiz_message(quiz, language=language)
             
-            # 保存状态
-            if user_id not in self.quiz_states:
-                self.quiz_states[user_id] = {}
-            self.quiz_states[user_id]['current_quiz'] = quiz
-            self.quiz_states[user_id]['waiting_for_answer'] = True
+            # 保存状态（只保存题目ID，题目内容从题库查找）
+            self.sessions.set(QUIZ_NS, user_id, {'quiz_id': quiz['id'], 'waiting_for_answer': True})
             
             return quiz_message
             
@@ -1117,10 +1049,10 @@ class EnhancedAIAssistant:
         Returns:
             反馈消息，如果识别为答案；None如果不是答案
         """
-        if user_id not in self.quiz_states:
+        quiz_state = self.sessions.get(QUIZ_NS, user_id)
+        if quiz_state is None:
             return None
         
-        quiz_state = self.quiz_states[user_id]
         if not quiz_state.get('waiting_for_answer', False):
             return None
         
@@ -1130,24 +1062,23 @@ class EnhancedAIAssistant:
         
         if not answer_pattern:
             # 如果不是答案格式，清除等待状态，让用户继续正常对话
-            quiz_state['waiting_for_answer'] = False
+            self.sessions.delete(QUIZ_NS, user_id)
             return None
         
         user_answer = answer_pattern.group(1)
-        quiz = quiz_state.get('current_quiz')
-        
-        if not quiz:
-            quiz_state['waiting_for_answer'] = False
-            return None
         
         try:
-            from quiz_library import check_quiz_answer
+            from quiz_library import check_quiz_answer, get_quiz_by_id
+            
+            quiz = get_quiz_by_id(quiz_state.get('quiz_id'))
+            if not quiz:
+                self.sessions.delete(QUIZ_NS, user_id)
+                return None
             
             is_correct, feedback = check_quiz_answer(quiz, user_answer, language=language)
             
             # 清除等待状态
-            quiz_state['waiting_for_answer'] = False
-            quiz_state['current_quiz'] = None
+            self.sessions.delete(QUIZ_NS, user_id)
             
             # 添加鼓励和下一步提示（根据语言）
             if language == 'zh':
@@ -1165,7 +1096,7 @@ class EnhancedAIAssistant:
             
         except Exception as e:
             print(f"Error handling quiz answer: {e}")
-            quiz_state['waiting_for_answer'] = False
+            self.sessions.delete(QUIZ_NS, user_id)
             return None
     
     def _build_interpretation_response(self, extracted_info, interpretations, language='en'):
@@ -1272,12 +1203,9 @@ class EnhancedAIAssistant:
         Returns:
             (category, responses, score) or None
         """
+        self._refresh_knowledge_base()
         message_lower = message.lower()
         
-        # Special handling for website/link requests
-        website_keywords = ['網站', 'website', 'link', '連結', '鏈接', '資源', 'resource', '推薦', 'recommend']
-        is_website_request = any(keyword in message_lower for keyword in website_keywords)
-        
         # First try to use trained model for intent classification
         predicted_intent, model_confidence = self._predict_intent(message)
         
@@ -1288,82 +1216,30 @@ class EnhancedAIAssistant:
                 responses = data.get('responses', [])
                 if responses:
                     # If it's a website request, prefer responses with links
-                    if is_website_request:
+                    if self.compiled_knowledge_base.automaton.contains_any(message_lower, WEBSITE_KEYWORDS):
                         link_responses = [r for r in responses if 'http' in r or '[' in r]
                         if link_responses:
                             return (predicted_intent, link_responses, model_confidence * 10)
                     return (predicted_intent, responses, model_confidence * 10)
         
         # Fallback to pattern matching if model not available or low confidence
-        best_match = None
-        best_score = 0
-        
-        for category, data in self.knowledge_base.items():
-            if category == 'default':
-                continue
-            
-            patterns = data.get('patterns', [])
-            responses = data.get('responses', [])
-            
-            # Improved scoring: exact match > partial match
-            score = 0
-            for pattern in patterns:
-                pattern_lower = pattern.lower()
-                if pattern_lower == message_lower:
-                    score += 10  # Exact match
-                elif pattern_lower in message_lower:
-                    score += 5  # Partial match (increased from 3)
-                elif any(word in message_lower for word in pattern_lower.split()):
-                    score += 2  # Word match (increased from 1)
-            
-            # 特殊处理：如果问题明确包含"蝴蝶和蛾"或"butterfly and moth"，大幅提升匹配分数
-            butterfly_moth_keywords = ['蝴蝶和蛾', 'butterfly and moth', 'butterfly vs moth', 'butterfly moth', '蛾和蝴蝶', 'moth and butterfly', '有什麼區別', '有什麼不同', 'difference', '區分']
-            if any(keyword in message_lower for keyword in butterfly_moth_keywords):
-                if category == 'butterfly_moth_difference':
-                    score += 50  # 大幅提升专门类别的分数
-                    print(f"🔍 [DEBUG] 检测到蝴蝶和蛾问题，提升 {category} 分数: {score}")
-                elif category == 'identification_tips':
-                    score -= 10  # 降低通用类别的分数，避免误匹配
-                    print(f"🔍 [DEBUG] 降低 {category} 分数以避免误匹配: {score}")
-            
-            # Boost score for website requests matching photo_tips
-            if is_website_request and category == 'photo_tips':
-                score += 5
-            
-            if score > best_score and responses:
-                # If it's a website request, prefer responses with links
-                if is_website_request:
-                    link_responses = [r for r in responses if 'http' in r or '[' in r]
-                    if link_responses:
-                        best_score = score
-                        best_match = (category, link_responses, score)
-                        continue
-                
-                best_score = score
-                best_match = (category, responses, score)
-        
-        return best_match
+        return self.compiled_knowledge_base.best_match(message_lower)
     
-    def generate_response(self, message, context=None, user_id='default'):
+    def _build_response(self, message, context, user_id):
         """
-        Generate enhanced AI response with context memory and personalization
-        
-        Args:
-            message: User message
-            context: Additional context (e.g., lastPrediction, historyCount)
-            user_id: Unique user identifier (for memory and personalization)
+        Build the response up to (not including) the model interpretation
         
         Returns:
-            Enhanced response with personalization
+            (enhanced_response, base_response, user_language)
         """
-        if context is None:
-            context = {}
+        # Tokenize and match all keyword families once; detectors below reuse it
+        analysis = self.analyze_message(message)
         
         # 检测并保存用户语言偏好（核心功能）
         user_language = self._get_user_language(user_id, message)
         
         # 调试日志：打印检测到的语言
-        detected_lang = self.detect_language(message)
+        detected_lang = analysis.language
         print(f"🔍 [DEBUG] 用户消息: {message[:50]}...")
         print(f"🔍 [DEBUG] 检测到的语言: {detected_lang}")
         print(f"🔍 [DEBUG] 使用的回复语言: {user_language}")
@@ -1407,7 +1283,7 @@ class EnhancedAIAssistant:
         if not base_response:
             print(f"🔍 [RESOURCE] 检查资源推荐功能，消息: {message[:50]}...")
             # 重新检测当前消息的语言（确保使用当前消息的语言，而不是之前保存的偏好）
-            current_lang = self.detect_language(message)
+            current_lang = analysis.language
             print(f"🔍 [RESOURCE] 当前消息检测到的语言: {current_lang}, 用户语言偏好: {user_language}")
             resource_response = self._handle_resource_request(message, current_lang)
             if resource_response:
@@ -1446,6 +1322,33 @@ class EnhancedAIAssistant:
             user_language
         )
         
+        return enhanced_response, base_response, user_language
+    
+    def _finish_response(self, user_id, message, response, context):
+        """Record the final response in the user profile and conversation memory"""
+        # Update user profile
+        self._update_user_profile(user_id, message, response, context)
+        
+        # Update conversation memory with response
+        self._update_conversation_memory(user_id, 'assistant', response)
+    
+    def generate_response(self, message, context=None, user_id='default'):
+        """
+        Generate enhanced AI response with context memory and personalization
+        
+        Args:
+            message: User message
+            context: Additional context (e.g., lastPrediction, historyCount)
+            user_id: Unique user identifier (for memory and personalization)
+        
+        Returns:
+            Enhanced response with personalization
+        """
+        if context is None:
+            context = {}
+        
+        enhanced_response, base_response, user_language = self._build_response(message, context, user_id)
+        
         # 嘗試使用模型生成解讀文本來增強響應（如果適用）
         # 這會在響應末尾添加模型生成的解讀，如果模型失敗則回退到原始響應
         if base_response:  # 只在有基礎響應時嘗試
@@ -1456,13 +1359,49 @@ class EnhancedAIAssistant:
                 user_language
             )
         
-        # Update user profile
-        self._update_user_profile(user_id, message, enhanced_response, context)
+        self._finish_response(user_id, message, enhanced_response, context)
+        return enhanced_response
+    
+    def generate_response_stream(self, message, context=None, user_id='default', should_stop=None):
+        """
+        Streaming variant of generate_response
         
-        # Update conversation memory with response
-        self._update_conversation_memory(user_id, 'assistant', enhanced_response)
+        Yields events as dicts:
+            {'type': 'response', 'text': ...}  the knowledge-base/feature response, immediately
+            {'type': 'token', 'text': ...}     pieces of the model interpretation as generated
+            {'type': 'done', 'response': ...}  the complete response text
         
-        return enhanced_response
+        Closing the generator (e.g. the client disconnected) or should_stop()
+        returning True stops interpretation generation.
+        """
+        if context is None:
+            context = {}
+        
+        cancelled = threading.Event()
+        
+        def _should_stop():
+            return cancelled.is_set() or (should_stop is not None and should_stop())
+        
+        enhanced_response, base_response, user_language = self._build_response(message, context, user_id)
+        full_response = enhanced_response
+        try:
+            yield {'type': 'response', 'text': enhanced_response}
+            
+            species = self._interpretation_species(message, context) if base_response else None
+            if species:
+                for piece in self._stream_interpretation(species, _should_stop):
+                    if _should_stop():
+                        break
+                    full_response += piece
+                    yield {'type': 'token', 'text': piece}
+            
+            yield {'type': 'done', 'response': full_response}
+        except GeneratorExit:
+            cancelled.set()
+            print(f"ℹ️ Chat stream closed by client after {len(full_response)} chars")
+            raise
+        finally:
+            self._finish_response(user_id, message, full_response, context)
     
     def _enhance_response(self, base_response, sentiment, style, is_follow_up, context, user_id, language='en'):
         """Enhance base response with personalization and context"""
@@ -1567,3 +1506,9 @@ def get_enhanced_assistant():
         print(f"   - Resource library: {len(_enhanced_assistant.resource_library)} resources")
     return _enhanced_assistant
 
+
+def get_assistant_session_stats():
+    """Session store statistics, or None if the assistant has not been created yet"""
+    if _enhanced_assistant is None:
+        return None
+    return _enhanced_assistant.sessions.stats()
@@ -0,0 +1,220 @@
+"""
+Running analytics over user feedback.
+
+FeedbackAnalytics replays the feedback log once at startup and is then
+updated by the log's writer thread for every new entry, keeping:
+
+- a sparse confusion matrix {(predicted, actual): count}
+- per-species counts of feedback received as the prediction, confirmed
+  correct, and as the true species, for precision/recall estimates
+- confidence-bucket calibration counts (mean confidence vs observed accuracy)
+- symmetric confused-pair counts, so the worst pairs are a top-k over the
+  pairs seen rather than a scan of the feedback
+
+`python feedback_analytics.py --export PATH` writes the aggregates as JSON
+for the species-similarity and retraining pipelines.
+"""
+
+import argparse
+import heapq
+import json
+import threading
+from datetime import datetime
+
+from feedback_store import FEEDBACK_DIR, FeedbackLog, get_feedback_log
+
+CALIBRATION_BUCKETS = 10
+UNKNOWN_SPECIES = None  # 'incorrect' feedback without a correct_species
+
+
+def feedback_labels(entry):
+    """
+    (predicted, actual, confidence) of a feedback entry, or None if unusable.
+
+    actual is UNKNOWN_SPECIES for 'incorrect' feedback that names no species.
+    """
+    predicted = str(entry.get('predicted_species') or '').strip()
+    if not predicted:
+        return None
+    try:
+        confidence = min(max(float(entry.get('predicted_confidence', 0) or 0), 0.0), 1.0)
+    except (TypeError, ValueError):
+        confidence = 0.0
+    correct_species = str(entry.get('correct_species') or '').strip()
+    if entry.get('feedback_type') == 'correct':
+        actual = correct_species or predicted
+    elif entry.get('feedback_type') == 'incorrect':
+        actual = correct_species if correct_species and correct_species != predicted else UNKNOWN_SPECIES
+    else:
+        return None
+    return predicted, actual, confidence
+
+
+class FeedbackAnalytics:
+    """Incrementally maintained confusion matrix, per-species accuracy and calibration."""
+
+    def __init__(self, buckets=CALIBRATION_BUCKETS):
+        self.buckets = buckets
+        self.confusion = {}  # (predicted, actual) -> count, predicted != actual
+        self.pair_counts = {}  # (a, b) with a < b -> confusions in either direction
+        self.predicted_total = {}  # species -> feedback entries where it was the prediction
+        self.predicted_correct = {}  # species -> of which confirmed correct
+        self.actual_total = {}  # species -> feedback entries where it was the true species
+        self.bucket_count = [0] * buckets
+        self.bucket_correct = [0] * buckets
+        self.bucket_confidence = [0.0] * buckets
+        self.entries = 0
+        self.skipped = 0
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        """Fold one feedback entry into the aggregates."""
+        labels = feedback_labels(entry)
+        with self._lock:
+            if labels is None:
+                self.skipped += 1
+                return
+            predicted, actual, confidence = labels
+            correct = actual == predicted
+            self.entries += 1
+            self.predicted_total[predicted] = self.predicted_total.get(predicted, 0) + 1
+            if correct:
+                self.predicted_correct[predicted] = self.predicted_correct.get(predicted, 0) + 1
+            if actual is not UNKNOWN_SPECIES:
+                self.actual_total[actual] = self.actual_total.get(actual, 0) + 1
+                if not correct:
+                    self.confusion[(predicted, actual)] = self.confusion.get((predicted, actual), 0) + 1
+                    pair = (predicted, actual) if predicted < actual else (actual, predicted)
+                    self.pair_counts[pair] = self.pair_counts.get(pair, 0) + 1
+
+            bucket = min(int(confidence * self.buckets), self.buckets - 1)
+            self.bucket_count[bucket] += 1
+            self.bucket_confidence[bucket] += confidence
+            if correct:
+                self.bucket_correct[bucket] += 1
+            self.updated_at = datetime.now().isoformat()
+
+    def load(self, entries):
+        for entry in entries:
+            self.add(entry)
+        return self
+
+    def worst_confused_pairs(self, limit=10):
+        """Most often confused species pairs (either direction), with both directional counts."""
+        with self._lock:
+            top = heapq.nlargest(limit, self.pair_counts.items(), key=lambda item: item[1])
+            return [{
+                'species_a': a,
+                'species_b': b,
+                'count': count,
+                'a_predicted_as_b': self.confusion.get((a, b), 0),
+                'b_predicted_as_a': self.confusion.get((b, a), 0)
+            } for (a, b), count in top]
+
+    def species_accuracy(self, min_feedback=1):
+        """
+        Per-species precision (feedback on predictions of it) and recall (feedback on it as true species).
+
+        precision_estimate uses a uniform Beta(1, 1) prior, so species with little
+        feedback are pulled towards 0.5 instead of reporting 0% or 100%.
+        """
+        with self._lock:
+            species = set(self.predicted_total) | set(self.actual_total)
+            rows = []
+            for name in species:
+                predicted = self.predicted_total.get(name, 0)
+                if predicted + self.actual_total.get(name, 0) < min_feedback:
+                    continue
+                correct = self.predicted_correct.get(name, 0)
+                actual = self.actual_total.get(name, 0)
+                rows.append({
+                    'species': name,
+                    'predicted': predicted,
+                    'correct': correct,
+                    'precision': correct / predicted if predicted else None,
+                    'precision_estimate': (correct + 1) / (predicted + 2),
+                    'actual': actual,
+                    'recall': correct / actual if actual else None
+                })
+        rows.sort(key=lambda row: (row['precision_estimate'], row['species']))
+        return rows
+
+    def calibration(self):
+        """Per confidence bucket: count, mean confidence and observed accuracy; plus expected calibration error."""
+        with self._lock:
+            total = sum(self.bucket_count)
+            rows = []
+            ece = 0.0
+            for bucket in range(self.buckets):
+                count = self.bucket_count[bucket]
+                mean_confidence = self.bucket_confidence[bucket] / count if count else None
+                accuracy = self.bucket_correct[bucket] / count if count else None
+                if count:
+                    ece += count / total * abs(accuracy - mean_confidence)
+                rows.append({
+                    'range': [bucket / self.buckets, (bucket + 1) / self.buckets],
+                    'count': count,
+                    'mean_confidence': mean_confidence,
+                    'accuracy': accuracy
+                })
+            return {'buckets': rows, 'expected_calibration_error': ece if total else None}
+
+    def summary(self):
+        with self._lock:
+            correct = sum(self.predicted_correct.values())
+            return {
+                'entries': self.entries,
+                'skipped': self.skipped,
+                'accuracy': correct / self.entries if self.entries else None,
+                'species': len(set(self.predicted_total) | set(self.actual_total)),
+                'confused_pairs': len(self.pair_counts),
+                'updated_at': self.updated_at
+            }
+
+    def export(self):
+        """All aggregates as a JSON-serializable dict."""
+        with self._lock:
+            confusion = [{'predicted': p, 'actual': a, 'count': c}
+                         for (p, a), c in sorted(self.confusion.items(), key=lambda item: -item[1])]
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'summary': self.summary(),
+            'confusion': confusion,
+            'confused_pairs': self.worst_confused_pairs(limit=len(self.pair_counts)),
+            'species_accuracy': self.species_accuracy(),
+            'calibration': self.calibration()
+        }
+
+
+# Global instance
+_feedback_analytics = None
+_feedback_analytics_lock = threading.Lock()
+
+
+def get_feedback_analytics():
+    """Get or build the analytics (replays the feedback log once, then follows new entries)."""
+    global _feedback_analytics
+    with _feedback_analytics_lock:
+        if _feedback_analytics is None:
+            log = get_feedback_log()
+            analytics = FeedbackAnalytics()
+            # Subscribe before replaying; an entry written in between may be counted twice,
+            # which is acceptable for these estimates
+            log.add_listener(analytics.add)
+            analytics.load(log.iter_entries())
+            print(f"✅ Feedback analytics: {analytics.entries} entries")
+            _feedback_analytics = analytics
+        return _feedback_analytics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export feedback analytics')
+    parser.add_argument('--dir', default=FEEDBACK_DIR, help='Feedback directory')
+    parser.add_argument('--export', metavar='PATH', default='feedback_analytics.json')
+    args = parser.parse_args()
+
+    analytics = FeedbackAnalytics().load(FeedbackLog(args.dir).iter_entries())
+    with open(args.export, 'w', encoding='utf-8') as f:
+        json.dump(analytics.export(), f, indent=2, ensure_ascii=False)
+    print(f"✅ Exported analytics for {analytics.entries} feedback entries to {args.export}")
@@ -0,0 +1,288 @@
+"""
+Append-only feedback log.
+
+/api/feedback used to load feedback/feedback.json, append one entry, rewrite
+the whole file and truncate it to the last 1000 entries; concurrent posts
+could overwrite each other. FeedbackLog instead appends one JSON line per
+entry to feedback/feedback.jsonl from a single writer thread:
+
+- Entries are queued by request threads and written in batches, with one
+  fsync per batch (at most FEEDBACK_FSYNC_INTERVAL seconds after a write)
+- Writes, rotation and compaction hold an exclusive file lock
+  (feedback/.lock), so the CLI below can run next to the server; a writer
+  whose active file was rotated by another process reopens it
+- Past FEEDBACK_MAX_BYTES the active file is rotated to a timestamped
+  segment; nothing is dropped
+- Listeners (e.g. feedback analytics) are called with each written entry
+
+The legacy feedback.json array is read as the oldest segment.
+
+    python feedback_store.py --export feedback_export.json   # JSON view for analysis
+    python feedback_store.py --compact                       # merge rotated segments
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows: the single writer thread still serializes this process
+    FCNTL_AVAILABLE = False
+
+FEEDBACK_DIR = os.environ.get('FEEDBACK_DIR', 'feedback')
+FEEDBACK_MAX_BYTES = int(os.environ.get('FEEDBACK_MAX_BYTES', 5 * 1024 * 1024))
+FEEDBACK_FSYNC_INTERVAL = float(os.environ.get('FEEDBACK_FSYNC_INTERVAL', 1.0))
+ACTIVE_FILE = 'feedback.jsonl'
+LEGACY_FILE = 'feedback.json'
+ARCHIVE_FILE = 'feedback-archive.jsonl'
+SEGMENT_PATTERN = 'feedback-2*.jsonl'  # feedback-YYYYmmdd-HHMMSS-ffffff.jsonl
+MAX_BATCH = 256
+
+
+class FeedbackLog:
+    """JSONL feedback log with a single writer thread, batched fsync and size-based rotation."""
+
+    def __init__(self, directory=FEEDBACK_DIR, max_bytes=FEEDBACK_MAX_BYTES, fsync_interval=FEEDBACK_FSYNC_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.active_path = os.path.join(directory, ACTIVE_FILE)
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue()
+        self._listeners = []
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self.written = 0
+        self.write_failures = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        atexit.register(self.flush)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add_listener(self, callback):
+        """callback(entry) runs on the writer thread after each entry is written."""
+        self._listeners.append(callback)
+
+    def append(self, entry):
+        """Queue an entry for writing; returns immediately."""
+        self._queue.put(entry)
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='feedback-writer', daemon=True)
+                self._worker.start()
+
+    def flush(self, timeout=5.0):
+        """Wait until queued entries have been written and synced."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def _run(self):
+        handle = None
+        last_sync = 0.0
+        dirty = False
+        while True:
+            try:
+                # Wake up in time to sync a pending batch
+                batch = [self._queue.get(timeout=self.fsync_interval if dirty else None)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                with self._file_lock():
+                    if batch:
+                        handle = self._reopen_if_moved(handle)
+                        handle = self._rotate_if_needed(handle)
+                        if handle is None:
+                            handle = open(self.active_path, 'a', encoding='utf-8')
+                        for entry in batch:
+                            handle.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+                        handle.flush()
+                        dirty = True
+                    if dirty and (not batch or time.time() - last_sync >= self.fsync_interval
+                                  or self._queue.empty()):
+                        os.fsync(handle.fileno())
+                        self.fsyncs += 1
+                        last_sync = time.time()
+                        dirty = False
+                self.written += len(batch)
+                written = batch
+            except Exception as e:
+                self.write_failures += len(batch)
+                print(f"❌ Failed to write feedback: {e}")
+                written = []
+                dirty = False
+                if handle is not None:
+                    handle.close()
+                    handle = None
+
+            for entry in written:
+                for listener in self._listeners:
+                    try:
+                        listener(entry)
+                    except Exception as e:
+                        print(f"⚠️ Feedback listener failed: {e}")
+            for _ in batch:
+                self._queue.task_done()
+
+    def _reopen_if_moved(self, handle):
+        """
+        Drop the handle if the active file was rotated or compacted away by
+        another process since it was opened (caller holds the file lock).
+        """
+        if handle is None:
+            return None
+        try:
+            if os.fstat(handle.fileno()).st_ino == os.stat(self.active_path).st_ino:
+                return handle
+        except FileNotFoundError:
+            pass
+        # Entries already written there belong to the renamed segment; make them durable
+        os.fsync(handle.fileno())
+        handle.close()
+        return None
+
+    def _rotate_if_needed(self, handle):
+        """Rotate the active file past max_bytes (caller holds the file lock)."""
+        try:
+            size = os.path.getsize(self.active_path)
+        except OSError:
+            return handle
+        if size < self.max_bytes:
+            return handle
+        if handle is not None:
+            handle.flush()
+            os.fsync(handle.fileno())
+            handle.close()
+        segment = f"feedback-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl"
+        os.replace(self.active_path, os.path.join(self.directory, segment))
+        self.rotations += 1
+        print(f"🔄 Feedback log rotated to {segment}")
+        return None
+
+    def segment_paths(self):
+        """Log files oldest first: archive, rotated segments, active file."""
+        paths = [os.path.join(self.directory, ARCHIVE_FILE)]
+        paths += sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+        paths.append(self.active_path)
+        return [path for path in paths if os.path.exists(path)]
+
+    @staticmethod
+    def _read_segment(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partial last line
+                    print(f"⚠️ Skipping malformed feedback line {path}:{line_number}")
+
+    def iter_entries(self):
+        """All feedback entries, oldest first (including the legacy feedback.json)."""
+        legacy_path = os.path.join(self.directory, LEGACY_FILE)
+        if os.path.exists(legacy_path):
+            try:
+                with open(legacy_path, 'r', encoding='utf-8') as f:
+                    yield from json.load(f)
+            except Exception as e:
+                print(f"Warning: Failed to load legacy feedback: {e}")
+        for path in self.segment_paths():
+            yield from self._read_segment(path)
+
+    def export_json(self, output_path):
+        """Write every entry as one JSON array (the old feedback.json view, untruncated)."""
+        entries = list(self.iter_entries())
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2, ensure_ascii=False)
+        return len(entries)
+
+    def compact(self):
+        """Merge the archive and rotated segments into one archive file; returns the entry count."""
+        with self._file_lock():
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            segments = sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+            sources = ([archive_path] if os.path.exists(archive_path) else []) + segments
+            temp_path = archive_path + '.tmp'
+            count = 0
+            with open(temp_path, 'w', encoding='utf-8') as out:
+                for path in sources:
+                    for entry in self._read_segment(path):
+                        out.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+                        count += 1
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(temp_path, archive_path)
+            for path in segments:
+                os.remove(path)
+        return count
+
+    def stats(self):
+        paths = self.segment_paths()
+        return {
+            'directory': self.directory,
+            'segments': len(paths),
+            'bytes': sum(os.path.getsize(path) for path in paths),
+            'pending': self._queue.unfinished_tasks,
+            'written': self.written,
+            'write_failures': self.write_failures,
+            'fsyncs': self.fsyncs,
+            'rotations': self.rotations
+        }
+
+
+# Global instance
+_feedback_log = None
+_feedback_log_lock = threading.Lock()
+
+
+def get_feedback_log():
+    """Get or create the feedback log."""
+    global _feedback_log
+    with _feedback_log_lock:
+        if _feedback_log is None:
+            _feedback_log = FeedbackLog()
+        return _feedback_log
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Feedback log maintenance')
+    parser.add_argument('--dir', default=FEEDBACK_DIR, help='Feedback directory')
+    parser.add_argument('--export', metavar='PATH', help='Write all entries as a JSON array')
+    parser.add_argument('--compact', action='store_true', help='Merge rotated segments into the archive')
+    args = parser.parse_args()
+
+    log = FeedbackLog(args.dir)
+    if args.compact:
+        print(f"✅ Compacted {log.compact()} entries into {os.path.join(args.dir, ARCHIVE_FILE)}")
+    if args.export:
+        print(f"✅ Exported {log.export_json(args.export)} entries to {args.export}")
+    if not args.compact and not args.export:
+        parser.print_help()
@@ -0,0 +1,120 @@
+"""
+Uploaded images kept for feedback-driven retraining.
+
+/api/predict deletes its upload once predicted. Keeping user photos is
+opt-in: with FEEDBACK_UPLOAD_RETENTION > 0 the most recent uploads are
+instead moved to feedback/pending_uploads (oldest pruned first), and the
+client is told so (upload_id in the response). Enable it only where users
+have been informed that their photos are kept.
+
+Pending uploads are renamed to a random upload id, which /api/predict
+returns and feedback sends back; the original filename is never exposed,
+so an upload cannot be labeled by anyone who did not receive its id. When
+feedback names the true species, the upload is filed under
+feedback/labeled_uploads/<species>/, where models/training/retrain_head.py
+picks it up. At most FEEDBACK_LABELED_MAX labeled images are kept (oldest
+pruned first).
+"""
+
+import os
+import re
+import secrets
+import threading
+
+from feedback_store import FEEDBACK_DIR
+
+FEEDBACK_UPLOAD_RETENTION = int(os.environ.get('FEEDBACK_UPLOAD_RETENTION', 0))
+FEEDBACK_LABELED_MAX = int(os.environ.get('FEEDBACK_LABELED_MAX', 2000))
+PENDING_DIR = os.path.join(FEEDBACK_DIR, 'pending_uploads')
+LABELED_DIR = os.path.join(FEEDBACK_DIR, 'labeled_uploads')
+
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{22}\.[a-z0-9]{1,5}$')
+
+_lock = threading.Lock()
+# File counts reported by stats(), refreshed whenever uploads are retained or labeled (None: not counted yet)
+_counts = {'pending': None, 'labeled': None}
+
+
+def _count_files(directory):
+    return sum(len(files) for _, _, files in os.walk(directory)) if os.path.exists(directory) else 0
+
+
+def _prune_oldest(paths, keep):
+    """Delete all but the keep most recently modified files; returns the number left."""
+    entries = []
+    for path in paths:
+        try:
+            entries.append((os.stat(path).st_mtime, path))
+        except OSError:
+            pass
+    entries.sort()
+    for _, path in entries[:max(len(entries) - keep, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return min(len(entries), keep)
+
+
+def retain_upload(filepath):
+    """
+    Move a predicted upload into the pending directory under a random upload id.
+
+    Returns:
+        The upload id if kept, None if retention is disabled (the caller deletes the file)
+    """
+    if FEEDBACK_UPLOAD_RETENTION <= 0:
+        return None
+    extension = os.path.splitext(filepath)[1].lower() or '.jpg'
+    upload_id = secrets.token_urlsafe(16) + extension
+    os.makedirs(PENDING_DIR, exist_ok=True)
+    os.replace(filepath, os.path.join(PENDING_DIR, upload_id))
+    with _lock:
+        _counts['pending'] = _prune_oldest([entry.path for entry in os.scandir(PENDING_DIR)],
+                                           FEEDBACK_UPLOAD_RETENTION)
+    return upload_id
+
+
+def label_upload(upload_id, species, known_species):
+    """
+    File a pending upload under its true species.
+
+    Only species the image model knows are accepted (the retrained head has
+    one output per class); anything else leaves the upload pending.
+
+    Returns:
+        Path of the labeled image, or None
+    """
+    upload_id = str(upload_id or '')
+    if not UPLOAD_ID_PATTERN.match(upload_id) or species not in known_species:
+        return None
+    source = os.path.join(PENDING_DIR, upload_id)
+    if not os.path.exists(source):
+        return None
+    species_dir = os.path.join(LABELED_DIR, species)
+    os.makedirs(species_dir, exist_ok=True)
+    target = os.path.join(species_dir, upload_id)
+    os.replace(source, target)
+    with _lock:
+        _counts['labeled'] = _prune_oldest(
+            [os.path.join(root, name) for root, _, files in os.walk(LABELED_DIR) for name in files],
+            FEEDBACK_LABELED_MAX
+        )
+        if _counts['pending']:
+            _counts['pending'] -= 1
+    return target
+
+
+def stats():
+    """Upload counts for /api/health; the directories are only walked the first time."""
+    with _lock:
+        if _counts['pending'] is None:
+            _counts['pending'] = _count_files(PENDING_DIR)
+        if _counts['labeled'] is None:
+            _counts['labeled'] = _count_files(LABELED_DIR)
+        return {
+            'retention': FEEDBACK_UPLOAD_RETENTION,
+            'labeled_max': FEEDBACK_LABELED_MAX,
+            'pending': _counts['pending'],
+            'labeled': _counts['labeled']
+        }
@@ -7,6 +7,12 @@ Usage:
     
     generator = InterpretationGenerator('models/interpretation_model')
     result = generator.generate("Taiwan Blue Magpie", "fun_fact")
+
+Pre-generate the lookup table served by the chat assistant:
+    python generate_interpretation_en.py --build-table --variants 3
+
+Compare fp32 and int8 generation speed and memory on CPU:
+    python generate_interpretation_en.py --benchmark
 """
 
 import torch
@@ -14,22 +20,35 @@ from transformers import GPT2LMHeadModel, GPT2Tokenizer
 import os
 import json
 
+from generation_engine import (BatchingGenerator, GenerationEngine, GenerationRequest, benchmark_engine,
+                               current_rss_bytes, model_size_bytes, quantize_model)
+
+# Dynamic int8 quantization on CPU (set INTERPRETATION_QUANTIZE=0 to disable)
+QUANTIZE_ON_CPU = os.environ.get('INTERPRETATION_QUANTIZE', '1') == '1'
+# Seconds a single generation may take before the partial text is returned (0 = no limit)
+DEFAULT_TIME_BUDGET = float(os.environ.get('INTERPRETATION_TIME_BUDGET', 8.0))
+MAX_BATCH_SIZE = int(os.environ.get('INTERPRETATION_MAX_BATCH', 4))
+
 class InterpretationGenerator:
     """Interpretation text generator"""
     
-    def __init__(self, model_path='models/interpretation_model', device='cpu'):
+    def __init__(self, model_path='models/interpretation_model', device='cpu', quantize=None):
         """
         Initialize generator
         
         Args:
             model_path: Path to trained model
             device: Device to run on
+            quantize: Apply dynamic int8 quantization (default: on for CPU, see INTERPRETATION_QUANTIZE)
         """
         self.device = torch.device(device)
         self.model_path = model_path
         self.model = None
         self.tokenizer = None
         self.loaded = False
+        self.quantize = (QUANTIZE_ON_CPU and self.device.type == 'cpu') if quantize is None else quantize
+        self.engine = None
+        self.batcher = None
         
         # Load species name mapping
         self.species_mapping = self._load_species_mapping()
@@ -62,8 +81,15 @@ class InterpretationGenerator:
             self.model = GPT2LMHeadModel.from_pretrained(self.model_path)
             self.model.to(self.device)
             self.model.eval()
+            if self.quantize:
+                size_before = model_size_bytes(self.model)
+                self.model = quantize_model(self.model)
+                print(f"   int8 dynamic quantization: {size_before / 1e6:.0f} MB -> "
+                      f"{model_size_bytes(self.model) / 1e6:.0f} MB")
+            self.engine = GenerationEngine(self.model, self.tokenizer, self.device)
+            self.batcher = BatchingGenerator(self.engine, max_batch_size=MAX_BATCH_SIZE)
             self.loaded = True
-            print(f"✅ Model loaded successfully (device: {self.device})")
+            print(f"✅ Model loaded successfully (device: {self.device}, quantized: {self.quantize})")
             return True
         except Exception as e:
             print(f"❌ Model loading failed: {e}")
@@ -71,6 +97,11 @@ class InterpretationGenerator:
             traceback.print_exc()
             return False
     
+    def build_prompt(self, species, category):
+        """Input text in the same format as training"""
+        species_en = self._convert_species_name(species)
+        return f"Species: {species_en}, Category: {category}, Interpretation:"
+    
     def generate(
         self,
         species,
@@ -78,18 +109,28 @@ class InterpretationGenerator:
         max_length=256,
         temperature=0.7,
         top_p=0.9,
-        num_return_sequences=1
+        num_return_sequences=1,
+        time_budget=None,
+        on_token=None,
+        should_stop=None,
+        return_details=False
     ):
         """
         Generate interpretation text
         
+        Concurrent calls are batched into one padded generation loop.
+        
         Args:
             species: Species name (Chinese or English)
             category: Category (e.g., "fun_fact", "behavior", "habitat")
-            max_length: Maximum generation length
+            max_length: Maximum generation length (prompt + generated tokens)
             temperature: Temperature parameter (controls randomness)
             top_p: Nucleus sampling parameter (controls diversity)
-            num_return_sequences: Number of sequences to generate
+            num_return_sequences: Number of sequences to sample (the first is returned)
+            time_budget: Seconds before returning the partial text (default: INTERPRETATION_TIME_BUDGET)
+            on_token: Callback receiving each new piece of text (for streaming)
+            should_stop: Callback returning True to cancel generation
+            return_details: Return the result dict (text, tokens, finish_reason, truncated, elapsed)
         
         Returns:
             generated_text: Generated interpretation text in English, None if failed
@@ -99,39 +140,36 @@ class InterpretationGenerator:
                 return None
         
         try:
-            # Convert species name to English if needed
-            species_en = self._convert_species_name(species)
-            
-            # Build input text (same format as training)
-            input_text = f"Species: {species_en}, Category: {category}, Interpretation:"
+            input_text = self.build_prompt(species, category)
+            prompt_tokens = len(self.tokenizer.encode(input_text))
+            if time_budget is None:
+                time_budget = DEFAULT_TIME_BUDGET
             
-            # Encode input
-            input_ids = self.tokenizer.encode(input_text, return_tensors='pt').to(self.device)
-            
-            # Generate text
-            with torch.no_grad():
-                output = self.model.generate(
-                    input_ids=input_ids,
-                    max_length=max_length,
-                    num_return_sequences=num_return_sequences,
+            requests = [
+                self.batcher.submit(GenerationRequest(
+                    input_text,
+                    max_new_tokens=max(1, max_length - prompt_tokens),
                     temperature=temperature,
                     top_p=top_p,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=1.2
-                )
-            
-            # Decode generated text
-            generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
-            
-            # Remove input part, keep only generated part
-            generated_text = generated_text.replace(input_text, "").strip()
+                    repetition_penalty=1.2,
+                    time_budget=time_budget or None,
+                    on_token=on_token if i == 0 else None,
+                    should_stop=should_stop
+                ))
+                for i in range(num_return_sequences)
+            ]
+            for request in requests:
+                request.done.wait()
+            result = requests[0].result
+            if result is None:
+                return None
             
             # Clean text (remove special characters and extra spaces)
-            generated_text = generated_text.replace("\n", " ").strip()
+            result['text'] = result['text'].replace("\n", " ").strip()
+            if result['truncated']:
+                print(f"⏱️ Generation stopped early ({result['finish_reason']}) after {result['tokens']} tokens")
             
-            return generated_text
+            return result if return_details else result['text']
             
         except Exception as e:
             print(f"❌ Generation failed: {e}")
@@ -139,6 +177,114 @@ class InterpretationGenerator:
             traceback.print_exc()
             return None
 
+    def get_stats(self):
+        """Generation counters (tokens/sec across all batches)"""
+        if self.engine is None:
+            return {'loaded': self.loaded}
+        return {
+            'loaded': self.loaded,
+            'quantized': self.quantize,
+            'generated_tokens': self.engine.generated_tokens,
+            'batches': self.engine.batches,
+            'tokens_per_second': round(self.engine.tokens_per_second(), 1)
+        }
+
+def benchmark_generation(model_path='models/interpretation_model', max_new_tokens=64, batch_sizes=(1, 4)):
+    """
+    Compare full-precision and int8 generation on CPU
+    
+    Prints model size, process RSS and tokens/sec for each configuration.
+    """
+    mapping = InterpretationGenerator(model_path, 'cpu', quantize=False)
+    prompts = [mapping.build_prompt(species, 'fun_fact') for species in list(mapping.species_mapping)[:4]] or \
+              ["Species: Taiwan Blue Magpie, Category: fun_fact, Interpretation:"]
+    
+    results = []
+    for quantize in (False, True):
+        rss_before = current_rss_bytes()
+        generator = InterpretationGenerator(model_path, 'cpu', quantize=quantize)
+        if not generator.load_model():
+            return None
+        rss_after = current_rss_bytes()
+        report = benchmark_engine(generator.engine, prompts, max_new_tokens=max_new_tokens,
+                                  batch_sizes=batch_sizes)
+        results.append((quantize, model_size_bytes(generator.model), rss_before, rss_after, report))
+        del generator
+    
+    print("\n" + "=" * 72)
+    print(f"{'weights':<10}{'size MB':>10}{'RSS +MB':>10}{'batch':>8}{'tokens':>8}{'tokens/sec':>14}")
+    print("-" * 72)
+    for quantize, size, rss_before, rss_after, report in results:
+        rss_delta = (rss_after - rss_before) / 1e6 if rss_before and rss_after else float('nan')
+        for row in report:
+            print(f"{'int8' if quantize else 'fp32':<10}{size / 1e6:>10.0f}{rss_delta:>10.0f}"
+                  f"{row['batch_size']:>8}{row['tokens']:>8}{row['tokens_per_second']:>14.1f}")
+    print("=" * 72)
+    return results
+
+def build_interpretation_table(
+    generator,
+    output_path='interpretation_table.json.gz',
+    species_names=None,
+    categories=None,
+    variants=3,
+    max_length=256,
+    temperature=0.7,
+    top_p=0.9
+):
+    """
+    Pre-generate interpretation texts for every (species, category) pair
+    
+    Args:
+        generator: Loaded InterpretationGenerator
+        output_path: Lookup table file (gzip-compressed JSON), read by interpretation_cache.py
+        species_names: English species names (default: all values of species_name_mapping.json)
+        categories: Categories to generate (default: fun_fact, behavior, habitat)
+        variants: Number of different texts per (species, category)
+    
+    Returns:
+        entries: {species_en: {category: [text, ...]}}
+    """
+    from interpretation_cache import CATEGORIES, save_table
+    
+    if species_names is None:
+        species_names = sorted(set(generator.species_mapping.values()))
+    categories = categories or CATEGORIES
+    
+    entries = {}
+    total = len(species_names) * len(categories)
+    done = 0
+    for species_en in species_names:
+        for category in categories:
+            texts = []
+            # Sampling can repeat itself; allow a few extra attempts to collect distinct variants
+            for _ in range(variants * 2):
+                if len(texts) >= variants:
+                    break
+                # No time budget offline: a text cut off mid-sentence must never enter the table
+                result = generator.generate(species_en, category, max_length=max_length,
+                                            temperature=temperature, top_p=top_p,
+                                            time_budget=0, return_details=True)
+                if not result or result['truncated']:
+                    continue
+                text = result['text']
+                if text and len(text) > 10 and text not in texts:
+                    texts.append(text)
+            if texts:
+                entries.setdefault(species_en, {})[category] = texts
+            done += 1
+            print(f"   [{done}/{total}] {species_en} - {category}: {len(texts)} variants")
+    
+    save_table(entries, output_path, metadata={
+        'model_path': generator.model_path,
+        'variants': variants,
+        'max_length': max_length,
+        'temperature': temperature,
+        'top_p': top_p
+    })
+    print(f"✅ Interpretation table saved to {output_path} ({os.path.getsize(output_path)} bytes)")
+    return entries
+
 # Global generator instance (singleton pattern)
 _global_generator = None
 
@@ -162,6 +308,33 @@ def get_generator(model_path='models/interpretation_model', device='cpu'):
     return _global_generator
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Generate interpretation text')
+    parser.add_argument('--model-path', default='models/interpretation_model', help='Trained model path')
+    parser.add_argument('--build-table', action='store_true',
+                        help='Pre-generate texts for all species in species_name_mapping.json')
+    parser.add_argument('--output', default='interpretation_table.json.gz', help='Lookup table output path')
+    parser.add_argument('--variants', type=int, default=3, help='Texts per (species, category)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Report size, memory and tokens/sec for fp32 vs int8 on CPU')
+    args = parser.parse_args()
+    
+    if args.benchmark:
+        benchmark_generation(args.model_path)
+        raise SystemExit(0)
+    
+    if args.build_table:
+        print("=" * 60)
+        print("📦 Building Interpretation Lookup Table")
+        print("=" * 60)
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        generator = InterpretationGenerator(model_path=args.model_path, device=device)
+        if not generator.load_model():
+            raise SystemExit("❌ Model could not be loaded (train it first with train_model.py)")
+        build_interpretation_table(generator, output_path=args.output, variants=args.variants)
+        raise SystemExit(0)
+    
     # Test generation
     print("=" * 60)
     print("🧪 Testing Interpretation Text Generation")
@@ -170,7 +343,7 @@ if __name__ == "__main__":
     # Create generator
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     generator = InterpretationGenerator(
-        model_path='models/interpretation_model',
+        model_path=args.model_path,
         device=device
     )
     
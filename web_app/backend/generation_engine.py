@@ -0,0 +1,311 @@
+"""
+CPU-oriented generation engine for the GPT-2 interpretation model.
+
+- Dynamic int8 quantization of the transformer's linear layers (GPT-2 stores
+  them as Conv1D, which are converted to nn.Linear first)
+- A sampling loop that feeds only the newest token per step and reuses the
+  KV cache (past_key_values)
+- Batching: concurrent requests are collected for a few milliseconds and run
+  as one left-padded batch, one forward pass per step for all of them
+- A per-request time budget; when it runs out the text generated so far is
+  returned with truncated=True
+- Per-token callbacks and cancellation, for streaming responses
+
+Used by generate_interpretation_en.InterpretationGenerator.
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+
+import torch
+
+
+def convert_conv1d_to_linear(module):
+    """Replace GPT-2 Conv1D layers (weight shape in x out) with equivalent nn.Linear layers in place."""
+    try:
+        from transformers.pytorch_utils import Conv1D
+    except ImportError:  # older transformers
+        from transformers.modeling_utils import Conv1D
+
+    for parent in list(module.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data.clone()
+                setattr(parent, name, linear)
+    return module
+
+
+def quantize_model(model):
+    """
+    Apply dynamic int8 quantization to the transformer blocks.
+
+    The LM head is left in float32 so it stays tied to the token embeddings.
+    """
+    model.transformer = torch.quantization.quantize_dynamic(
+        convert_conv1d_to_linear(model.transformer), {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return model
+
+
+def model_size_bytes(model):
+    """Serialized size of the model weights (works for quantized modules too)."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or None if it cannot be determined."""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class GenerationRequest:
+    """One prompt submitted to the engine, and its result once finished."""
+
+    def __init__(self, prompt, max_new_tokens=200, temperature=0.7, top_p=0.9, repetition_penalty=1.2,
+                 time_budget=None, on_token=None, should_stop=None):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.deadline = time.perf_counter() + time_budget if time_budget else None
+        self.on_token = on_token  # called with each new piece of decoded text
+        self.should_stop = should_stop  # returns True to cancel (e.g. client disconnected)
+        self.done = threading.Event()
+        self.result = None
+
+    def finish(self, result):
+        self.result = result
+        self.done.set()
+
+
+class GenerationEngine:
+    """Batched sampling loop with KV-cache reuse."""
+
+    def __init__(self, model, tokenizer, device='cpu'):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = torch.device(device)
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.eos_token_id
+        # Counters for the tokens/sec report
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+        self.batches = 0
+
+    def tokens_per_second(self):
+        return self.generated_tokens / self.generation_seconds if self.generation_seconds else 0.0
+
+    def _prepare_batch(self, requests):
+        """Left-pad the prompts so the newest token of every row is in the last column."""
+        encoded = [self.tokenizer.encode(request.prompt) for request in requests]
+        width = max(len(ids) for ids in encoded)
+        input_ids = torch.full((len(encoded), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(encoded), width), dtype=torch.long)
+        # Padding positions repeat a real prompt token so the repetition penalty ignores them
+        penalty_ids = torch.empty((len(encoded), width), dtype=torch.long)
+        for row, ids in enumerate(encoded):
+            input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, width - len(ids):] = 1
+            penalty_ids[row] = ids[0]
+            penalty_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        return input_ids, attention_mask, penalty_ids
+
+    @staticmethod
+    def _apply_repetition_penalty(logits, penalty_ids, penalties):
+        scores = torch.gather(logits, 1, penalty_ids)
+        scores = torch.where(scores < 0, scores * penalties, scores / penalties)
+        return logits.scatter(1, penalty_ids, scores)
+
+    @staticmethod
+    def _sample(logits, temperatures, top_ps):
+        """Nucleus sampling with per-row temperature and top_p (temperature 0 = greedy)."""
+        greedy = temperatures <= 0
+        logits = logits / torch.where(greedy, torch.ones_like(temperatures), temperatures)
+        probs = torch.softmax(logits, dim=-1)
+        sorted_probs, sorted_ids = torch.sort(probs, descending=True, dim=-1)
+        cumulative = torch.cumsum(sorted_probs, dim=-1)
+        sorted_probs = sorted_probs.masked_fill(cumulative - sorted_probs > top_ps, 0.0)
+        choice = torch.multinomial(sorted_probs / sorted_probs.sum(dim=-1, keepdim=True), 1)
+        sampled = torch.gather(sorted_ids, 1, choice).squeeze(1)
+        return torch.where(greedy.squeeze(1), sorted_ids[:, 0], sampled)
+
+    def _decode(self, token_ids):
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+
+    @torch.no_grad()
+    def run(self, requests):
+        """
+        Generate for a batch of requests in one padded loop.
+
+        Each request is finished with a result dict:
+        {'text', 'tokens', 'finish_reason' ('eos' | 'length' | 'time_budget' | 'cancelled'),
+         'truncated', 'elapsed'}
+        """
+        start = time.perf_counter()
+        batch_size = len(requests)
+        input_ids, attention_mask, penalty_ids = self._prepare_batch(requests)
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        penalty_ids = penalty_ids.to(self.device)
+        position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+
+        temperatures = torch.tensor([[r.temperature] for r in requests], dtype=torch.float32, device=self.device)
+        top_ps = torch.tensor([[r.top_p] for r in requests], dtype=torch.float32, device=self.device)
+        penalties = torch.tensor([[r.repetition_penalty] for r in requests], dtype=torch.float32,
+                                 device=self.device)
+
+        generated = [[] for _ in requests]
+        emitted = [''] * batch_size
+        finish_reasons = [None] * batch_size
+        max_steps = max(r.max_new_tokens for r in requests)
+        past_key_values = None
+        step_input = input_ids
+
+        for step in range(max_steps):
+            outputs = self.model(
+                input_ids=step_input,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past_key_values,
+                use_cache=True
+            )
+            past_key_values = outputs.past_key_values
+            logits = outputs.logits[:, -1, :].float()
+            logits = self._apply_repetition_penalty(logits, penalty_ids, penalties)
+            next_tokens = self._sample(logits, temperatures, top_ps)
+
+            now = time.perf_counter()
+            for row, request in enumerate(requests):
+                if finish_reasons[row] is not None:
+                    next_tokens[row] = self.pad_token_id
+                    continue
+                token = int(next_tokens[row])
+                if token == self.eos_token_id:
+                    finish_reasons[row] = 'eos'
+                    continue
+                generated[row].append(token)
+                if request.on_token is not None:
+                    text = self._decode(generated[row])
+                    # Byte-level BPE can end mid-character; wait for the rest of it
+                    if not text.endswith('�') and len(text) > len(emitted[row]):
+                        request.on_token(text[len(emitted[row]):])
+                        emitted[row] = text
+                if len(generated[row]) >= request.max_new_tokens:
+                    finish_reasons[row] = 'length'
+                elif request.should_stop is not None and request.should_stop():
+                    finish_reasons[row] = 'cancelled'
+                elif request.deadline is not None and now >= request.deadline:
+                    finish_reasons[row] = 'time_budget'
+
+            if all(reason is not None for reason in finish_reasons):
+                break
+
+            # Only the newest token is fed next step; earlier ones come from the KV cache
+            step_input = next_tokens.unsqueeze(1)
+            attention_mask = torch.cat([attention_mask, torch.ones((batch_size, 1), dtype=attention_mask.dtype,
+                                                                   device=self.device)], dim=1)
+            position_ids = position_ids[:, -1:] + 1
+            penalty_ids = torch.cat([penalty_ids, next_tokens.unsqueeze(1)], dim=1)
+
+        elapsed = time.perf_counter() - start
+        self.generated_tokens += sum(len(tokens) for tokens in generated)
+        self.generation_seconds += elapsed
+        self.batches += 1
+
+        for row, request in enumerate(requests):
+            reason = finish_reasons[row] or 'length'
+            request.finish({
+                'text': self._decode(generated[row]),
+                'tokens': len(generated[row]),
+                'finish_reason': reason,
+                'truncated': reason in ('time_budget', 'cancelled'),
+                'elapsed': elapsed
+            })
+
+
+class BatchingGenerator:
+    """Collects concurrent requests and runs them through the engine in batches."""
+
+    def __init__(self, engine, max_batch_size=4, batch_wait_ms=20):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, request):
+        """Queue a request; wait on request.done for the result."""
+        self._queue.put(request)
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='interpretation-batcher', daemon=True)
+                self._worker.start()
+        return request
+
+    def generate(self, prompt, **kwargs):
+        """Submit a prompt and block until its result is ready."""
+        request = self.submit(GenerationRequest(prompt, **kwargs))
+        request.done.wait()
+        return request.result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.engine.run(batch)
+            except Exception as e:
+                print(f"❌ Generation batch failed: {e}")
+                for request in batch:
+                    if not request.done.is_set():
+                        request.finish(None)
+
+
+def benchmark_engine(engine, prompts, max_new_tokens=64, batch_sizes=(1, 4)):
+    """
+    Measure generation throughput.
+
+    Returns:
+        List of dicts: {'batch_size', 'tokens', 'seconds', 'tokens_per_second'}
+    """
+    report = []
+    for batch_size in batch_sizes:
+        batch_prompts = (prompts * batch_size)[:batch_size]
+        requests = [GenerationRequest(p, max_new_tokens=max_new_tokens) for p in batch_prompts]
+        start = time.perf_counter()
+        engine.run(requests)
+        seconds = time.perf_counter() - start
+        tokens = sum(r.result['tokens'] for r in requests)
+        report.append({
+            'batch_size': batch_size,
+            'tokens': tokens,
+            'seconds': seconds,
+            'tokens_per_second': tokens / seconds if seconds else 0.0
+        })
+    return report
@@ -0,0 +1,283 @@
+"""
+Server-side identification history with incrementally maintained statistics.
+
+/api/predict and /api/predict-sound append every identification to an
+append-only SQLite table, keyed by the client's user/device id. The per-user
+aggregates /api/statistics reports (totals, confidence sums and buckets,
+category counts, per-species and per-day counts) are updated in the same
+transaction, so reading statistics costs the same for 10 or 100k records.
+
+Client histories kept in localStorage can be bulk-imported; items carry a
+client key (their id) so importing the same history twice is a no-op.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH', os.path.join('history', 'identification_history.db'))
+HIGH_CONFIDENCE = 90  # percent
+MEDIUM_CONFIDENCE = 70
+TOP_SPECIES_LIMIT = 10
+RECENT_DAYS = 7
+MAX_IMPORT_ITEMS = 10000
+
+_DAY_FORMATS = ('%m/%d/%Y', '%Y/%m/%d', '%Y-%m-%d')
+
+
+def day_bucket(timestamp=None):
+    """
+    ISO date (YYYY-MM-DD) for a timestamp.
+
+    Accepts epoch seconds/milliseconds, ISO strings and the client's
+    toLocaleString('en-US') format ('10/19/2026, 01:15:00 PM'); None is today.
+    Unrecognized strings keep their date part as-is.
+    """
+    if timestamp is None:
+        return date.today().isoformat()
+    if isinstance(timestamp, (int, float)):
+        seconds = timestamp / 1000.0 if timestamp > 1e11 else timestamp
+        return datetime.fromtimestamp(seconds).date().isoformat()
+    text = str(timestamp).strip()
+    try:
+        return datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        pass
+    date_part = text.split(',')[0].split(' ')[0]
+    for fmt in _DAY_FORMATS:
+        try:
+            return datetime.strptime(date_part, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return date_part
+
+
+class IdentificationHistoryStore:
+    """Append-only identification log plus per-user aggregate tables (SQLite, WAL)."""
+
+    def __init__(self, db_path=HISTORY_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(
+            'CREATE TABLE IF NOT EXISTS identifications ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' user_id TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' day TEXT NOT NULL,'
+            ' source TEXT NOT NULL,'
+            ' species TEXT,'
+            ' confidence REAL,'
+            ' category TEXT NOT NULL,'
+            ' client_key TEXT);'
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_identifications_client_key'
+            ' ON identifications (user_id, client_key) WHERE client_key IS NOT NULL;'
+            'CREATE TABLE IF NOT EXISTS user_totals ('
+            ' user_id TEXT PRIMARY KEY,'
+            ' total INTEGER NOT NULL,'
+            ' scored INTEGER NOT NULL,'
+            ' confidence_sum REAL NOT NULL,'
+            ' high INTEGER NOT NULL,'
+            ' medium INTEGER NOT NULL,'
+            ' low INTEGER NOT NULL,'
+            ' birds INTEGER NOT NULL,'
+            ' butterflies INTEGER NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS user_species ('
+            ' user_id TEXT NOT NULL,'
+            ' species TEXT NOT NULL,'
+            ' count INTEGER NOT NULL,'
+            ' confidence_sum REAL NOT NULL,'
+            ' first_seen INTEGER NOT NULL,'
+            ' PRIMARY KEY (user_id, species)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS idx_user_species_count'
+            ' ON user_species (user_id, count DESC, first_seen);'
+            'CREATE TABLE IF NOT EXISTS user_days ('
+            ' user_id TEXT NOT NULL,'
+            ' day TEXT NOT NULL,'
+            ' count INTEGER NOT NULL,'
+            ' PRIMARY KEY (user_id, day)) WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS store_totals ('
+            ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+            ' records INTEGER NOT NULL,'
+            ' users INTEGER NOT NULL);'
+        )
+        conn.commit()
+        with conn:
+            if conn.execute('SELECT 1 FROM store_totals').fetchone() is None:
+                # Databases created before store_totals existed: count once
+                conn.execute(
+                    'INSERT OR IGNORE INTO store_totals (id, records, users)'
+                    ' SELECT 0, (SELECT COUNT(*) FROM identifications), (SELECT COUNT(*) FROM user_totals)'
+                )
+
+    def _conn(self):
+        # One connection per thread; WAL lets readers and a writer work concurrently
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def record(self, user_id, species, confidence, category, source='image', timestamp=None, client_key=None):
+        """Append one identification. confidence is 0-1; category is 'birds', 'butterflies' or 'others'."""
+        return self.record_many(user_id, [{
+            'species': species,
+            'confidence': confidence,
+            'category': category,
+            'source': source,
+            'timestamp': timestamp,
+            'client_key': client_key
+        }])
+
+    def record_many(self, user_id, items):
+        """
+        Append identifications and fold them into the user's aggregates in one transaction.
+
+        Each item: {'species', 'confidence', 'category', 'source', 'timestamp', 'client_key'};
+        species/confidence may be None for items without a prediction. Items whose
+        client_key was already recorded for this user are skipped.
+
+        Returns:
+            Number of items recorded
+        """
+        now = time.time()
+        totals = {'total': 0, 'scored': 0, 'confidence_sum': 0.0, 'high': 0, 'medium': 0, 'low': 0,
+                  'birds': 0, 'butterflies': 0}
+        species_deltas = {}  # species -> [count, confidence_sum, first row id]
+        day_deltas = {}
+        conn = self._conn()
+        with conn:
+            for item in items:
+                species = item.get('species')
+                confidence = item.get('confidence')
+                category = item.get('category') or 'others'
+                day = day_bucket(item.get('timestamp'))
+                client_key = item.get('client_key')
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO identifications'
+                    ' (user_id, created_at, day, source, species, confidence, category, client_key)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (user_id, now, day, item.get('source', 'image'), species, confidence, category,
+                     None if client_key is None else str(client_key))
+                )
+                if cursor.rowcount == 0:
+                    continue
+
+                totals['total'] += 1
+                if category in ('birds', 'butterflies'):
+                    totals[category] += 1
+                day_deltas[day] = day_deltas.get(day, 0) + 1
+                if confidence is None:
+                    continue
+                percent = confidence * 100
+                totals['scored'] += 1
+                totals['confidence_sum'] += percent
+                if percent >= HIGH_CONFIDENCE:
+                    totals['high'] += 1
+                elif percent >= MEDIUM_CONFIDENCE:
+                    totals['medium'] += 1
+                else:
+                    totals['low'] += 1
+                if species is not None:
+                    delta = species_deltas.setdefault(species, [0, 0.0, cursor.lastrowid])
+                    delta[0] += 1
+                    delta[1] += confidence
+
+            if totals['total'] == 0:
+                return 0
+            new_user = conn.execute('SELECT 1 FROM user_totals WHERE user_id = ?', (user_id,)).fetchone() is None
+            conn.execute(
+                'INSERT INTO user_totals (user_id, total, scored, confidence_sum, high, medium, low, birds, butterflies)'
+                ' VALUES (:user_id, :total, :scored, :confidence_sum, :high, :medium, :low, :birds, :butterflies)'
+                ' ON CONFLICT (user_id) DO UPDATE SET'
+                ' total = total + excluded.total, scored = scored + excluded.scored,'
+                ' confidence_sum = confidence_sum + excluded.confidence_sum,'
+                ' high = high + excluded.high, medium = medium + excluded.medium, low = low + excluded.low,'
+                ' birds = birds + excluded.birds, butterflies = butterflies + excluded.butterflies',
+                dict(totals, user_id=user_id)
+            )
+            conn.executemany(
+                'INSERT INTO user_species (user_id, species, count, confidence_sum, first_seen) VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (user_id, species) DO UPDATE SET'
+                ' count = count + excluded.count, confidence_sum = confidence_sum + excluded.confidence_sum',
+                [(user_id, species, d[0], d[1], d[2]) for species, d in species_deltas.items()]
+            )
+            conn.executemany(
+                'INSERT INTO user_days (user_id, day, count) VALUES (?, ?, ?)'
+                ' ON CONFLICT (user_id, day) DO UPDATE SET count = count + excluded.count',
+                [(user_id, day, count) for day, count in day_deltas.items()]
+            )
+            conn.execute('UPDATE store_totals SET records = records + ?, users = users + ?',
+                         (totals['total'], int(new_user)))
+        return totals['total']
+
+    def get_statistics(self, user_id):
+        """
+        The user's statistics in the /api/statistics format, or None if nothing was recorded.
+
+        Reads one totals row, the top species and the most recent days, all by index.
+        """
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT total, scored, confidence_sum, high, medium, low, birds, butterflies'
+            ' FROM user_totals WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        total, scored, confidence_sum, high, medium, low, birds, butterflies = row
+        unique_species = conn.execute(
+            'SELECT COUNT(*) FROM user_species WHERE user_id = ?', (user_id,)
+        ).fetchone()[0]
+        top_species = conn.execute(
+            'SELECT species, count, confidence_sum FROM user_species WHERE user_id = ?'
+            ' ORDER BY count DESC, first_seen LIMIT ?', (user_id, TOP_SPECIES_LIMIT)
+        ).fetchall()
+        days = conn.execute(
+            'SELECT day, count FROM user_days WHERE user_id = ? ORDER BY day DESC LIMIT ?',
+            (user_id, RECENT_DAYS)
+        ).fetchall()
+        return {
+            'total_identifications': total,
+            'unique_species': unique_species,
+            'average_confidence': round(confidence_sum / scored, 2) if scored else 0,
+            'top_species': [{'species': species, 'count': count, 'avg_confidence': confidence / count * 100}
+                            for species, count, confidence in top_species],
+            'confidence_distribution': {'high': high, 'medium': medium, 'low': low},
+            'category_distribution': {
+                'birds': birds,
+                'butterflies': butterflies,
+                'others': total - birds - butterflies
+            },
+            'time_distribution': dict(days)
+        }
+
+    def stats(self):
+        """Store size for /api/health; reads the maintained totals, never scans the log."""
+        records, users = self._conn().execute('SELECT records, users FROM store_totals').fetchone()
+        return {
+            'db_path': self.db_path,
+            'records': records,
+            'users': users,
+            'db_bytes': os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        }
+
+
+# Global instance
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Get or create the identification history store."""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = IdentificationHistoryStore()
+            print(f"✅ Identification history store: {_history_store.db_path}")
+        return _history_store
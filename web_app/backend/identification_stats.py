@@ -0,0 +1,267 @@
+"""
+Identification statistics for /api/statistics.
+
+SpeciesCategoryMap is built once from class_names.json (the first 200
+classes are birds, the rest butterflies/moths) and the bird/butterfly info
+templates, so classifying a species is a dict lookup instead of a
+class_names.index() scan plus substring tests against ~200 keywords. The
+keyword fallback only runs for names found in neither source, and its
+result is memoized.
+
+compute_statistics() makes one pass over the history to pull out columns
+(species codes, confidences, dates), then aggregates them with numpy.
+`python identification_stats.py --benchmark` times it on synthetic histories.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+BIRD_CLASS_COUNT = 200  # class_names.json lists the 200 bird classes first
+CATEGORY_NAMES = ('birds', 'butterflies', 'others')
+BIRDS, BUTTERFLIES, OTHERS = range(3)
+HIGH_CONFIDENCE = 90  # percent
+MEDIUM_CONFIDENCE = 70
+TOP_SPECIES_LIMIT = 10
+RECENT_DAYS = 7
+MAX_FALLBACK_ENTRIES = 10000  # memoized keyword-fallback results for unknown names
+
+# Keyword fallback for species missing from class_names.json and the templates
+BIRD_KEYWORDS = [
+    'bird', 'albatross', 'auklet', 'blackbird', 'bunting', 'crow', 'finch', 'gull', 'hummingbird', 'jay',
+    'kingfisher', 'lark', 'loon', 'merganser', 'nuthatch', 'oriole', 'pelican', 'raven', 'shrike', 'sparrow',
+    'starling', 'swallow', 'tanager', 'tern', 'thrasher', 'vireo', 'warbler', 'waterthrush', 'waxwing',
+    'woodpecker', 'wren', 'yellowthroat'
+]
+BUTTERFLY_KEYWORDS = [
+    'butterfly', 'moth', 'swallowtail', 'pansy', 'tiger', 'morpho', 'monarch', 'admiral', 'hairstreak',
+    'skipper', 'sulphur', 'copper', 'elfin', 'pierrot', 'comma', 'white', 'blue', 'orange', 'red', 'yellow',
+    'peacock', 'lady', 'cabbage', 'painted', 'wood-nymph', 'argus', 'eggfly', 'brown', 'green', 'purple',
+    'malachite', 'metalmark', 'tortoiseshell', 'mourning', 'cloak', 'question', 'mark', 'cracker', 'postman',
+    'leafwing', 'popinjay', 'ulyses', 'viceroy', 'satyr', 'zebra', 'long', 'wing', 'banded', 'heliconian',
+    'birdwing', 'atlas', 'luna', 'polyphemus', 'io', 'hercules', 'emperor', 'gum', 'cinnabar', 'garden',
+    'tiger', 'clearwing', 'arcigera', 'flower', 'sixspot', 'burnet', 'white', 'lined', 'sphinx', 'oleander',
+    'hawk', 'humming', 'bird', 'hawk', 'moth', 'madagascan', 'sunset', 'comet', 'rosy', 'maple', 'giant',
+    'leopard', 'banded', 'tiger', 'bird', 'cherry', 'ermine', 'adonis', 'apollo', 'atala', 'beckers', 'chalk',
+    'hill', 'checquered', 'chestnut', 'cleopatra', 'clodius', 'parnassian', 'clouded', 'common', 'copper',
+    'tail', 'crescent', 'crimson', 'patch', 'danaid', 'eastern', 'dapple', 'eastern', 'pine', 'elbowed',
+    'glittering', 'sapphire', 'gold', 'great', 'green', 'celled', 'cattleheart', 'grey', 'indra', 'julia',
+    'large', 'marble', 'mestra', 'milberts', 'orange', 'oakleaf', 'paper', 'kite', 'pine', 'pipevine',
+    'purple', 'hairstreak', 'purplish', 'scarce', 'silver', 'spot', 'sleepy', 'sootywing', 'southern',
+    'dogface', 'straited', 'queen', 'tropical', 'two', 'barred', 'flasher', 'wood', 'yellow'
+]
+
+
+def find_base_dir():
+    """Repository root (same logic as app.load_model())"""
+    working_dir = os.getcwd()
+    if 'backend' in working_dir:
+        return os.path.dirname(os.path.dirname(working_dir))
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _load_json(path, default):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Failed to load {path}: {e}")
+    return default
+
+
+class SpeciesCategoryMap:
+    """Precomputed species -> class index and species -> category lookups."""
+
+    def __init__(self, class_names, bird_templates=None, butterfly_templates=None):
+        self.class_names = list(class_names)
+        self._index = {}
+        self._category = {}
+        for index, name in enumerate(self.class_names):
+            self._index.setdefault(name, index)
+        for name, index in self._index.items():
+            self._category[name] = BIRDS if index < BIRD_CLASS_COUNT else BUTTERFLIES
+        # Template keys and common names ('Black footed Albatross') identify species the model doesn't list
+        for templates, code in ((bird_templates or {}, BIRDS), (butterfly_templates or {}, BUTTERFLIES)):
+            for key, info in templates.items():
+                self._category.setdefault(key, code)
+                common_name = info.get('common_name') if isinstance(info, dict) else None
+                if common_name:
+                    self._category.setdefault(common_name, code)
+        self._known = len(self._category)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, base_dir=None):
+        base_dir = base_dir or find_base_dir()
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        return cls(
+            _load_json(os.path.join(base_dir, 'models', 'trained', 'class_names.json'), []),
+            _load_json(os.path.join(backend_dir, 'bird_info_template.json'), {}),
+            _load_json(os.path.join(backend_dir, 'butterfly_info_template.json'), {})
+        )
+
+    def index(self, species):
+        """Class index of a species, or -1"""
+        return self._index.get(species, -1)
+
+    @staticmethod
+    def _fallback_code(species):
+        # Bird classes are numbered '001.' to '200.'
+        if species and species[0].isdigit():
+            return BIRDS
+        species_lower = species.lower()
+        if any(keyword in species_lower for keyword in BIRD_KEYWORDS):
+            return BIRDS
+        if any(keyword in species_lower for keyword in BUTTERFLY_KEYWORDS):
+            return BUTTERFLIES
+        return OTHERS
+
+    def category_code(self, species):
+        """BIRDS, BUTTERFLIES or OTHERS"""
+        species = species or ''
+        code = self._category.get(species)
+        if code is None:
+            code = self._fallback_code(species)
+            with self._lock:
+                if len(self._category) - self._known < MAX_FALLBACK_ENTRIES:
+                    self._category[species] = code
+        return code
+
+    def category(self, species, warning=None):
+        """'birds', 'butterflies' or 'others'; non-butterfly/bird warnings count as others"""
+        if warning is not None:
+            return 'others'
+        return CATEGORY_NAMES[self.category_code(species)]
+
+
+def compute_statistics(history, category_map):
+    """
+    Statistics for a list of history items ({'prediction': {'class', 'confidence'}, 'timestamp', 'warning'}).
+
+    Returns the /api/statistics 'statistics' dict.
+    """
+    total = len(history)
+
+    # Column extraction: one C-level pass per column where possible
+    predictions = [item.get('prediction') for item in history]
+    classes = [None if p is None else p.get('class') for p in predictions]
+    confidences = np.array([np.nan if p is None else p.get('confidence', 0) for p in predictions],
+                           dtype=np.float64)  # NaN: no prediction
+    others = np.array([p is None or item.get('warning') is not None for item, p in zip(history, predictions)],
+                      dtype=bool)  # warning set or no prediction
+
+    # Species codes in order of first appearance (dict.fromkeys keeps insertion order); -1: no species
+    names = [name for name in dict.fromkeys(classes) if name is not None]
+    species_ids = {name: code for code, name in enumerate(names)}
+    species_ids[None] = -1
+    codes = np.fromiter(map(species_ids.__getitem__, classes), dtype=np.int64, count=total)
+
+    # Dates: count whole timestamps first, then fold them by date part
+    day_counts = {}
+    timestamps = Counter(item.get('timestamp') for item in history if isinstance(item.get('timestamp'), str))
+    for timestamp, count in timestamps.items():
+        day = timestamp.split(',')[0]
+        day_counts[day] = day_counts.get(day, 0) + count
+
+    has_species = codes >= 0
+    species_codes = codes[has_species]
+    counts = np.bincount(species_codes, minlength=len(names))
+    confidence_sums = np.bincount(species_codes, weights=confidences[has_species], minlength=len(names))
+
+    # Most frequent first; equal counts keep first-appearance order
+    top = np.argsort(-counts, kind='stable')[:TOP_SPECIES_LIMIT]
+    top_species = [{'species': names[i], 'count': int(counts[i]), 'avg_confidence': float(confidence_sums[i] / counts[i] * 100)}
+                   for i in top]
+
+    percents = confidences[~np.isnan(confidences)] * 100
+    high = int(np.count_nonzero(percents >= HIGH_CONFIDENCE))
+    medium = int(np.count_nonzero((percents >= MEDIUM_CONFIDENCE) & (percents < HIGH_CONFIDENCE)))
+
+    # Category per unique species, broadcast to rows; warnings and missing predictions are others
+    unique_categories = np.array([category_map.category_code(name) for name in names] + [OTHERS], dtype=np.int64)
+    row_categories = unique_categories[codes]  # code -1 picks the trailing OTHERS
+    no_class = ~has_species & ~others  # prediction without a class name
+    if no_class.any():
+        row_categories[no_class] = category_map.category_code('')
+    row_categories[others] = OTHERS
+    category_counts = np.bincount(row_categories, minlength=3)
+
+    return {
+        'total_identifications': total,
+        'unique_species': len(names),
+        'average_confidence': round(float(percents.mean()), 2) if len(percents) else 0,
+        'top_species': top_species,
+        'confidence_distribution': {
+            'high': high,
+            'medium': medium,
+            'low': int(len(percents)) - high - medium
+        },
+        'category_distribution': {
+            'birds': int(category_counts[BIRDS]),
+            'butterflies': int(category_counts[BUTTERFLIES]),
+            'others': total - int(category_counts[BIRDS]) - int(category_counts[BUTTERFLIES])
+        },
+        'time_distribution': dict(sorted(day_counts.items(), reverse=True)[:RECENT_DAYS])
+    }
+
+
+def benchmark(category_map, sizes=(1000, 10000, 100000), repeats=5, seed=0):
+    """
+    Time compute_statistics on synthetic histories.
+
+    Returns:
+        List of dicts: {'items', 'best_seconds', 'mean_seconds'}
+    """
+    rng = np.random.default_rng(seed)
+    names = category_map.class_names or ['Unknown']
+    report = []
+    for size in sizes:
+        species = rng.integers(0, len(names), size)
+        confidence = rng.random(size)
+        days = rng.integers(1, 29, size)
+        history = [{
+            'id': i,
+            'prediction': {'class': names[species[i]], 'confidence': float(confidence[i])},
+            'timestamp': f"10/{days[i]:02d}/2026, 01:15:00 PM"
+        } for i in range(size)]
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            compute_statistics(history, category_map)
+            timings.append(time.perf_counter() - start)
+        report.append({'items': size, 'best_seconds': min(timings), 'mean_seconds': sum(timings) / len(timings)})
+    return report
+
+
+# Global instance
+_species_category_map = None
+_species_category_map_lock = threading.Lock()
+
+
+def get_species_category_map():
+    """Get or build the species category map (files are read once)."""
+    global _species_category_map
+    with _species_category_map_lock:
+        if _species_category_map is None:
+            _species_category_map = SpeciesCategoryMap.from_files()
+            print(f"✅ Species category map: {len(_species_category_map.class_names)} classes")
+        return _species_category_map
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Identification statistics')
+    parser.add_argument('--benchmark', action='store_true', help='Time compute_statistics on synthetic histories')
+    parser.add_argument('--items', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    if args.benchmark:
+        for row in benchmark(get_species_category_map(), sizes=args.items):
+            print(f"  {row['items']:>7} items: best {row['best_seconds'] * 1000:.1f} ms, "
+                  f"mean {row['mean_seconds'] * 1000:.1f} ms")
+    else:
+        parser.print_help()
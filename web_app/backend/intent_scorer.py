@@ -0,0 +1,152 @@
+"""
+Numpy intent scorer for the chat assistant.
+
+train_intent_classifier.py exports the fitted TF-IDF vocabulary, IDF weights
+and the classifier's coefficients to intent_model.npz. IntentScorer
+reproduces TfidfVectorizer.transform + predict/predict_proba from those
+arrays: tokenize, count vocabulary n-grams, weight and normalize, then one
+sparse dot product gives every class score. scikit-learn is not imported
+at runtime, and the file does not depend on the sklearn version that wrote it.
+"""
+
+import re
+
+import numpy as np
+
+INTENT_MODEL_FORMAT_VERSION = 1
+INTENT_MODEL_PATH = 'intent_model.npz'
+
+
+def export_intent_model(model, vectorizer, path=INTENT_MODEL_PATH):
+    """
+    Export a fitted TfidfVectorizer and MultinomialNB / LogisticRegression to .npz.
+
+    Works on the fitted attributes only, so it needs no sklearn import itself.
+    """
+    model_name = type(model).__name__
+    if model_name == 'MultinomialNB':
+        model_type = 'naive_bayes'
+        coef = model.feature_log_prob_
+        intercept = model.class_log_prior_
+    elif model_name == 'LogisticRegression':
+        model_type = 'logistic'
+        coef = model.coef_
+        intercept = model.intercept_
+        if coef.shape[0] == 1:
+            # Binary problem: sklearn stores one row for the positive class
+            coef = np.vstack([-coef[0], coef[0]]) / 2
+            intercept = np.array([-intercept[0], intercept[0]]) / 2
+    else:
+        raise ValueError(f"Unsupported intent model type: {model_name}")
+
+    vocabulary = sorted(vectorizer.vocabulary_.items(), key=lambda item: item[1])
+    terms = [term for term, _ in vocabulary]
+    stop_words = sorted(vectorizer.get_stop_words() or [])
+
+    np.savez_compressed(
+        path,
+        format_version=np.array(INTENT_MODEL_FORMAT_VERSION),
+        model_type=np.array(model_type),
+        classes=np.array([str(c) for c in model.classes_]),
+        terms=np.array(terms, dtype=str),
+        idf=np.asarray(vectorizer.idf_, dtype=np.float64),
+        coef=np.asarray(coef, dtype=np.float64),
+        intercept=np.asarray(intercept, dtype=np.float64),
+        stop_words=np.array(stop_words, dtype=str),
+        token_pattern=np.array(vectorizer.token_pattern),
+        ngram_range=np.array(vectorizer.ngram_range),
+        lowercase=np.array(bool(vectorizer.lowercase)),
+        sublinear_tf=np.array(bool(vectorizer.sublinear_tf)),
+        binary=np.array(bool(vectorizer.binary)),
+        norm=np.array(vectorizer.norm or '')
+    )
+    return path
+
+
+class IntentScorer:
+    """TF-IDF + linear intent classifier evaluated with numpy."""
+
+    def __init__(self, path=INTENT_MODEL_PATH):
+        data = np.load(path, allow_pickle=False)
+        if int(data['format_version']) != INTENT_MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported intent model format: {int(data['format_version'])}")
+        self.path = path
+        self.model_type = str(data['model_type'])
+        self.classes = [str(c) for c in data['classes']]
+        self.vocabulary = {str(term): i for i, term in enumerate(data['terms'])}
+        self.idf = data['idf']
+        # (n_features, n_classes): the rows of a message's terms are gathered directly
+        self.coef_t = np.ascontiguousarray(data['coef'].T)
+        self.intercept = data['intercept']
+        self.stop_words = frozenset(str(w) for w in data['stop_words'])
+        self.token_re = re.compile(str(data['token_pattern']))
+        self.ngram_range = tuple(int(n) for n in data['ngram_range'])
+        self.lowercase = bool(data['lowercase'])
+        self.sublinear_tf = bool(data['sublinear_tf'])
+        self.binary = bool(data['binary'])
+        self.norm = str(data['norm']) or None
+
+    def _ngrams(self, text):
+        """Same analyzer as TfidfVectorizer(analyzer='word')."""
+        if self.lowercase:
+            text = text.lower()
+        tokens = [t for t in self.token_re.findall(text) if t not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+        grams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            grams.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def vectorize(self, text):
+        """
+        TF-IDF features of one text.
+
+        Returns:
+            (indices, values) of the non-zero features
+        """
+        counts = {}
+        for gram in self._ngrams(text):
+            index = self.vocabulary.get(gram)
+            if index is not None:
+                counts[index] = counts.get(index, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        if self.binary:
+            tf = np.ones_like(tf)
+        elif self.sublinear_tf:
+            tf = 1.0 + np.log(tf)
+        values = tf * self.idf[indices]
+        if self.norm == 'l2':
+            values /= np.sqrt(np.dot(values, values))
+        elif self.norm == 'l1':
+            values /= np.abs(values).sum()
+        return indices, values
+
+    def transform(self, texts):
+        """Vectorize several texts (list of (indices, values))."""
+        return [self.vectorize(text) for text in texts]
+
+    def predict_proba_features(self, features):
+        """Class probabilities for (indices, values) features."""
+        indices, values = features
+        scores = self.intercept + values @ self.coef_t[indices]
+        # Both MultinomialNB (joint log-likelihood) and multinomial logistic
+        # regression normalize their scores with a softmax
+        scores = scores - scores.max()
+        probabilities = np.exp(scores)
+        return probabilities / probabilities.sum()
+
+    def predict_features(self, features):
+        """(intent, confidence) for (indices, values) features."""
+        probabilities = self.predict_proba_features(features)
+        best = int(np.argmax(probabilities))
+        return self.classes[best], float(probabilities[best])
+
+    def predict(self, text):
+        """(intent, confidence) for a text."""
+        return self.predict_features(self.vectorize(text))
@@ -0,0 +1,190 @@
+"""
+Pre-generated interpretation texts and a runtime cache for the GPT-2 interpreter.
+
+`python generate_interpretation_en.py --build-table` pre-generates several
+variants per (species, category) for every species in
+species_name_mapping.json into a gzip-compressed JSON lookup table. At
+runtime the chat assistant serves interpretations from that table (plus the
+texts generated live since startup) and never blocks on the model: on a miss
+the generation is queued to a background worker, and the result is served to
+later requests.
+"""
+
+import gzip
+import json
+import os
+import queue
+import random
+import threading
+from collections import OrderedDict
+
+TABLE_FORMAT_VERSION = 1
+INTERPRETATION_TABLE_PATH = os.environ.get('INTERPRETATION_TABLE_PATH', 'interpretation_table.json.gz')
+MAX_LIVE_ENTRIES = int(os.environ.get('INTERPRETATION_CACHE_MAX_ENTRIES', 1000))
+MAX_PENDING = 64  # Misses beyond this are dropped instead of queued
+CATEGORIES = ['fun_fact', 'behavior', 'habitat']
+
+
+def load_species_mapping(path='species_name_mapping.json'):
+    """Chinese -> English species names used by the interpretation model."""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_table(entries, path, metadata=None):
+    """
+    Write a lookup table.
+
+    Args:
+        entries: {species_en: {category: [text, ...]}}
+        path: output file (.json.gz)
+        metadata: extra fields stored alongside the entries
+    """
+    table = dict(metadata or {})
+    table['format_version'] = TABLE_FORMAT_VERSION
+    table['entries'] = entries
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_table(path):
+    """Read a lookup table; returns {} if it is missing or unreadable."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            table = json.load(f)
+        if table.get('format_version') != TABLE_FORMAT_VERSION:
+            print(f"⚠️ Unsupported interpretation table format: {table.get('format_version')}")
+            return {}
+        return table.get('entries', {})
+    except Exception as e:
+        print(f"⚠️ Failed to load interpretation table {path}: {e}")
+        return {}
+
+
+class InterpretationCache:
+    """Pre-generated table + bounded cache of live generations, with a background generator."""
+
+    def __init__(self, table_path=INTERPRETATION_TABLE_PATH, max_live_entries=MAX_LIVE_ENTRIES,
+                 species_mapping=None):
+        self.table_path = table_path
+        self.species_mapping = species_mapping if species_mapping is not None else load_species_mapping()
+        self.table = load_table(table_path)
+        self.max_live_entries = max_live_entries
+        self._live = OrderedDict()  # (species_en, category) -> [text, ...]
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._pending = set()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.generation_failures = 0
+        self.dropped = 0
+        if self.table:
+            variants = sum(len(texts) for categories in self.table.values() for texts in categories.values())
+            print(f"✅ Interpretation table loaded: {len(self.table)} species, {variants} texts")
+
+    def _key(self, species, category):
+        return self.species_mapping.get(species, species), category
+
+    def get(self, species, category):
+        """A cached interpretation text (random variant), or None on a miss."""
+        species_en, category = self._key(species, category)
+        texts = self.table.get(species_en, {}).get(category)
+        with self._lock:
+            if not texts:
+                texts = self._live.get((species_en, category))
+                if texts:
+                    self._live.move_to_end((species_en, category))
+            if texts:
+                self.hits += 1
+                return random.choice(texts)
+            self.misses += 1
+        return None
+
+    def put(self, species, category, text):
+        """Add a live-generated text (kept alongside other variants for the same key)."""
+        key = self._key(species, category)
+        with self._lock:
+            texts = self._live.setdefault(key, [])
+            if text not in texts:
+                texts.append(text)
+            self._live.move_to_end(key)
+            while len(self._live) > self.max_live_entries:
+                self._live.popitem(last=False)
+
+    def request_generation(self, species, category, generate_fn):
+        """
+        Queue a background generation for a missed key.
+
+        generate_fn(species, category) returns the text or None. Requests for a
+        key that is already queued, or beyond MAX_PENDING, are ignored.
+        """
+        key = self._key(species, category)
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        try:
+            self._queue.put_nowait((species, category, key, generate_fn))
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(key)
+                self.dropped += 1
+            return False
+        self._ensure_worker()
+        return True
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='interpretation-generator', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            species, category, key, generate_fn = self._queue.get()
+            try:
+                text = generate_fn(species, category)
+                if text:
+                    self.put(species, category, text)
+                    self.generated += 1
+                else:
+                    self.generation_failures += 1
+            except Exception as e:
+                self.generation_failures += 1
+                print(f"⚠️ Background interpretation generation failed ({species} - {category}): {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'table_path': self.table_path,
+                'table_species': len(self.table),
+                'live_entries': len(self._live),
+                'pending': len(self._pending),
+                'hits': self.hits,
+                'misses': self.misses,
+                'generated': self.generated,
+                'generation_failures': self.generation_failures,
+                'dropped': self.dropped
+            }
+
+
+# Global instance
+_interpretation_cache = None
+
+
+def get_interpretation_cache():
+    """Get or create the interpretation cache."""
+    global _interpretation_cache
+    if _interpretation_cache is None:
+        _interpretation_cache = InterpretationCache()
+    return _interpretation_cache
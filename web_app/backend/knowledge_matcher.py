@@ -0,0 +1,142 @@
+"""
+Compiled knowledge-base pattern matching for the chat assistant.
+
+knowledge_base.json is compiled once at load into a PatternAutomaton over
+every pattern and every pattern word, plus postings from each matched string
+back to the patterns that use it. Scoring a message is then a single pass
+over the message followed by work proportional to the number of hits,
+instead of scanning every pattern of every category.
+
+Scores are identical to the original per-pattern loop:
+exact match 10, partial (substring) match 5, word match 2.
+"""
+
+import os
+
+from pattern_automaton import PatternAutomaton
+
+EXACT_MATCH_SCORE = 10
+PARTIAL_MATCH_SCORE = 5
+WORD_MATCH_SCORE = 2
+
+WEBSITE_KEYWORDS = ['網站', 'website', 'link', '連結', '鏈接', '資源', 'resource', '推薦', 'recommend']
+BUTTERFLY_MOTH_KEYWORDS = ['蝴蝶和蛾', 'butterfly and moth', 'butterfly vs moth', 'butterfly moth', '蛾和蝴蝶',
+                           'moth and butterfly', '有什麼區別', '有什麼不同', 'difference', '區分']
+
+
+def file_signature(path):
+    """(mtime, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def link_responses(responses):
+    """Responses containing a link (preferred for website requests)."""
+    return [r for r in responses if 'http' in r or '[' in r]
+
+
+class CompiledKnowledgeBase:
+    """Knowledge base patterns compiled into one automaton with postings."""
+
+    def __init__(self, knowledge_base):
+        self.categories = [c for c in knowledge_base if c != 'default']
+        self.category_order = {category: i for i, category in enumerate(self.categories)}
+        self.responses = {c: knowledge_base[c].get('responses', []) for c in self.categories}
+        self.link_responses = {c: link_responses(r) for c, r in self.responses.items()}
+
+        # Pattern table: (category, lowercased pattern, distinct words)
+        self.patterns = []
+        self.exact = {}  # lowercased pattern -> [pattern ids]
+        self.full_postings = {}  # lowercased pattern -> [pattern ids] (partial match)
+        self.word_postings = {}  # word -> [pattern ids] (word match)
+        self.always_partial = []  # empty patterns: '' is in every message
+        automaton = PatternAutomaton()
+
+        for category in self.categories:
+            for pattern in knowledge_base[category].get('patterns', []):
+                pattern_lower = pattern.lower()
+                pattern_id = len(self.patterns)
+                words = set(pattern_lower.split())
+                self.patterns.append((category, pattern_lower))
+                self.exact.setdefault(pattern_lower, []).append(pattern_id)
+                if not pattern_lower:
+                    self.always_partial.append(pattern_id)
+                    continue
+                self.full_postings.setdefault(pattern_lower, []).append(pattern_id)
+                automaton.add(pattern_lower)
+                for word in words:
+                    self.word_postings.setdefault(word, []).append(pattern_id)
+                    automaton.add(word)
+
+        for keyword in WEBSITE_KEYWORDS + BUTTERFLY_MOTH_KEYWORDS:
+            automaton.add(keyword)
+        automaton.compile()
+        self.automaton = automaton
+
+    def analyze(self, message_lower):
+        """
+        Score every category against a lowercased message.
+
+        Returns:
+            (scores, found) where scores maps category -> pattern score (only
+            categories with at least one hit) and found is the set of
+            automaton keywords present in the message
+        """
+        found = self.automaton.find_all(message_lower)
+
+        pattern_scores = {}  # pattern id -> best match score
+        for pattern_id in self.always_partial:
+            pattern_scores[pattern_id] = PARTIAL_MATCH_SCORE
+        for string in found:
+            for pattern_id in self.word_postings.get(string, ()):
+                if pattern_id not in pattern_scores:
+                    pattern_scores[pattern_id] = WORD_MATCH_SCORE
+            for pattern_id in self.full_postings.get(string, ()):
+                pattern_scores[pattern_id] = PARTIAL_MATCH_SCORE
+        for pattern_id in self.exact.get(message_lower, ()):
+            pattern_scores[pattern_id] = EXACT_MATCH_SCORE
+
+        scores = {}
+        for pattern_id, score in pattern_scores.items():
+            category = self.patterns[pattern_id][0]
+            scores[category] = scores.get(category, 0) + score
+        return scores, found
+
+    def best_match(self, message_lower):
+        """
+        Best (category, responses, score) for a message by pattern scoring, or None.
+
+        Ties go to the category that comes first in knowledge_base.json.
+        """
+        scores, found = self.analyze(message_lower)
+        is_website_request = not found.isdisjoint(WEBSITE_KEYWORDS)
+
+        # 特殊处理：如果问题明确包含"蝴蝶和蛾"或"butterfly and moth"，大幅提升匹配分数
+        if not found.isdisjoint(BUTTERFLY_MOTH_KEYWORDS):
+            if 'butterfly_moth_difference' in self.category_order:
+                scores['butterfly_moth_difference'] = scores.get('butterfly_moth_difference', 0) + 50
+                print(f"🔍 [DEBUG] 检测到蝴蝶和蛾问题，提升 butterfly_moth_difference 分数: "
+                      f"{scores['butterfly_moth_difference']}")
+            if 'identification_tips' in self.category_order:
+                scores['identification_tips'] = scores.get('identification_tips', 0) - 10
+                print(f"🔍 [DEBUG] 降低 identification_tips 分数以避免误匹配: {scores['identification_tips']}")
+
+        # Boost score for website requests matching photo_tips
+        if is_website_request and 'photo_tips' in self.category_order:
+            scores['photo_tips'] = scores.get('photo_tips', 0) + 5
+
+        best_match = None
+        best_score = 0
+        for category in sorted(scores, key=self.category_order.__getitem__):
+            score = scores[category]
+            if score > best_score and self.responses[category]:
+                best_score = score
+                # If it's a website request, prefer responses with links
+                if is_website_request and self.link_responses[category]:
+                    best_match = (category, self.link_responses[category], score)
+                else:
+                    best_match = (category, self.responses[category], score)
+        return best_match
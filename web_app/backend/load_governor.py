@@ -0,0 +1,302 @@
+"""
+Load-adaptive quality mode for /api/predict.
+
+The LoadGovernor watches three pressure signals:
+
+- in-flight API requests
+- queued predictions: /api/predict requests in flight beyond
+  GOVERNOR_PREDICT_CONCURRENCY, i.e. waiting for a CPU
+- memory: growth of process RSS since the post-warm-up baseline, as a
+  fraction of the headroom between that baseline and the memory limit
+  (GOVERNOR_RSS_LIMIT_MB, else the cgroup limit). The resident models make
+  absolute RSS high even when idle, so the signal stays off until
+  set_rss_baseline() is called after warm-up, and off entirely when no
+  limit is known.
+
+It maps them to one of three modes:
+
+- full: every stage runs
+- reduced: no ImageNet verification pass; the cartoon check runs on a
+  thumbnail
+- minimal: classifier top-k only (no cartoon check, verification or
+  similar species)
+
+Moving to a more degraded mode happens immediately. Recovering requires
+every signal to stay below its exit threshold (a fraction of the enter
+threshold) for GOVERNOR_MIN_DWELL seconds, so the mode does not flap
+around a threshold. Transitions and time spent per mode are exported in
+Prometheus text format by metrics_text() (/api/metrics).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+FULL = 'full'
+REDUCED = 'reduced'
+MINIMAL = 'minimal'
+MODES = [FULL, REDUCED, MINIMAL]
+
+GOVERNOR_ENABLED = os.environ.get('GOVERNOR_ENABLED', '1') != '0'
+GOVERNOR_PREDICT_CONCURRENCY = int(os.environ.get('GOVERNOR_PREDICT_CONCURRENCY', os.cpu_count() or 1))
+GOVERNOR_REDUCED_INFLIGHT = int(os.environ.get('GOVERNOR_REDUCED_INFLIGHT', 6))
+GOVERNOR_MINIMAL_INFLIGHT = int(os.environ.get('GOVERNOR_MINIMAL_INFLIGHT', 12))
+GOVERNOR_REDUCED_QUEUED = int(os.environ.get('GOVERNOR_REDUCED_QUEUED', 2))
+GOVERNOR_MINIMAL_QUEUED = int(os.environ.get('GOVERNOR_MINIMAL_QUEUED', 6))
+GOVERNOR_RSS_LIMIT_MB = os.environ.get('GOVERNOR_RSS_LIMIT_MB')  # default: the cgroup memory limit, if any
+GOVERNOR_REDUCED_MEMORY = 0.75  # fraction of the headroom above the baseline RSS
+GOVERNOR_MINIMAL_MEMORY = 0.90
+CGROUP_MEMORY_LIMIT_FILES = ['/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes']
+GOVERNOR_EXIT_FRACTION = 0.7  # a signal has cleared a level below this fraction of its enter threshold
+GOVERNOR_MIN_DWELL = float(os.environ.get('GOVERNOR_MIN_DWELL', 10.0))  # seconds
+RSS_SAMPLE_INTERVAL = 1.0
+
+
+def memory_limit_mb():
+    """GOVERNOR_RSS_LIMIT_MB if set, else the cgroup memory limit; None when unlimited or unknown."""
+    if GOVERNOR_RSS_LIMIT_MB:
+        return float(GOVERNOR_RSS_LIMIT_MB)
+    for path in CGROUP_MEMORY_LIMIT_FILES:
+        try:
+            with open(path, 'r') as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 2 ** 60:  # cgroup v1 reports "unlimited" as a huge number
+            return int(value) / (1024 * 1024)
+        return None
+    return None
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or None if it cannot be read."""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class LoadGovernor:
+    """Tracks request load and memory, and picks the quality mode with hysteresis."""
+
+    def __init__(self, enabled=GOVERNOR_ENABLED, min_dwell=GOVERNOR_MIN_DWELL):
+        self.enabled = enabled
+        self.min_dwell = min_dwell
+        self.thresholds = {
+            # signal -> enter thresholds for (reduced, minimal)
+            'in_flight': (GOVERNOR_REDUCED_INFLIGHT, GOVERNOR_MINIMAL_INFLIGHT),
+            'queued': (GOVERNOR_REDUCED_QUEUED, GOVERNOR_MINIMAL_QUEUED),
+            'memory': (GOVERNOR_REDUCED_MEMORY, GOVERNOR_MINIMAL_MEMORY)
+        }
+        self.memory_limit_mb = memory_limit_mb()
+        self.baseline_rss_mb = None  # set after warm-up; the memory signal is off until then
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.predict_in_flight = 0
+        self._rss_mb = None
+        self._rss_sampled_at = 0.0
+        self._mode = FULL
+        self._mode_since = time.time()
+        self._calm_since = None  # when every signal last dropped below the current mode's exit thresholds
+        self.transitions = {}  # (from, to) -> count
+        self.mode_seconds = {mode: 0.0 for mode in MODES}
+        self.served = {mode: 0 for mode in MODES}
+        self.last_transition = None
+
+    def request_started(self, predict=False):
+        with self._lock:
+            self.in_flight += 1
+            if predict:
+                self.predict_in_flight += 1
+
+    def request_finished(self, predict=False):
+        with self._lock:
+            self.in_flight -= 1
+            if predict:
+                self.predict_in_flight -= 1
+
+    @contextmanager
+    def track(self, predict=False):
+        """Count a request as in flight for the duration of the block."""
+        self.request_started(predict)
+        try:
+            yield
+        finally:
+            self.request_finished(predict)
+
+    def set_rss_baseline(self):
+        """
+        Record the current RSS (models loaded and warmed) as the memory baseline.
+
+        Returns False when the memory signal stays off: no known limit, or
+        no headroom left above the baseline.
+        """
+        rss = current_rss_bytes()
+        with self._lock:
+            if self.memory_limit_mb is None or rss is None:
+                print("ℹ️ Load governor memory signal off (no memory limit known)")
+                return False
+            baseline = rss / (1024 * 1024)
+            if baseline >= self.memory_limit_mb:
+                print(f"⚠️ Load governor memory signal off: baseline RSS {baseline:.0f} MB "
+                      f"is not below the limit {self.memory_limit_mb:.0f} MB")
+                return False
+            self.baseline_rss_mb = baseline
+            print(f"⚖️ Load governor memory baseline {baseline:.0f} MB of {self.memory_limit_mb:.0f} MB")
+            return True
+
+    def _sample_rss(self, now):
+        if now - self._rss_sampled_at >= RSS_SAMPLE_INTERVAL:
+            rss = current_rss_bytes()
+            self._rss_mb = rss / (1024 * 1024) if rss is not None else None
+            self._rss_sampled_at = now
+        return self._rss_mb
+
+    def signals(self):
+        with self._lock:
+            return self._signals(time.time())
+
+    def _signals(self, now):
+        rss_mb = self._sample_rss(now)
+        memory = None
+        if self.baseline_rss_mb is not None and rss_mb is not None:
+            memory = max(rss_mb - self.baseline_rss_mb, 0.0) / (self.memory_limit_mb - self.baseline_rss_mb)
+        return {
+            'in_flight': self.in_flight,
+            'queued': max(self.predict_in_flight - GOVERNOR_PREDICT_CONCURRENCY, 0),
+            'memory': memory,
+            'rss_mb': rss_mb
+        }
+
+    def _pressure_level(self, signals, fraction=1.0):
+        """Highest mode index any signal reaches (thresholds scaled by fraction)."""
+        level = 0
+        for name, (reduced, minimal) in self.thresholds.items():
+            value = signals[name]
+            if value is None:
+                continue
+            if value >= minimal * fraction:
+                return 2
+            if value >= reduced * fraction:
+                level = 1
+        return level
+
+    def _switch(self, mode, now, signals):
+        previous = self._mode
+        self.mode_seconds[previous] += now - self._mode_since
+        self.transitions[(previous, mode)] = self.transitions.get((previous, mode), 0) + 1
+        self._mode = mode
+        self._mode_since = now
+        self._calm_since = None
+        self.last_transition = {'from': previous, 'to': mode, 'at': now, 'signals': dict(signals)}
+        print(f"⚖️ Quality mode {previous} -> {mode} (in flight {signals['in_flight']}, "
+              f"queued {signals['queued']}, rss {signals['rss_mb'] or 0:.0f} MB)")
+
+    def mode(self):
+        """
+        Quality mode for a request starting now.
+
+        Escalates at once when pressure reaches a more degraded level; steps
+        back one level after min_dwell seconds below the exit thresholds.
+        """
+        if not self.enabled:
+            return FULL
+        now = time.time()
+        with self._lock:
+            signals = self._signals(now)
+            current = MODES.index(self._mode)
+            level = self._pressure_level(signals)
+            if level > current:
+                self._switch(MODES[level], now, signals)
+            elif current > 0:
+                # Only signals below the exit thresholds of the current level count as calm
+                if self._pressure_level(signals, GOVERNOR_EXIT_FRACTION) < current:
+                    if self._calm_since is None:
+                        self._calm_since = now
+                    elif now - self._calm_since >= self.min_dwell:
+                        self._switch(MODES[current - 1], now, signals)
+                else:
+                    self._calm_since = None
+            self.served[self._mode] += 1
+            return self._mode
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            mode_seconds = dict(self.mode_seconds)
+            mode_seconds[self._mode] += now - self._mode_since
+            return {
+                'enabled': self.enabled,
+                'mode': self._mode,
+                'mode_since': self._mode_since,
+                'signals': self._signals(now),
+                'thresholds': {name: {'reduced': reduced, 'minimal': minimal}
+                               for name, (reduced, minimal) in self.thresholds.items()},
+                'memory_limit_mb': self.memory_limit_mb,
+                'baseline_rss_mb': self.baseline_rss_mb,
+                'served': dict(self.served),
+                'mode_seconds': {mode: round(seconds, 1) for mode, seconds in mode_seconds.items()},
+                'transitions': [{'from': a, 'to': b, 'count': count} for (a, b), count in self.transitions.items()],
+                'last_transition': self.last_transition
+            }
+
+    def metrics_text(self):
+        """Prometheus text exposition of the governor's state."""
+        stats = self.stats()
+        lines = [
+            '# HELP predict_quality_mode Current /api/predict quality mode (1 for the active mode).',
+            '# TYPE predict_quality_mode gauge'
+        ]
+        lines += [f'predict_quality_mode{{mode="{mode}"}} {int(stats["mode"] == mode)}' for mode in MODES]
+        lines += ['# HELP predict_quality_mode_transitions_total Quality mode transitions.',
+                  '# TYPE predict_quality_mode_transitions_total counter']
+        lines += [f'predict_quality_mode_transitions_total{{from="{row["from"]}",to="{row["to"]}"}} {row["count"]}'
+                  for row in stats['transitions']]
+        lines += ['# HELP predict_quality_mode_seconds_total Time spent in each quality mode.',
+                  '# TYPE predict_quality_mode_seconds_total counter']
+        lines += [f'predict_quality_mode_seconds_total{{mode="{mode}"}} {seconds}'
+                  for mode, seconds in stats['mode_seconds'].items()]
+        lines += ['# HELP predict_requests_by_mode_total Predictions served per quality mode.',
+                  '# TYPE predict_requests_by_mode_total counter']
+        lines += [f'predict_requests_by_mode_total{{mode="{mode}"}} {count}'
+                  for mode, count in stats['served'].items()]
+        signals = stats['signals']
+        lines += ['# HELP api_requests_in_flight API requests in progress.',
+                  '# TYPE api_requests_in_flight gauge',
+                  f'api_requests_in_flight {signals["in_flight"]}',
+                  '# HELP predict_requests_queued Predictions in flight beyond the CPU concurrency.',
+                  '# TYPE predict_requests_queued gauge',
+                  f'predict_requests_queued {signals["queued"]}']
+        if signals['rss_mb'] is not None:
+            lines += ['# HELP process_resident_memory_megabytes Resident set size.',
+                      '# TYPE process_resident_memory_megabytes gauge',
+                      f'process_resident_memory_megabytes {signals["rss_mb"]:.1f}']
+        if signals['memory'] is not None:
+            lines += ['# HELP governor_memory_headroom_used Fraction of the memory headroom above the warm baseline in use.',
+                      '# TYPE governor_memory_headroom_used gauge',
+                      f'governor_memory_headroom_used {signals["memory"]:.3f}']
+        return '\n'.join(lines) + '\n'
+
+
+# Global instance
+_load_governor = None
+_load_governor_lock = threading.Lock()
+
+
+def get_load_governor():
+    """Get or create the load governor."""
+    global _load_governor
+    with _load_governor_lock:
+        if _load_governor is None:
+            _load_governor = LoadGovernor()
+        return _load_governor
@@ -0,0 +1,179 @@
+"""
+Single-pass message analysis for the chat assistant.
+
+generate_response() used to rescan each message once per detector
+(language, sentiment, quiz/resource/behavior triggers, profile topics), each
+with its own keyword list. MessageAnalyzer compiles every keyword family
+into one PatternAutomaton; a message is lowercased and scanned once, and
+the resulting MessageAnalysis object carries everything the detectors need.
+
+Detection rules are the same as the original per-detector implementations.
+"""
+
+import re
+
+from pattern_automaton import PatternAutomaton
+
+# Language detection
+CHINESE_KEYWORDS = ['的', '是', '在', '有', '了', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到',
+                    '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这']
+
+# Sentiment
+POSITIVE_WORDS = ['great', 'good', 'excellent', 'amazing', 'wonderful',
+                  'thanks', 'thank you', 'helpful', 'love', 'awesome',
+                  '太好了', '很棒', '謝謝', '感謝', '喜歡']
+NEGATIVE_WORDS = ['bad', 'wrong', 'incorrect', 'not working', 'error',
+                  'problem', 'issue', 'confused', 'difficult', 'hard',
+                  '不好', '錯誤', '問題', '困難', '不懂', '不會']
+CURIOUS_WORDS = ['why', 'how', 'what', 'when', 'where', 'explain',
+                 'tell me', 'can you', 'could you', 'please',
+                 '為什麼', '如何', '什麼', '怎麼', '請']
+
+# 情境行为解读：地点、观察对象、行为、时间线索、疑问词
+LOCATION_KEYWORDS = [
+    '阳台', '陽台', 'balcony', 'park', '公园', '公園', 'garden', '花园', '花園',
+    'window', '窗户', '窗戶', 'yard', '院子', 'field', '田野', 'forest', '森林',
+    'tree', '树', '樹', 'branch', '树枝', '樹枝', 'roof', '屋顶', '屋頂',
+    'home', '家', 'house', '房子', 'outside', '外面', 'outdoor', '戶外', '户外'
+]
+SUBJECT_KEYWORDS = [
+    'bird', 'birds', '鸟', '鳥', '小鸟', '小鳥', 'butterfly', 'butterflies',
+    '蝴蝶', 'moth', '蛾', 'animal', '动物', '動物', 'creature', '生物'
+]
+BEHAVIOR_KEYWORDS = [
+    '叫', 'sing', 'singing', 'chirp', 'chirping', 'call', 'calling',
+    '打架', 'fight', 'fighting', 'attack', 'attacking', 'chase', 'chasing',
+    '吃', 'eat', 'eating', 'feed', 'feeding', 'peck', 'pecking',
+    '停', 'stop', 'stopped', 'stand', 'standing', 'sit', 'sitting',
+    '飞', '飛', 'fly', 'flying', 'hover', 'hovering', 'land', 'landing',
+    '跳', 'jump', 'jumping', 'hop', 'hopping', 'move', 'moving',
+    '不动', '不動', 'still', 'motionless', 'quiet', '安静', '安靜',
+    '观察', '觀察', 'observe', 'watching', '看', 'see', 'saw'
+]
+TIME_KEYWORDS = [
+    'today', '今天', 'yesterday', '昨天', 'morning', '早晨', '早上',
+    'afternoon', '下午', 'evening', '晚上', 'night', '夜晚', 'night',
+    'season', '季节', '季節', 'spring', '春天', 'summer', '夏天',
+    'autumn', '秋天', 'winter', '冬天', 'now', '现在', '現在',
+    'recently', '最近', 'lately', '近来', '近來'
+]
+QUESTION_INDICATORS = [
+    'why', '为什么', '為什麼', '为何', '為何', '幹嘛', '干嘛', '做什麼', '做什么',
+    '可能', 'maybe', 'perhaps', 'might', 'could', 'would',
+    '在干嘛', '在做什麼', '在幹嘛', 'what', 'how', '可能',
+    '可能在做', '可能在', '可能', '？', '?'
+]
+
+# 资源推荐
+RESOURCE_KEYWORDS = [
+    '推荐', '推薦', '網站', '网站', '資源', '资源', '連結', '链接', 'link',
+    '攝影', '摄影', '拍照', '技巧', 'technique', 'tip', 'tips',
+    '哪裡看', '哪里看', 'where to see', 'where to find',
+    '圖鑑', '图鉴', 'field guide', 'guide',
+    'platform', 'platform', 'database', '資料庫', '数据库',
+    'website', 'resource', 'recommend', 'recommendation',
+    'how to photograph', 'photography tips', 'photography guide',
+    '觀測', '观测', 'observation', 'watch'
+]
+
+# 挑战游戏
+QUIZ_KEYWORDS = [
+    '玩游戏', '来点挑战', '挑战', '猜谜', 'quiz', 'game', 'challenge',
+    'play', 'guess', 'test', 'question', '题目', '问题', '小游戏',
+    '來點挑戰', '玩遊戲', '猜謎', '題目', '問題', '小遊戲'
+]
+
+# User profile topics
+TOPIC_KEYWORDS = {
+    'identification': ['identify', 'recognize', 'tell', 'what is', '識別', '辨識'],
+    'photography': ['photo', 'camera', 'picture', 'image', '拍照', '攝影'],
+    'habitat': ['where', 'habitat', 'location', 'find', '哪裡', '棲息地'],
+    'behavior': ['behavior', 'behaviour', 'do', 'act', '行為', '習性'],
+    'species_info': ['species', 'type', 'kind', '物種', '種類']
+}
+
+_CHINESE_CHAR_RE = re.compile(r'[\u4e00-\u9fff]')
+_LETTER_RE = re.compile(r'[a-zA-Z\u4e00-\u9fff]')
+
+
+def _first_found(keywords, found):
+    """First keyword of a family (in list order) present in the message."""
+    for keyword in keywords:
+        if keyword in found:
+            return keyword
+    return None
+
+
+class MessageAnalysis:
+    """Everything the assistant's detectors need to know about one message."""
+
+    def __init__(self, message, message_lower, found, language, intent_vectorizer=None):
+        self.message = message
+        self.message_lower = message_lower
+        self.found = found  # all keywords (of every family) occurring in the message
+        self.language = language
+        self._intent_vectorizer = intent_vectorizer
+        self._tfidf = None
+
+        # Sentiment: positive > frustrated > curious > '?' > neutral
+        if not found.isdisjoint(POSITIVE_WORDS):
+            self.sentiment = 'positive'
+        elif not found.isdisjoint(NEGATIVE_WORDS):
+            self.sentiment = 'frustrated'
+        elif not found.isdisjoint(CURIOUS_WORDS) or '?' in message:
+            self.sentiment = 'curious'
+        else:
+            self.sentiment = 'neutral'
+
+        self.quiz_trigger = not found.isdisjoint(QUIZ_KEYWORDS)
+        self.resource_trigger = not found.isdisjoint(RESOURCE_KEYWORDS)
+
+        # 情境行为解读：观察对象和行为，并且（有疑问 或 包含地点/时间）
+        self.location = _first_found(LOCATION_KEYWORDS, found)
+        self.subject = _first_found(SUBJECT_KEYWORDS, found)
+        self.behavior = _first_found(BEHAVIOR_KEYWORDS, found)
+        self.time_clue = _first_found(TIME_KEYWORDS, found)
+        has_question = not found.isdisjoint(QUESTION_INDICATORS)
+        self.behavior_trigger = (self.subject is not None and self.behavior is not None) and \
+            (has_question or self.location is not None or self.time_clue is not None)
+
+        self.topics = [topic for topic, keywords in TOPIC_KEYWORDS.items() if not found.isdisjoint(keywords)]
+
+    def tfidf_vector(self):
+        """TF-IDF features of the message for the intent model (computed once)."""
+        if self._tfidf is None and self._intent_vectorizer is not None:
+            self._tfidf = self._intent_vectorizer.transform([self.message_lower])
+        return self._tfidf
+
+
+class MessageAnalyzer:
+    """Compiles all keyword families into one automaton and analyzes messages with it."""
+
+    def __init__(self, intent_vectorizer=None):
+        self.intent_vectorizer = intent_vectorizer
+        families = [CHINESE_KEYWORDS, POSITIVE_WORDS, NEGATIVE_WORDS, CURIOUS_WORDS, LOCATION_KEYWORDS,
+                    SUBJECT_KEYWORDS, BEHAVIOR_KEYWORDS, TIME_KEYWORDS, QUESTION_INDICATORS, RESOURCE_KEYWORDS,
+                    QUIZ_KEYWORDS] + list(TOPIC_KEYWORDS.values())
+        self.automaton = PatternAutomaton(keyword for family in families for keyword in family)
+
+    def detect_language(self, message, found=None):
+        """'zh' if the message is mainly Chinese, otherwise 'en'."""
+        if not message or not message.strip():
+            return 'en'
+        total_chars = len(_LETTER_RE.findall(message))
+        if total_chars == 0:
+            return 'en'
+        chinese_ratio = len(_CHINESE_CHAR_RE.findall(message)) / total_chars
+        if found is None:
+            found = self.automaton.find_all(message.lower())
+        # Chinese keywords are unaffected by lowercasing, so the lowercased scan can be reused
+        if chinese_ratio > 0.3 or not found.isdisjoint(CHINESE_KEYWORDS):
+            return 'zh'
+        return 'en'
+
+    def analyze(self, message):
+        message = message or ''
+        message_lower = message.lower()
+        found = self.automaton.find_all(message_lower)
+        language = self.detect_language(message, found)
+        return MessageAnalysis(message, message_lower, found, language, self.intent_vectorizer)
@@ -0,0 +1,378 @@
+"""
+Versioned model registry with background loading and atomic hot-swap.
+
+Each model kind (the image classifier, the bird sound model) has a versions
+directory, e.g. models/trained/versions/<version>/ holding
+
+- the model file (model.h5)
+- class_names.json
+- manifest.json: version, kind, model file, class names, input shape,
+  SHA-256 checksum of the model file, creation time and source
+
+plus an ACTIVE file naming the version to serve. Activating a version (from
+the admin endpoint, or by rewriting ACTIVE, which a watcher thread polls)
+loads it in a background thread, checks it against its manifest, warms it
+up with a dummy batch and only then replaces the registry's current
+ModelHandle in a single reference assignment. Requests take the handle once
+when they start, so in-flight requests finish on the old model, which is
+freed when the last of them returns.
+
+    python model_registry.py --dir ../../models/trained/versions --register ../../models/trained/model.h5
+    python model_registry.py --dir ../../models/trained/versions --activate head-20261019-101500
+    python model_registry.py --dir ../../models/trained/versions --list
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+MANIFEST_FILE = 'manifest.json'
+ACTIVE_FILE = 'ACTIVE'
+MANIFEST_FORMAT_VERSION = 1
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 10.0))  # seconds, 0 disables
+DEFAULT_INPUT_SHAPES = {'image': [224, 224, 3], 'image_student': [224, 224, 3], 'bird_sound': [128, 128, 1]}
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_manifest(version_dir, kind, class_names, input_shape, model_file='model.h5', source=None):
+    """
+    Write class_names.json and manifest.json for a model already saved in version_dir.
+
+    Returns:
+        The manifest dict
+    """
+    version = os.path.basename(os.path.normpath(version_dir))
+    manifest = {
+        'format_version': MANIFEST_FORMAT_VERSION,
+        'version': version,
+        'kind': kind,
+        'model_file': model_file,
+        'class_names': list(class_names),
+        'input_shape': [int(dim) if dim is not None else None for dim in input_shape],
+        'sha256': file_sha256(os.path.join(version_dir, model_file)),
+        'created_at': datetime.now().isoformat(),
+        'source': source
+    }
+    with open(os.path.join(version_dir, 'class_names.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest['class_names'], f, ensure_ascii=False, indent=2)
+    temp_path = os.path.join(version_dir, MANIFEST_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, os.path.join(version_dir, MANIFEST_FILE))
+    return manifest
+
+
+def read_manifest(version_dir):
+    """The version's manifest, or None if it is missing or unreadable."""
+    path = os.path.join(version_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Failed to read model manifest {path}: {e}")
+        return None
+    if manifest.get('format_version') != MANIFEST_FORMAT_VERSION:
+        print(f"⚠️ Unsupported model manifest format in {path}: {manifest.get('format_version')}")
+        return None
+    return manifest
+
+
+def read_active(versions_dir):
+    """Version named by the ACTIVE file, or None."""
+    try:
+        with open(os.path.join(versions_dir, ACTIVE_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def write_active(versions_dir, version):
+    os.makedirs(versions_dir, exist_ok=True)
+    temp_path = os.path.join(versions_dir, ACTIVE_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(temp_path, os.path.join(versions_dir, ACTIVE_FILE))
+
+
+def shapes_match(expected, actual):
+    """Compare input shapes (without the batch dimension); None matches any size."""
+    if len(expected) != len(actual):
+        return False
+    return all(e is None or a is None or int(e) == int(a) for e, a in zip(expected, actual))
+
+
+class ModelHandle:
+    """An immutable, loaded model version: everything a request needs to predict with it."""
+
+    __slots__ = ('version', 'kind', 'model', 'class_names', 'input_shape', 'extras', 'loaded_at')
+
+    def __init__(self, version, kind, model, class_names, input_shape, extras=None):
+        self.version = version
+        self.kind = kind
+        self.model = model
+        self.class_names = list(class_names)
+        self.input_shape = list(input_shape) if input_shape is not None else None
+        self.extras = dict(extras or {})  # e.g. the image feature extractor
+        self.loaded_at = time.time()
+
+    def __repr__(self):
+        return f"ModelHandle({self.kind}, {self.version})"
+
+
+class ModelRegistry:
+    """
+    Versions of one model kind and the handle currently served.
+
+    loader(model_path) returns (model, extras) and warm_up(handle) runs a
+    dummy prediction; both run on the loading thread, never on a request.
+    """
+
+    def __init__(self, kind, versions_dir, loader, warm_up=None):
+        self.kind = kind
+        self.versions_dir = versions_dir
+        self.loader = loader
+        self.warm_up = warm_up
+        self._current = None
+        self._listeners = []
+        self._lock = threading.Lock()  # guards loading state, not reads of _current
+        self._loading = None
+        self._failed_version = None
+        self._watcher = None
+        self.swaps = 0
+        self.last_swap_at = None
+        self.last_error = None
+
+    def add_listener(self, callback):
+        """callback(handle) runs after every swap (e.g. to update module-level aliases)."""
+        self._listeners.append(callback)
+
+    def current(self):
+        """The served handle (None before the first load). Take it once per request."""
+        return self._current
+
+    @property
+    def version(self):
+        handle = self._current
+        return handle.version if handle is not None else None
+
+    @property
+    def loading(self):
+        return self._loading
+
+    def versions(self):
+        """Manifests of all registered versions, oldest first."""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        manifests = []
+        for entry in os.scandir(self.versions_dir):
+            if entry.is_dir():
+                manifest = read_manifest(entry.path)
+                if manifest is not None:
+                    manifests.append(manifest)
+        manifests.sort(key=lambda manifest: (manifest.get('created_at') or '', manifest['version']))
+        return manifests
+
+    def install(self, handle):
+        """Serve handle from now on and notify listeners."""
+        self._current = handle
+        self.swaps += 1
+        self.last_swap_at = datetime.now().isoformat()
+        for listener in self._listeners:
+            try:
+                listener(handle)
+            except Exception as e:
+                print(f"⚠️ Model swap listener failed: {e}")
+        print(f"🔁 {self.kind} model now serving version {handle.version}")
+
+    def load_version(self, version):
+        """
+        Load, validate and warm up a registered version without serving it.
+
+        Raises:
+            ValueError: unknown version, checksum mismatch, or a model that
+                does not match its manifest's input shape / class count
+        """
+        version_dir = os.path.join(self.versions_dir, version)
+        manifest = read_manifest(version_dir)
+        if manifest is None or manifest.get('kind', self.kind) != self.kind:
+            raise ValueError(f"Unknown {self.kind} model version: {version}")
+        model_path = os.path.join(version_dir, manifest['model_file'])
+        checksum = file_sha256(model_path)
+        if checksum != manifest['sha256']:
+            raise ValueError(f"Checksum mismatch for {version}: {checksum[:12]} != {manifest['sha256'][:12]}")
+
+        model, extras = self.loader(model_path)
+        input_shape = list(getattr(model, 'input_shape', [None] + manifest['input_shape'])[1:])
+        if not shapes_match(manifest['input_shape'], input_shape):
+            raise ValueError(f"Input shape {input_shape} of {version} does not match manifest {manifest['input_shape']}")
+        outputs = getattr(model, 'output_shape', (None, len(manifest['class_names'])))[-1]
+        if outputs is not None and outputs != len(manifest['class_names']):
+            raise ValueError(f"{version} has {outputs} outputs but {len(manifest['class_names'])} class names")
+
+        handle = ModelHandle(version, self.kind, model, manifest['class_names'], manifest['input_shape'], extras)
+        if self.warm_up is not None:
+            start = time.perf_counter()
+            self.warm_up(handle)
+            print(f"🔥 Warmed up {self.kind} model {version} ({time.perf_counter() - start:.2f}s)")
+        return handle
+
+    def activate(self, version, wait=False, persist=True):
+        """
+        Load a version in the background and swap it in once it is warm.
+
+        persist also points ACTIVE at it, so restarts (and other workers'
+        watchers) serve the same version.
+
+        Returns:
+            True if the load was started (or, with wait=True, succeeded);
+            False if another version is loading or the load failed
+        Raises:
+            ValueError: the version is not registered
+        """
+        if read_manifest(os.path.join(self.versions_dir, version)) is None:
+            raise ValueError(f"Unknown {self.kind} model version: {version}")
+        with self._lock:
+            if self._loading is not None:
+                return False
+            self._loading = version
+
+        def _run():
+            try:
+                print(f"🔄 Loading {self.kind} model version {version}...")
+                handle = self.load_version(version)
+                if persist:
+                    write_active(self.versions_dir, version)
+                self.install(handle)
+                self._failed_version = None
+                self.last_error = None
+                return True
+            except Exception as e:
+                self._failed_version = version
+                self.last_error = f"{version}: {e}"
+                print(f"❌ Failed to activate {self.kind} model {version}: {e}")
+                return False
+            finally:
+                with self._lock:
+                    self._loading = None
+
+        if wait:
+            return _run()
+        threading.Thread(target=_run, name=f'model-load-{self.kind}', daemon=True).start()
+        return True
+
+    def watch(self, interval=MODEL_WATCH_INTERVAL):
+        """Poll ACTIVE in a daemon thread and activate the version it names when it changes."""
+        if interval <= 0 or self._watcher is not None:
+            return self._watcher
+
+        def _poll():
+            while True:
+                time.sleep(interval)
+                version = read_active(self.versions_dir)
+                if (version and version != self.version and version != self._loading
+                        and version != self._failed_version):
+                    try:
+                        self.activate(version, persist=False)
+                    except ValueError as e:
+                        self._failed_version = version
+                        print(f"⚠️ {e}")
+
+        self._watcher = threading.Thread(target=_poll, name=f'model-watch-{self.kind}', daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stats(self):
+        handle = self._current
+        return {
+            'version': handle.version if handle is not None else None,
+            'num_classes': len(handle.class_names) if handle is not None else 0,
+            'loaded_at': datetime.fromtimestamp(handle.loaded_at).isoformat() if handle is not None else None,
+            'active_file': read_active(self.versions_dir),
+            'loading': self._loading,
+            'swaps': self.swaps,
+            'last_swap_at': self.last_swap_at,
+            'last_error': self.last_error,
+            'watching': self._watcher is not None
+        }
+
+
+# Global instances, one per model kind
+_model_registries = {}
+_model_registries_lock = threading.Lock()
+
+
+def get_model_registry(kind, versions_dir=None, loader=None, warm_up=None):
+    """Get the registry for a model kind, creating it on first use (versions_dir and loader are then required)."""
+    with _model_registries_lock:
+        registry = _model_registries.get(kind)
+        if registry is None:
+            if versions_dir is None or loader is None:
+                return None
+            registry = ModelRegistry(kind, versions_dir, loader, warm_up)
+            _model_registries[kind] = registry
+        return registry
+
+
+def all_model_registries():
+    with _model_registries_lock:
+        return dict(_model_registries)
+
+
+def register_model(versions_dir, model_path, kind, class_names, input_shape, version=None, source=None):
+    """Copy a model file into the registry as a new version and write its manifest."""
+    version = version or datetime.now().strftime(f'{kind}-%Y%m%d-%H%M%S')
+    version_dir = os.path.join(versions_dir, version)
+    if os.path.exists(version_dir):
+        raise ValueError(f"Version already exists: {version}")
+    os.makedirs(version_dir)
+    shutil.copy(model_path, os.path.join(version_dir, 'model.h5'))
+    return write_manifest(version_dir, kind, class_names, input_shape, source=source or os.path.abspath(model_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model registry maintenance')
+    parser.add_argument('--dir', required=True, help='Versions directory (e.g. ../../models/trained/versions)')
+    parser.add_argument('--kind', default='image', choices=sorted(DEFAULT_INPUT_SHAPES))
+    parser.add_argument('--register', metavar='MODEL_PATH', help='Add a model file as a new version')
+    parser.add_argument('--class-names', help='class_names.json (default: next to the model file)')
+    parser.add_argument('--input-shape', help='e.g. 224,224,3 (default depends on --kind)')
+    parser.add_argument('--version', help='Version name for --register')
+    parser.add_argument('--activate', metavar='VERSION', help='Point ACTIVE at a version (running servers pick it up)')
+    parser.add_argument('--list', action='store_true', help='List registered versions')
+    args = parser.parse_args()
+
+    if args.register:
+        class_names_path = args.class_names or os.path.join(os.path.dirname(args.register), 'class_names.json')
+        with open(class_names_path, 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        shape = ([int(dim) for dim in args.input_shape.split(',')] if args.input_shape
+                 else DEFAULT_INPUT_SHAPES[args.kind])
+        manifest = register_model(args.dir, args.register, args.kind, names, shape, version=args.version)
+        print(f"✅ Registered {manifest['version']} ({len(names)} classes, sha256 {manifest['sha256'][:12]})")
+    if args.activate:
+        if read_manifest(os.path.join(args.dir, args.activate)) is None:
+            parser.error(f"unknown version: {args.activate}")
+        write_active(args.dir, args.activate)
+        print(f"✅ ACTIVE -> {args.activate}")
+    if args.list:
+        active = read_active(args.dir)
+        for manifest in ModelRegistry(args.kind, args.dir, loader=None).versions():
+            marker = '*' if manifest['version'] == active else ' '
+            print(f"{marker} {manifest['version']}  {manifest['kind']}  {len(manifest['class_names'])} classes  "
+                  f"{manifest['created_at']}  {manifest['sha256'][:12]}")
+    if not (args.register or args.activate or args.list):
+        parser.print_help()
@@ -0,0 +1,98 @@
+"""
+Torch-free sentence encoder for the semantic matcher.
+
+Runs the MiniLM sentence encoder exported by
+`python train_description_model.py --export-onnx` with onnxruntime and the
+`tokenizers` library, reproducing the Sentence Transformers pipeline
+(transformer -> mean pooling -> L2 normalization). Loading takes a fraction
+of a second and needs no network access.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+ENCODER_FILE = 'encoder.onnx'
+QUANTIZED_ENCODER_FILE = 'encoder.int8.onnx'
+TOKENIZER_FILE = 'tokenizer.json'
+ENCODER_CONFIG_FILE = 'encoder_config.json'
+
+
+def is_onnx_encoder_available(model_dir):
+    """Check that an exported encoder exists and the runtime libraries are installed."""
+    model_dir = Path(model_dir)
+    has_model = (model_dir / ENCODER_FILE).exists() or (model_dir / QUANTIZED_ENCODER_FILE).exists()
+    if not has_model or not (model_dir / TOKENIZER_FILE).exists():
+        return False
+    try:
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class OnnxSentenceEncoder:
+    """Drop-in replacement for SentenceTransformer.encode backed by onnxruntime."""
+
+    def __init__(self, model_dir, prefer_quantized=True, max_length=None, num_threads=None, model_file=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        config = {}
+        config_file = model_dir / ENCODER_CONFIG_FILE
+        if config_file.exists():
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+
+        if model_file is None:
+            model_file = model_dir / ENCODER_FILE
+            # The int8 encoder is only used if the export recorded that it passed the parity check
+            if prefer_quantized and config.get('quantized') and (model_dir / QUANTIZED_ENCODER_FILE).exists():
+                model_file = model_dir / QUANTIZED_ENCODER_FILE
+        self.model_file = Path(model_file)
+
+        self.max_length = max_length or config.get('max_seq_length', 256)
+        self.model_name = config.get('model_name', 'unknown')
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding(pad_id=config.get('pad_token_id', 0), pad_token=config.get('pad_token', '[PAD]'))
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_file), options, providers=['CPUExecutionProvider'])
+        self.input_names = {inp.name for inp in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=True, **kwargs):
+        """
+        Encode sentences into embeddings.
+
+        Accepts the same core arguments as SentenceTransformer.encode and
+        returns a (n, dim) float32 numpy array.
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            batch = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in batch], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in batch], dtype=np.int64)
+            feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in self.input_names:
+                feeds['token_type_ids'] = np.array([e.type_ids for e in batch], dtype=np.int64)
+
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over non-padding tokens
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if normalize_embeddings:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            outputs.append(pooled.astype(np.float32))
+
+        return np.concatenate(outputs, axis=0) if outputs else np.empty((0, 0), dtype=np.float32)
@@ -0,0 +1,97 @@
+"""
+Aho-Corasick multi-pattern matcher.
+
+Finds every registered keyword that occurs as a substring of a text in one
+pass over the text, regardless of how many keywords are registered. Used by
+the chat assistant to replace per-keyword `keyword in message` scans.
+"""
+
+from collections import deque
+
+
+class PatternAutomaton:
+    """
+    Substring matcher over a fixed set of keywords.
+
+    Keywords are matched case-sensitively, exactly like `keyword in text`;
+    callers lowercase both sides when they need case-insensitive matching.
+    """
+
+    def __init__(self, keywords=()):
+        self._goto = [{}]  # node -> {char: node}
+        self._fail = [0]
+        self._terminal = [()]  # node -> keywords ending exactly at this node
+        self._output = [()]  # node -> keywords ending here, including via failure links
+        self._keywords = set()
+        self._compiled = True
+        for keyword in keywords:
+            self.add(keyword)
+        self.compile()
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def __contains__(self, keyword):
+        return keyword in self._keywords
+
+    def add(self, keyword):
+        """Register a keyword (call compile() before matching)."""
+        if not keyword or keyword in self._keywords:
+            return
+        self._keywords.add(keyword)
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(())
+            node = next_node
+        self._terminal[node] = self._terminal[node] + (keyword,)
+        self._compiled = False
+
+    def compile(self):
+        """Build failure links (breadth-first) and merge outputs along them."""
+        self._output = list(self._terminal)
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                if self._output[self._fail[child]]:
+                    self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._compiled = True
+
+    def find_all(self, text):
+        """Return the set of registered keywords that occur in text."""
+        if not self._compiled:
+            self.compile()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+    def contains_any(self, text, keywords=None):
+        """True if any keyword (or any of the given subset) occurs in text."""
+        found = self.find_all(text)
+        if keywords is None:
+            return bool(found)
+        return not found.isdisjoint(keywords)
@@ -0,0 +1,79 @@
+"""
+Bounded cache of /api/predict results.
+
+Users often resubmit the same photo (retries, re-opening the result page).
+Results are keyed by (model version, SHA-256 of the image bytes), so a
+repeated image skips preprocessing, inference and the cartoon / general
+model checks, and a model hot-swap never serves results of the old version.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+PREDICTION_CACHE_MAX_ENTRIES = int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', 256))
+
+
+def prediction_cache_key(model_version, image_path):
+    """Cache key for an uploaded image under a model version."""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return model_version, digest.hexdigest()
+
+
+class PredictionCache:
+    """LRU cache of prediction payloads."""
+
+    def __init__(self, max_entries=PREDICTION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key, payload):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            versions = {version for version, _ in self._entries}
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'model_versions': sorted(str(version) for version in versions),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# Global instance
+_prediction_cache = None
+_prediction_cache_lock = threading.Lock()
+
+
+def get_prediction_cache():
+    """Get or create the prediction cache."""
+    global _prediction_cache
+    with _prediction_cache_lock:
+        if _prediction_cache is None:
+            _prediction_cache = PredictionCache()
+        return _prediction_cache
@@ -149,6 +149,22 @@ def get_random_quiz(category=None, difficulty=None):
     return random.choice(filtered_quizzes)
 
 
+def get_quiz_by_id(quiz_id):
+    """
+    根据ID获取题目
+
+    Args:
+        quiz_id: 题目ID
+
+    Returns:
+        题目字典，如果不存在则返回None
+    """
+    for quiz in QUIZ_LIBRARY:
+        if quiz.get('id') == quiz_id:
+            return quiz
+    return None
+
+
 def format_quiz_message(quiz, language='en'):
     """
     格式化题目为对话消息（支持双语）
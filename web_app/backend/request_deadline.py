@@ -0,0 +1,178 @@
+"""
+Per-request latency budget for /api/predict.
+
+Every prediction gets a deadline: PREDICT_DEADLINE_MS by default, or the
+value of the X-Request-Deadline-Ms header (clamped to
+[PREDICT_DEADLINE_MIN_MS, PREDICT_DEADLINE_MAX_MS]). The classifier itself
+always runs; before each optional stage (cartoon check, general model
+verification, similar species) the pipeline asks RequestDeadline.allows()
+whether the expected cost of the stage still fits in the remaining budget.
+
+Expected costs are running averages of what each stage actually took on
+this instance (StageCosts), starting from STAGE_COST_PRIORS_MS, so a slow
+instance learns to skip stages earlier. A skipped stage is not measured,
+so estimates decay back toward the prior while a stage goes unobserved,
+and a small fraction of requests (STAGE_PROBE_RATE) runs a stage that
+does not fit anyway, as long as some budget is left, to re-measure it.
+The response lists which stages ran, how long each took and why the
+others were skipped.
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+PREDICT_DEADLINE_MS = float(os.environ.get('PREDICT_DEADLINE_MS', 4000))
+PREDICT_DEADLINE_MIN_MS = 200.0
+PREDICT_DEADLINE_MAX_MS = float(os.environ.get('PREDICT_DEADLINE_MAX_MS', 30000))
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Starting estimates until a stage has been observed on this instance
+STAGE_COST_PRIORS_MS = {
+    'cartoon_check': 150.0,
+    'cartoon_check_thumbnail': 40.0,
+    'general_model': 600.0,
+    'similar_species': 20.0
+}
+STAGE_COST_ALPHA = 0.2  # weight of the newest observation in the running average
+STAGE_COST_HALF_LIFE = float(os.environ.get('STAGE_COST_HALF_LIFE', 300))  # seconds for an unobserved estimate to move halfway back to the prior
+STAGE_PROBE_RATE = float(os.environ.get('STAGE_PROBE_RATE', 0.02))
+
+# Reasons recorded for stages that did not run
+SKIPPED_DEADLINE = 'deadline'
+
+
+class StageCosts:
+    """Exponentially weighted mean duration per stage."""
+
+    def __init__(self, priors=None, alpha=STAGE_COST_ALPHA, half_life=STAGE_COST_HALF_LIFE):
+        self.alpha = alpha
+        self.half_life = half_life
+        self.priors = dict(STAGE_COST_PRIORS_MS if priors is None else priors)
+        self._estimates = dict(self.priors)
+        self._updated_at = {}  # stage -> time of the last observation
+        self._observed = {}
+        self._lock = threading.Lock()
+
+    def _current(self, stage, now):
+        """Estimate with the decay toward the prior since the last observation applied."""
+        estimate = self._estimates.get(stage, 0.0)
+        prior = self.priors.get(stage)
+        updated_at = self._updated_at.get(stage)
+        if prior is None or updated_at is None or self.half_life <= 0:
+            return estimate
+        return prior + (estimate - prior) * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def estimate(self, stage):
+        with self._lock:
+            return self._current(stage, time.time())
+
+    def observe(self, stage, duration_ms):
+        with self._lock:
+            now = time.time()
+            if stage in self._estimates:
+                # The prior counts as an earlier observation, so one outlier cannot replace it
+                previous = self._current(stage, now)
+                self._estimates[stage] = previous + self.alpha * (duration_ms - previous)
+            else:
+                self._estimates[stage] = duration_ms
+            self._updated_at[stage] = now
+            self._observed[stage] = self._observed.get(stage, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {stage: {'estimate_ms': round(self._current(stage, now), 1),
+                            'observed': self._observed.get(stage, 0)}
+                    for stage in self._estimates}
+
+
+class RequestDeadline:
+    """Remaining budget and stage timings of one request."""
+
+    def __init__(self, budget_ms=PREDICT_DEADLINE_MS, costs=None):
+        self.budget_ms = budget_ms
+        self.costs = costs if costs is not None else get_stage_costs()
+        self._start = time.perf_counter()
+        self.stages = []
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def remaining_ms(self):
+        return self.budget_ms - self.elapsed_ms()
+
+    def allows(self, cost_key):
+        """
+        Does the expected cost of cost_key fit in the remaining budget?
+
+        With probability STAGE_PROBE_RATE a stage that does not fit is run
+        anyway (while budget remains), so its estimate keeps being measured.
+        """
+        remaining_ms = self.remaining_ms()
+        if remaining_ms >= self.costs.estimate(cost_key):
+            return True
+        return remaining_ms > 0 and random.random() < STAGE_PROBE_RATE
+
+    @contextmanager
+    def stage(self, name, cost_key=None, **details):
+        """
+        Time a stage that runs.
+
+        cost_key names the cost estimate the duration feeds (defaults to
+        name; e.g. the thumbnail cartoon check has its own). Mandatory
+        stages pass cost_key=False and are only reported.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000, cost_key, **details)
+
+    def record(self, name, duration_ms, cost_key=None, **details):
+        """Report a stage that ran and was timed by the caller."""
+        self.stages.append(dict({'stage': name, 'ran': True, 'ms': round(duration_ms, 1)}, **details))
+        if cost_key is not False:
+            self.costs.observe(cost_key or name, duration_ms)
+
+    def skip(self, name, reason):
+        self.stages.append({'stage': name, 'ran': False, 'reason': reason})
+
+    @property
+    def degraded(self):
+        """Was any stage skipped or cut short for lack of time?"""
+        return any(stage.get('reason') == SKIPPED_DEADLINE or stage.get('cut_short') for stage in self.stages)
+
+    def report(self):
+        return {
+            'budget_ms': self.budget_ms,
+            'elapsed_ms': round(self.elapsed_ms(), 1),
+            'stages': list(self.stages)
+        }
+
+
+def deadline_budget_ms(header_value, default_ms=PREDICT_DEADLINE_MS):
+    """Budget from the deadline header, clamped; default_ms if missing or malformed."""
+    try:
+        budget_ms = float(header_value) if header_value else default_ms
+    except (TypeError, ValueError):
+        budget_ms = default_ms
+    if budget_ms != budget_ms:  # NaN
+        budget_ms = default_ms
+    return min(max(budget_ms, PREDICT_DEADLINE_MIN_MS), PREDICT_DEADLINE_MAX_MS)
+
+
+# Global instance
+_stage_costs = None
+_stage_costs_lock = threading.Lock()
+
+
+def get_stage_costs():
+    """Get or create the per-stage cost estimates."""
+    global _stage_costs
+    with _stage_costs_lock:
+        if _stage_costs is None:
+            _stage_costs = StageCosts()
+        return _stage_costs
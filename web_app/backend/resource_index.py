@@ -0,0 +1,147 @@
+"""
+Indexed resource recommendation for the chat assistant.
+
+resource_library.json is indexed once at load: keyword, keyword-word and tag
+postings, category trigger words, and a language-support bitmask per
+resource. All terms go into one PatternAutomaton, so a recommendation makes
+a single pass over the message and scores only the resources that share a
+term with it.
+
+Scoring is identical to the original per-resource loop:
+language supported +5, keyword substring +3 (else any keyword word +1),
+tag substring +2, category trigger +2 (once); resources with a score below
+5 are dropped unless the language is supported.
+"""
+
+from pattern_automaton import PatternAutomaton
+
+LANGUAGE_MATCH_SCORE = 5
+KEYWORD_MATCH_SCORE = 3
+KEYWORD_WORD_SCORE = 1
+TAG_MATCH_SCORE = 2
+CATEGORY_MATCH_SCORE = 2
+
+CATEGORY_TRIGGERS = {
+    'photography': ['photography', 'photo', 'camera', '拍照', '摄影', '相机'],
+    'field_guide': ['guide', 'field guide', 'identification', '图鉴', '指南', '识别'],
+    'observation_platform': ['platform', 'observation', 'watch', '观察', '平台', '观测'],
+    'mobile_app': ['app', 'mobile', 'application', '应用', '手机'],
+    'sound_database': ['sound', 'audio', 'call', '声音', '音频', '叫声']
+}
+
+
+class ResourceIndex:
+    """Inverted index over the resource library."""
+
+    def __init__(self, resources):
+        self.resources = list(resources)
+        self.language_bits = {}  # language code -> bit
+        self.language_masks = []  # resource position -> bitmask of supported languages
+        self.by_language = {}  # language code -> resource positions in library order
+
+        self.keywords = []  # keyword slot -> (resource position, lowercased keyword)
+        self.keyword_postings = {}  # keyword -> [keyword slots]
+        self.word_postings = {}  # keyword word -> [keyword slots]
+        self.tag_postings = {}  # tag -> [resource positions] (one entry per tag occurrence)
+        self.category_members = {}  # category -> [resource positions]
+        self.trigger_postings = {}  # trigger word -> [categories]
+        automaton = PatternAutomaton()
+
+        for position, resource in enumerate(self.resources):
+            mask = 0
+            for language in resource.get('language_support', []):
+                if language not in self.language_bits:
+                    self.language_bits[language] = 1 << len(self.language_bits)
+                if not mask & self.language_bits[language]:
+                    self.by_language.setdefault(language, []).append(position)
+                mask |= self.language_bits[language]
+            self.language_masks.append(mask)
+
+            for keyword in resource.get('keywords', []):
+                keyword_lower = keyword.lower()
+                slot = len(self.keywords)
+                self.keywords.append((position, keyword_lower))
+                self.keyword_postings.setdefault(keyword_lower, []).append(slot)
+                automaton.add(keyword_lower)
+                for word in set(keyword_lower.split()):
+                    self.word_postings.setdefault(word, []).append(slot)
+                    automaton.add(word)
+
+            for tag in resource.get('tags', []):
+                tag_lower = tag.lower()
+                self.tag_postings.setdefault(tag_lower, []).append(position)
+                automaton.add(tag_lower)
+
+            category = resource.get('category', '')
+            if category in CATEGORY_TRIGGERS:
+                self.category_members.setdefault(category, []).append(position)
+
+        for category, triggers in CATEGORY_TRIGGERS.items():
+            for trigger in triggers:
+                self.trigger_postings.setdefault(trigger, []).append(category)
+                automaton.add(trigger)
+
+        # '' is a substring of every message; PatternAutomaton ignores it
+        self._always_found = {s for s in list(self.keyword_postings) + list(self.tag_postings) if s == ''}
+        automaton.compile()
+        self.automaton = automaton
+
+    def __len__(self):
+        return len(self.resources)
+
+    def score_terms(self, message_lower):
+        """Term scores (keywords, tags, category) of the resources sharing a term with the message."""
+        found = self.automaton.find_all(message_lower) | self._always_found
+
+        keyword_scores = {}  # keyword slot -> score
+        matched_categories = set()
+        scores = {}
+        for string in found:
+            for slot in self.word_postings.get(string, ()):
+                if slot not in keyword_scores:
+                    keyword_scores[slot] = KEYWORD_WORD_SCORE
+            for slot in self.keyword_postings.get(string, ()):
+                keyword_scores[slot] = KEYWORD_MATCH_SCORE
+            for position in self.tag_postings.get(string, ()):
+                scores[position] = scores.get(position, 0) + TAG_MATCH_SCORE
+            matched_categories.update(self.trigger_postings.get(string, ()))
+
+        for slot, score in keyword_scores.items():
+            position = self.keywords[slot][0]
+            scores[position] = scores.get(position, 0) + score
+        for category in matched_categories:
+            for position in self.category_members.get(category, ()):
+                scores[position] = scores.get(position, 0) + CATEGORY_MATCH_SCORE
+        return scores
+
+    def match(self, message_lower, language, limit=3):
+        """
+        Top resources for a lowercased message.
+
+        Returns:
+            List of at most `limit` resource dicts, highest score first,
+            ties in library order
+        """
+        language_bit = self.language_bits.get(language, 0)
+        ranked = []
+        for position, term_score in self.score_terms(message_lower).items():
+            language_match = bool(self.language_masks[position] & language_bit)
+            score = term_score + (LANGUAGE_MATCH_SCORE if language_match else 0)
+            # 分数太低且语言不匹配，跳过
+            if score <= 0 or (not language_match and score < LANGUAGE_MATCH_SCORE):
+                continue
+            ranked.append((-score, position))
+
+        # Resources without any matching term still score LANGUAGE_MATCH_SCORE
+        # when they support the language; only the first few can make the cut
+        touched = {position for _, position in ranked}
+        fillers = 0
+        for position in self.by_language.get(language, ()):
+            if fillers >= limit:
+                break
+            if position not in touched:
+                ranked.append((-LANGUAGE_MATCH_SCORE, position))
+                fillers += 1
+
+        ranked.sort()
+        return [self.resources[position] for _, position in ranked[:limit]]
@@ -7,9 +7,13 @@ Falls back to keyword matching if the model is not available.
 
 import os
 import json
+import threading
+from collections import OrderedDict
 import numpy as np
 from pathlib import Path
 
+from onnx_encoder import OnnxSentenceEncoder, is_onnx_encoder_available
+
 # Global variables for caching
 _model = None
 _embeddings = None
@@ -17,6 +21,76 @@ _species_keys = None
 _species_index = None
 _is_initialized = False
 _use_semantic = False
+_index_version = None
+_species_rows = {}  # species key -> numpy array of embedding row indices
+_ann_index = None  # IVFIndex, used instead of brute force for large catalogs
+_max_rows_per_species = 1
+
+# Cache size bounds (override with environment variables)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('SEMANTIC_EMBEDDING_CACHE_SIZE', 2048))
+SEARCH_RESULT_CACHE_SIZE = int(os.environ.get('SEMANTIC_RESULT_CACHE_SIZE', 1024))
+
+# Set SEMANTIC_USE_ONNX=0 to force sentence-transformers even if an ONNX encoder is bundled
+USE_ONNX_ENCODER = os.environ.get('SEMANTIC_USE_ONNX', '1') != '0'
+
+# Use the ANN index (if built) once the catalog has at least this many embedding rows
+ANN_MIN_ROWS = int(os.environ.get('SEMANTIC_ANN_MIN_ROWS', 20000))
+ANN_N_PROBE = int(os.environ.get('SEMANTIC_ANN_N_PROBE', 0)) or None  # None = value stored in the index
+
+
+class LRUCache:
+    """Thread-safe bounded LRU cache with hit/miss counters."""
+    
+    def __init__(self, max_size):
+        self.max_size = max(int(max_size), 0)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entry if full."""
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# normalized query -> embedding vector
+_query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+# (index version, normalized query, category, refinement set, top_k) -> ranked matches
+_search_result_cache = LRUCache(SEARCH_RESULT_CACHE_SIZE)
 
 
 def get_model_path():
@@ -42,9 +116,116 @@ def is_model_available():
     return embeddings_file.exists() and index_file.exists()
 
 
+def compute_index_version(model_dir=None):
+    """
+    Compute a version string for the embedding index on disk.
+    
+    Changes whenever the embeddings or species index files are rewritten
+    (e.g. by train_description_model.py), so cached results can be invalidated.
+    """
+    model_dir = Path(model_dir) if model_dir else get_model_path()
+    parts = []
+    for name in ('species_embeddings.npz', 'species_index.json', 'species_ann_index.npz'):
+        path = model_dir / name
+        if path.exists():
+            stat = path.stat()
+            parts.append(f"{name}:{stat.st_size}:{int(stat.st_mtime)}")
+    return '|'.join(parts) if parts else None
+
+
+def get_index_version():
+    """Return the version of the currently loaded embedding index."""
+    return _index_version
+
+
+def set_index_version(version):
+    """Record a new index version and drop caches built against the old one."""
+    global _index_version
+    if version != _index_version:
+        _index_version = version
+        clear_caches()
+
+
+def clear_caches():
+    """Clear the query embedding and search result caches."""
+    _query_embedding_cache.clear()
+    _search_result_cache.clear()
+
+
+def get_cache_stats():
+    """Return size and hit-rate counters for the semantic matcher caches."""
+    return {
+        'index_version': _index_version,
+        'query_embeddings': _query_embedding_cache.stats(),
+        'search_results': _search_result_cache.stats()
+    }
+
+
+def normalize_query(query):
+    """Normalize a query for cache lookups (case and whitespace insensitive)."""
+    return ' '.join((query or '').lower().split())
+
+
+def encode_query(query):
+    """
+    Encode a query into a normalized embedding, using the LRU cache.
+    
+    Returns:
+        1-D numpy array, or None if the model is not loaded
+    """
+    if _model is None:
+        return None
+    
+    key = normalize_query(query)
+    embedding = _query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = _model.encode([key], normalize_embeddings=True)[0]
+        _query_embedding_cache.put(key, embedding)
+    return embedding
+
+
+def build_species_rows(species_keys):
+    """Map each species key to the embedding row indices of its description variants."""
+    rows = {}
+    for idx, key in enumerate(species_keys):
+        rows.setdefault(str(key), []).append(idx)
+    return {key: np.array(indices, dtype=np.int64) for key, indices in rows.items()}
+
+
+def load_ann_index(model_dir, embeddings):
+    """Load the ANN index built by train_description_model.py, if present and worthwhile."""
+    index_file = Path(model_dir) / 'species_ann_index.npz'
+    if not index_file.exists():
+        return None
+    if len(embeddings) < ANN_MIN_ROWS:
+        print(f"ℹ️ ANN index found but catalog is small ({len(embeddings)} rows); using brute force")
+        return None
+    try:
+        from embedding_index import IVFIndex
+        index = IVFIndex.load(index_file, embeddings)
+        print(f"✅ Loaded ANN index: {index.n_lists} lists, n_probe={ANN_N_PROBE or index.n_probe}")
+        return index
+    except Exception as e:
+        print(f"⚠️ Failed to load ANN index, using brute force: {e}")
+        return None
+
+
+def _category_type(category):
+    """Map a category filter ('bird', 'birds', 'butterflies', ...) to a species type."""
+    if not category:
+        return None
+    category = category.lower()
+    if category in ['bird', 'birds']:
+        return 'bird'
+    if category in ['butterfly', 'butterflies']:
+        return 'butterfly'
+    return None
+
+
 def initialize():
     """Initialize the semantic matcher."""
-    global _model, _embeddings, _species_keys, _species_index, _is_initialized, _use_semantic
+    global _model, _embeddings, _species_keys, _species_index, _is_initialized, _use_semantic, _species_rows
+    global _ann_index, _max_rows_per_species
     
     if _is_initialized:
         return _use_semantic
@@ -58,17 +239,22 @@ def initialize():
         _use_semantic = False
         return False
     
-    # Try to load sentence-transformers
-    try:
-        from sentence_transformers import SentenceTransformer
-    except ImportError:
-        print("⚠️ sentence-transformers not installed. Using keyword matching.")
-        print("   Install with: pip install sentence-transformers")
-        _use_semantic = False
-        return False
+    model_dir = get_model_path()
+    
+    # Prefer the bundled ONNX encoder (no torch import, no download);
+    # otherwise try to load sentence-transformers
+    use_onnx = USE_ONNX_ENCODER and is_onnx_encoder_available(model_dir)
+    if not use_onnx:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            print("⚠️ sentence-transformers not installed and no ONNX encoder found. Using keyword matching.")
+            print("   Install with: pip install sentence-transformers")
+            print("   Or export an ONNX encoder: python train_description_model.py --export-onnx")
+            _use_semantic = False
+            return False
     
     try:
-        model_dir = get_model_path()
         
         # Load species index
         index_file = model_dir / 'species_index.json'
@@ -80,11 +266,20 @@ def initialize():
         data = np.load(embeddings_file, allow_pickle=True)
         _embeddings = data['embeddings']
         _species_keys = data['species_keys']
+        _species_rows = build_species_rows(_species_keys)
+        _max_rows_per_species = max((len(rows) for rows in _species_rows.values()), default=1)
+        _ann_index = load_ann_index(model_dir, _embeddings)
         
         # Load model
         model_name = _species_index.get('model_name', 'all-MiniLM-L6-v2')
-        print(f"🤖 Loading Sentence Transformer model: {model_name}")
-        _model = SentenceTransformer(model_name)
+        if use_onnx:
+            _model = OnnxSentenceEncoder(model_dir)
+            print(f"🤖 Loaded ONNX sentence encoder: {_model.model_file.name} ({_model.model_name})")
+        else:
+            print(f"🤖 Loading Sentence Transformer model: {model_name}")
+            _model = SentenceTransformer(model_name)
+        
+        set_index_version(compute_index_version(model_dir))
         
         print(f"✅ Semantic matcher initialized with {len(_species_index['species'])} species")
         _use_semantic = True
@@ -139,15 +334,17 @@ def check_color_match(query_colors, species_description):
     return True, match_ratio
 
 
-def semantic_search(query, category=None, top_k=5):
+def semantic_search(query, category=None, top_k=5, refinement_keys=None):
     """
     Perform semantic search to find matching species.
     Enhanced with color filtering for better accuracy.
+    Results are cached per (query, category, refinement set) for the current index version.
     
     Args:
         query: User's description of the species
         category: Optional filter ('bird', 'butterfly', or None for all)
         top_k: Number of top matches to return
+        refinement_keys: Optional set of species keys to restrict the search to
     
     Returns:
         List of matches with scores and species info
@@ -157,96 +354,167 @@ def semantic_search(query, category=None, top_k=5):
     if not _use_semantic or _model is None:
         return None  # Signal to fall back to keyword matching
     
+    refinement = frozenset(refinement_keys) if refinement_keys else frozenset()
+    cache_key = (
+        _index_version,
+        normalize_query(query),
+        (category or '').lower(),
+        refinement,
+        top_k
+    )
+    cached = _search_result_cache.get(cache_key)
+    if cached is not None:
+        # Hand out copies so callers can't mutate the cached entries
+        return [dict(match) for match in cached]
+    
     try:
         # Extract colors from query for filtering
         query_colors = extract_colors_from_query(query)
         
-        # Encode the query
-        query_embedding = _model.encode([query], normalize_embeddings=True)
+        # Encode the query (cached by normalized text)
+        query_embedding = encode_query(query)
+        
+        final_results = rank_by_embedding(query_embedding, query_colors, category, top_k, refinement)
+        _search_result_cache.put(cache_key, [dict(match) for match in final_results])
+        return final_results
+        
+    except Exception as e:
+        print(f"Error in semantic search: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def search_by_embedding(query_embedding, query_colors=None, category=None, top_k=5, refinement_keys=None):
+    """
+    Semantic search with a precomputed query embedding (e.g. a conversation vector).
+    
+    Returns:
+        List of matches, or None if semantic matching is unavailable
+    """
+    if not _use_semantic or _embeddings is None:
+        return None
+    
+    try:
+        refinement = frozenset(refinement_keys) if refinement_keys else frozenset()
+        return rank_by_embedding(query_embedding, query_colors or [], category, top_k, refinement)
+    except Exception as e:
+        print(f"Error in semantic search: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def rank_by_embedding(query_embedding, query_colors, category=None, top_k=5, refinement=frozenset()):
+    """
+    Rank species against a normalized query embedding.
+    
+    When a refinement set is given, only the embedding rows of those species are scored.
+    """
+    if refinement and _species_rows:
+        # Score only the embedding rows belonging to the surviving candidates
+        rows = [_species_rows[key] for key in refinement if key in _species_rows]
+        if not rows:
+            return []
+        row_indices = np.concatenate(rows)
+    elif _ann_index is not None:
+        # Approximate search over the closest clusters (category filtered inside the index)
+        n_rows = top_k * 4 * _max_rows_per_species
+        sorted_indices, sorted_scores = _ann_index.search(
+            query_embedding, n_rows, n_probe=ANN_N_PROBE, category=_category_type(category)
+        )
+        return _collect_matches(sorted_indices, sorted_scores, query_colors, category, top_k, refinement)
+    else:
+        row_indices = None
+    
+    # Calculate similarities
+    candidate_embeddings = _embeddings if row_indices is None else _embeddings[row_indices]
+    similarities = np.dot(candidate_embeddings, query_embedding)
+    
+    # Get indices sorted by similarity (highest first)
+    order = np.argsort(similarities)[::-1]
+    sorted_indices = order if row_indices is None else row_indices[order]
+    sorted_scores = similarities[order]
+    return _collect_matches(sorted_indices, sorted_scores, query_colors, category, top_k, refinement)
+
+
+def _collect_matches(sorted_indices, sorted_scores, query_colors, category, top_k, refinement):
+    """Turn ranked embedding rows into unique, filtered, color-boosted species matches."""
+    # Collect unique species (since we have multiple embeddings per species)
+    seen_species = set()
+    matches = []
+    color_matched = []  # Store color-matched results separately
+    
+    for idx, similarity in zip(sorted_indices, sorted_scores):
+        if len(matches) >= top_k * 4:  # Get more initially for filtering
+            break
+            
+        species_key = str(_species_keys[idx])
         
-        # Calculate similarities
-        similarities = np.dot(_embeddings, query_embedding.T).flatten()
+        # Skip if already seen
+        if species_key in seen_species:
+            continue
+        seen_species.add(species_key)
         
-        # Get indices sorted by similarity (highest first)
-        sorted_indices = np.argsort(similarities)[::-1]
+        # Restrict to the refinement set if one was given
+        if refinement and species_key not in refinement:
+            continue
         
-        # Collect unique species (since we have multiple embeddings per species)
-        seen_species = set()
-        matches = []
-        color_matched = []  # Store color-matched results separately
+        # Get species info
+        species_info = _species_index['species'].get(species_key, {})
+        species_type = species_info.get('type', 'unknown')
         
-        for idx in sorted_indices:
-            if len(matches) >= top_k * 4:  # Get more initially for filtering
-                break
-                
-            species_key = str(_species_keys[idx])
-            
-            # Skip if already seen
-            if species_key in seen_species:
+        # Filter by category if specified
+        if category:
+            if category.lower() in ['bird', 'birds'] and species_type != 'bird':
                 continue
-            seen_species.add(species_key)
-            
-            # Get species info
-            species_info = _species_index['species'].get(species_key, {})
-            species_type = species_info.get('type', 'unknown')
-            
-            # Filter by category if specified
-            if category:
-                if category.lower() in ['bird', 'birds'] and species_type != 'bird':
-                    continue
-                if category.lower() in ['butterfly', 'butterflies'] and species_type != 'butterfly':
-                    continue
-            
-            score = float(similarities[idx])
+            if category.lower() in ['butterfly', 'butterflies'] and species_type != 'butterfly':
+                continue
+        
+        score = float(similarity)
+        
+        # Only include if similarity is above threshold
+        if score > 0.1:  # Minimum threshold
+            match_entry = {
+                'species_key': species_key,
+                'score': score,
+                'confidence': min(score * 1.5, 1.0),  # Scale to 0-1
+                'species_info': species_info
+            }
             
-            # Only include if similarity is above threshold
-            if score > 0.1:  # Minimum threshold
-                match_entry = {
-                    'species_key': species_key,
-                    'score': score,
-                    'confidence': min(score * 1.5, 1.0),  # Scale to 0-1
-                    'species_info': species_info
-                }
+            # Check color matching if user specified colors
+            if query_colors:
+                # Get species colors from stored info or description
+                species_colors = species_info.get('colors', [])
+                species_desc = species_info.get('description', '')
+                
+                # Check if any query color matches
+                has_color_match, color_ratio = check_color_match(query_colors, species_desc)
                 
-                # Check color matching if user specified colors
-                if query_colors:
-                    # Get species colors from stored info or description
-                    species_colors = species_info.get('colors', [])
-                    species_desc = species_info.get('description', '')
-                    
-                    # Check if any query color matches
-                    has_color_match, color_ratio = check_color_match(query_colors, species_desc)
-                    
-                    if has_color_match and color_ratio > 0:
-                        # Boost score for color matches
-                        match_entry['score'] = score * (1 + color_ratio * 0.5)
-                        match_entry['confidence'] = min(match_entry['score'] * 1.5, 1.0)
-                        match_entry['color_match'] = True
-                        match_entry['color_ratio'] = color_ratio
-                        color_matched.append(match_entry)
-                    else:
-                        match_entry['color_match'] = False
-                        matches.append(match_entry)
+                if has_color_match and color_ratio > 0:
+                    # Boost score for color matches
+                    match_entry['score'] = score * (1 + color_ratio * 0.5)
+                    match_entry['confidence'] = min(match_entry['score'] * 1.5, 1.0)
+                    match_entry['color_match'] = True
+                    match_entry['color_ratio'] = color_ratio
+                    color_matched.append(match_entry)
                 else:
+                    match_entry['color_match'] = False
                     matches.append(match_entry)
-        
-        # Prioritize color-matched results
-        if query_colors and color_matched:
-            # Sort color matches by score
-            color_matched.sort(key=lambda x: x['score'], reverse=True)
-            # Combine: color matches first, then others
-            final_results = color_matched + matches
-        else:
-            final_results = matches
-        
-        # Take top_k matches
-        return final_results[:top_k]
-        
-    except Exception as e:
-        print(f"Error in semantic search: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+            else:
+                matches.append(match_entry)
+    
+    # Prioritize color-matched results
+    if query_colors and color_matched:
+        # Sort color matches by score
+        color_matched.sort(key=lambda x: x['score'], reverse=True)
+        # Combine: color matches first, then others
+        final_results = color_matched + matches
+    else:
+        final_results = matches
+    
+    # Take top_k matches
+    return final_results[:top_k]
 
 
 def get_follow_up_questions(matches, original_query):
@@ -310,7 +578,8 @@ def get_follow_up_questions(matches, original_query):
     return questions[:3]
 
 
-def identify_species_semantic(description, category=None, conversation_history=None):
+def identify_species_semantic(description, category=None, conversation_history=None, refinement_keys=None,
+                              query_embedding=None, query_colors=None):
     """
     Main identification function using semantic matching.
     
@@ -318,6 +587,9 @@ def identify_species_semantic(description, category=None, conversation_history=N
         description: Full description text
         category: Optional filter ('bird', 'butterfly', or None)
         conversation_history: Previous messages in the conversation
+        refinement_keys: Optional set of species keys to restrict matches to
+        query_embedding: Optional precomputed query vector (skips encoding the description)
+        query_colors: Optional colors already parsed from the description
     
     Returns:
         Dictionary with matches, follow_up_questions, and metadata
@@ -326,7 +598,12 @@ def identify_species_semantic(description, category=None, conversation_history=N
     initialize()
     
     # Try semantic search
-    matches = semantic_search(description, category)
+    if query_embedding is not None:
+        if query_colors is None:
+            query_colors = extract_colors_from_query(description)
+        matches = search_by_embedding(query_embedding, query_colors, category, refinement_keys=refinement_keys)
+    else:
+        matches = semantic_search(description, category, refinement_keys=refinement_keys)
     
     if matches is None:
         # Semantic search not available, return None to signal fallback
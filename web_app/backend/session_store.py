@@ -0,0 +1,270 @@
+"""
+Session store for per-user assistant state.
+
+EnhancedAIAssistant keeps conversation memory, user profiles, quiz state and
+language preferences per user_id. This module stores that state behind a
+small key-value interface, namespaced per kind of state, with two backends:
+
+- MemorySessionStore: per-process LRU with TTL expiry (default)
+- SQLiteSessionStore: SQLite database in WAL mode, shared by all worker
+  processes on the same host; capped at ASSISTANT_SESSION_DB_MAX_ENTRIES
+  rows (the entries closest to expiry are evicted first)
+
+Values are JSON-serialized compactly (and zlib-compressed when large), so
+both backends behave the same and report their memory/storage use.
+
+Select the backend with ASSISTANT_SESSION_BACKEND=memory|sqlite.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+SESSION_TTL_SECONDS = int(os.environ.get('ASSISTANT_SESSION_TTL', 7 * 24 * 3600))  # 7 days
+MAX_MEMORY_ENTRIES = int(os.environ.get('ASSISTANT_SESSION_MAX_ENTRIES', 20000))
+MAX_SQLITE_ENTRIES = int(os.environ.get('ASSISTANT_SESSION_DB_MAX_ENTRIES', 200000))
+COMPRESS_THRESHOLD = 512  # bytes; smaller payloads are stored uncompressed
+
+_RAW = b'j'
+_COMPRESSED = b'z'
+
+
+def encode_value(value):
+    """Serialize a JSON-compatible value to compact bytes."""
+    data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(data) > COMPRESS_THRESHOLD:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return _COMPRESSED + compressed
+    return _RAW + data
+
+
+def decode_value(blob):
+    """Inverse of encode_value."""
+    blob = bytes(blob)
+    marker, payload = blob[:1], blob[1:]
+    if marker == _COMPRESSED:
+        payload = zlib.decompress(payload)
+    return json.loads(payload.decode('utf-8'))
+
+
+class MemorySessionStore:
+    """In-process LRU + TTL session store."""
+
+    backend = 'memory'
+
+    def __init__(self, max_entries=MAX_MEMORY_ENTRIES, ttl_seconds=SESSION_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()  # (namespace, key) -> (expires_at, blob)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None:
+                return default
+            expires_at, blob = entry
+            if expires_at < time.time():
+                self._remove((namespace, key))
+                self.expirations += 1
+                return default
+            self._data.move_to_end((namespace, key))
+        return decode_value(blob)
+
+    def set(self, namespace, key, value):
+        blob = encode_value(value)
+        with self._lock:
+            self._remove((namespace, key))
+            self._data[(namespace, key)] = (time.time() + self.ttl_seconds, blob)
+            self._bytes += len(blob)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._remove((namespace, key))
+
+    def _remove(self, full_key):
+        entry = self._data.pop(full_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (expires_at, _) in self._data.items() if expires_at < now]
+            for full_key in expired:
+                self._remove(full_key)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'payload_bytes': self._bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SQLiteSessionStore:
+    """SQLite (WAL) session store shared across worker processes."""
+
+    backend = 'sqlite'
+
+    def __init__(self, db_path, max_entries=MAX_SQLITE_ENTRIES, ttl_seconds=SESSION_TTL_SECONDS, purge_interval=300):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._last_purge = 0.0
+        self.evictions = 0
+        self.expirations = 0
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            ' namespace TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' value BLOB NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+        # Row count and payload size, kept up to date by every write so stats() and the cap never scan
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS session_totals ('
+            ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+            ' entries INTEGER NOT NULL,'
+            ' payload_bytes INTEGER NOT NULL)'
+        )
+        conn.commit()
+        with conn:
+            if conn.execute('SELECT 1 FROM session_totals').fetchone() is None:
+                # Databases created before session_totals existed: count once
+                conn.execute(
+                    'INSERT OR IGNORE INTO session_totals (id, entries, payload_bytes)'
+                    ' SELECT 0, COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM sessions'
+                )
+
+    def _conn(self):
+        # One connection per thread; WAL lets readers and a writer work concurrently
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._conn().execute(
+            'SELECT value, expires_at FROM sessions WHERE namespace = ? AND key = ?',
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return default
+        if row[1] < time.time():
+            self.delete(namespace, key)
+            self.expirations += 1
+            return default
+        return decode_value(row[0])
+
+    def set(self, namespace, key, value):
+        blob = encode_value(value)
+        conn = self._conn()
+        with conn:
+            # Take the write lock first so the size bookkeeping cannot interleave with another process
+            conn.execute('BEGIN IMMEDIATE')
+            old = conn.execute(
+                'SELECT LENGTH(value) FROM sessions WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                (namespace, key, sqlite3.Binary(blob), time.time() + self.ttl_seconds)
+            )
+            conn.execute(
+                'UPDATE session_totals SET entries = entries + ?, payload_bytes = payload_bytes + ?',
+                (0 if old else 1, len(blob) - (old[0] if old else 0))
+            )
+            entries = conn.execute('SELECT entries FROM session_totals').fetchone()[0]
+            if entries > self.max_entries:
+                self.evictions += self._delete_where(
+                    conn, 'rowid IN (SELECT rowid FROM sessions ORDER BY expires_at LIMIT ?)',
+                    (entries - self.max_entries,)
+                )
+        if time.time() - self._last_purge > self.purge_interval:
+            self.purge_expired()
+
+    def delete(self, namespace, key):
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._delete_where(conn, 'namespace = ? AND key = ?', (namespace, key))
+
+    def purge_expired(self):
+        self._last_purge = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            removed = self._delete_where(conn, 'expires_at < ?', (time.time(),))
+        self.expirations += removed
+        return removed
+
+    @staticmethod
+    def _delete_where(conn, where, params):
+        """Delete matching rows and update session_totals (caller holds the write transaction)."""
+        removed, removed_bytes = conn.execute(
+            f'SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM sessions WHERE {where}', params
+        ).fetchone()
+        if removed:
+            conn.execute(f'DELETE FROM sessions WHERE {where}', params)
+            conn.execute('UPDATE session_totals SET entries = entries - ?, payload_bytes = payload_bytes - ?',
+                         (removed, removed_bytes))
+        return removed
+
+    def stats(self):
+        entries, payload_bytes = self._conn().execute(
+            'SELECT entries, payload_bytes FROM session_totals'
+        ).fetchone()
+        return {
+            'backend': self.backend,
+            'db_path': self.db_path,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'payload_bytes': payload_bytes,
+            'db_bytes': os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+def create_session_store(backend=None):
+    """Create the session store configured by ASSISTANT_SESSION_BACKEND."""
+    backend = backend or os.environ.get('ASSISTANT_SESSION_BACKEND', 'memory')
+    if backend == 'sqlite':
+        db_path = os.environ.get('ASSISTANT_SESSION_DB', os.path.join('sessions', 'assistant_sessions.db'))
+        try:
+            store = SQLiteSessionStore(db_path)
+            print(f"✅ Assistant session store: SQLite ({db_path})")
+            return store
+        except Exception as e:
+            print(f"⚠️ Failed to open SQLite session store ({e}), using in-memory store")
+    return MemorySessionStore()
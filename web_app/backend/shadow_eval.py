@@ -0,0 +1,354 @@
+"""
+Shadow evaluation of candidate model versions on live traffic.
+
+A candidate is a registered version (see model_registry.py) that is loaded
+next to the served one but never answers requests. For a sampled fraction
+of /api/predict and /api/predict-sound requests, the request thread hands
+the already preprocessed input and the served model's result to a
+ShadowEvaluator, which only queues them. A single background worker runs
+the candidate on them and records top-1 agreement, the confidence delta
+and both latencies in a SQLite store; /api/admin/shadow/report summarizes
+them.
+
+The request path never waits on the candidate. Sampling stops while the
+queue is full (entries are dropped, not queued), and the worker keeps its
+busy time under SHADOW_CPU_BUDGET of wall time by sleeping between
+evaluations, so it cannot starve request threads of CPU.
+"""
+
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+SHADOW_DB_PATH = os.environ.get('SHADOW_DB_PATH', os.path.join('shadow', 'shadow_eval.db'))
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.1))
+SHADOW_MAX_PENDING = int(os.environ.get('SHADOW_MAX_PENDING', 16))
+SHADOW_CPU_BUDGET = float(os.environ.get('SHADOW_CPU_BUDGET', 0.25))  # max busy fraction of the worker
+REPORT_MAX_ROWS = 100000
+TOP_DISAGREEMENTS = 10
+
+
+class ShadowResultStore:
+    """Per-request shadow results (SQLite, WAL); written by the workers, read by the report endpoint."""
+
+    def __init__(self, db_path=SHADOW_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(
+            'CREATE TABLE IF NOT EXISTS shadow_results ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' created_at REAL NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' primary_version TEXT NOT NULL,'
+            ' candidate_version TEXT NOT NULL,'
+            ' primary_class TEXT NOT NULL,'
+            ' candidate_class TEXT NOT NULL,'
+            ' primary_confidence REAL NOT NULL,'
+            ' candidate_confidence REAL NOT NULL,'
+            ' candidate_primary_confidence REAL,'
+            ' primary_ms REAL,'
+            ' candidate_ms REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS idx_shadow_results_candidate'
+            ' ON shadow_results (kind, candidate_version, id);'
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def record(self, result):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                'INSERT INTO shadow_results (created_at, kind, primary_version, candidate_version,'
+                ' primary_class, candidate_class, primary_confidence, candidate_confidence,'
+                ' candidate_primary_confidence, primary_ms, candidate_ms)'
+                ' VALUES (:created_at, :kind, :primary_version, :candidate_version, :primary_class,'
+                ' :candidate_class, :primary_confidence, :candidate_confidence,'
+                ' :candidate_primary_confidence, :primary_ms, :candidate_ms)', result
+            )
+
+    def candidates(self):
+        """(kind, candidate_version, results) for every candidate evaluated so far."""
+        return self._conn().execute(
+            'SELECT kind, candidate_version, COUNT(*) FROM shadow_results GROUP BY kind, candidate_version'
+        ).fetchall()
+
+    def report(self, kind, candidate_version, limit=REPORT_MAX_ROWS):
+        """
+        Agreement, confidence and latency summary over a candidate's most recent results.
+
+        Returns:
+            dict, or None if the candidate has no results
+        """
+        rows = self._conn().execute(
+            'SELECT primary_version, primary_class, candidate_class, primary_confidence, candidate_confidence,'
+            ' candidate_primary_confidence, primary_ms, candidate_ms, created_at FROM shadow_results'
+            ' WHERE kind = ? AND candidate_version = ? ORDER BY id DESC LIMIT ?',
+            (kind, candidate_version, limit)
+        ).fetchall()
+        if not rows:
+            return None
+        (primary_versions, primary_classes, candidate_classes, primary_conf, candidate_conf,
+         candidate_primary_conf, primary_ms, candidate_ms, created_at) = zip(*rows)
+        agree = np.array([p == c for p, c in zip(primary_classes, candidate_classes)])
+        primary_conf = np.array(primary_conf, dtype=np.float64)
+        candidate_conf = np.array(candidate_conf, dtype=np.float64)
+        # Candidate's probability for the class the served model chose, minus the served confidence
+        same_class_delta = np.array([np.nan if c is None else c for c in candidate_primary_conf],
+                                    dtype=np.float64) - primary_conf
+
+        disagreements = {}
+        for p, c, same in zip(primary_classes, candidate_classes, agree):
+            if not same:
+                disagreements[(p, c)] = disagreements.get((p, c), 0) + 1
+        top = sorted(disagreements.items(), key=lambda item: -item[1])[:TOP_DISAGREEMENTS]
+
+        return {
+            'kind': kind,
+            'candidate_version': candidate_version,
+            'primary_versions': sorted(set(primary_versions)),
+            'samples': len(rows),
+            'from': datetime.fromtimestamp(min(created_at)).isoformat(),
+            'to': datetime.fromtimestamp(max(created_at)).isoformat(),
+            'top1_agreement': float(agree.mean()),
+            'confidence': {
+                'primary_mean': float(primary_conf.mean()),
+                'candidate_mean': float(candidate_conf.mean()),
+                'mean_delta_on_primary_class': _nan_stat(np.nanmean, same_class_delta),
+                'mean_abs_delta_on_primary_class': _nan_stat(np.nanmean, np.abs(same_class_delta)),
+                'agreeing_mean_delta': (float((candidate_conf - primary_conf)[agree].mean())
+                                        if agree.any() else None)
+            },
+            'latency_ms': {
+                'primary': _latency_summary(primary_ms),
+                'candidate': _latency_summary(candidate_ms)
+            },
+            'top_disagreements': [{'primary': p, 'candidate': c, 'count': n} for (p, c), n in top]
+        }
+
+    def stats(self):
+        return {
+            'db_path': self.db_path,
+            'results': self._conn().execute('SELECT COUNT(*) FROM shadow_results').fetchone()[0]
+        }
+
+
+def _nan_stat(func, values):
+    if np.all(np.isnan(values)):
+        return None
+    return float(func(values))
+
+
+def _latency_summary(values):
+    values = np.array([v for v in values if v is not None], dtype=np.float64)
+    if not len(values):
+        return None
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'mean': float(values.mean()), 'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+            'max': float(values.max())}
+
+
+class ShadowEvaluator:
+    """Runs one candidate version of a model kind on sampled requests, on its own worker thread."""
+
+    def __init__(self, kind, registry, store, sample_rate=SHADOW_SAMPLE_RATE,
+                 max_pending=SHADOW_MAX_PENDING, cpu_budget=SHADOW_CPU_BUDGET):
+        self.kind = kind
+        self.registry = registry
+        self.store = store
+        self.sample_rate = sample_rate
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._candidate = None
+        self._target_version = None
+        self._worker = None
+        self.loading = None
+        self.sampled = 0
+        self.dropped = 0
+        self.evaluated = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.throttled_seconds = 0.0
+        self.last_error = None
+
+    @property
+    def candidate_version(self):
+        candidate = self._candidate
+        return candidate.version if candidate is not None else None
+
+    def start(self, version, sample_rate=None):
+        """Shadow a registered version (loaded by the worker; sampling starts once it is warm)."""
+        if version not in {manifest['version'] for manifest in self.registry.versions()}:
+            raise ValueError(f"Unknown {self.kind} model version: {version}")
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            self._target_version = version
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f'shadow-{self.kind}', daemon=True)
+                self._worker.start()
+                return
+        try:
+            self._queue.put_nowait(None)  # wake the worker to switch candidates
+        except queue.Full:
+            pass  # it checks the target again after its current item
+
+    def stop(self):
+        """Stop sampling and release the candidate (queued samples are discarded)."""
+        with self._lock:
+            self._target_version = None
+            self._candidate = None
+
+    def should_sample(self):
+        """Cheap check on the request thread: is this request shadowed?"""
+        return (self._candidate is not None and not self._queue.full()
+                and random.random() < self.sample_rate)
+
+    def submit(self, inputs, primary):
+        """
+        Queue a request's model input and the served model's result; never blocks.
+
+        primary: {'version', 'class', 'confidence', 'latency_ms'}
+        """
+        try:
+            self._queue.put_nowait((inputs, primary))
+            self.sampled += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _sync_candidate(self):
+        """Load the target version if it is not the current candidate (worker thread only)."""
+        target = self._target_version
+        if target is None or target == self.candidate_version:
+            return
+        self.loading = target
+        try:
+            candidate = self.registry.load_version(target)
+            with self._lock:
+                if self._target_version == target:
+                    self._candidate = candidate
+            print(f"🕶️ Shadowing {self.kind} model {target} at {self.sample_rate:.0%} of requests")
+        except Exception as e:
+            self.last_error = f"{target}: {e}"
+            print(f"❌ Failed to load shadow {self.kind} model {target}: {e}")
+            with self._lock:
+                if self._target_version == target:
+                    self._target_version = None
+        finally:
+            self.loading = None
+
+    def _run(self):
+        while True:
+            self._sync_candidate()
+            item = self._queue.get()
+            if item is None:
+                continue
+            candidate = self._candidate
+            if candidate is None:
+                continue
+            inputs, primary = item
+            start = time.perf_counter()
+            try:
+                self.store.record(self._evaluate(candidate, inputs, primary))
+                self.evaluated += 1
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"⚠️ Shadow evaluation failed ({self.kind}, {candidate.version}): {e}")
+            busy = time.perf_counter() - start
+            self.busy_seconds += busy
+            # Stay within the CPU budget: busy / (busy + idle) <= cpu_budget
+            idle = busy * (1.0 / self.cpu_budget - 1.0)
+            if idle > 0:
+                self.throttled_seconds += idle
+                time.sleep(idle)
+
+    def _evaluate(self, candidate, inputs, primary):
+        start = time.perf_counter()
+        probabilities = candidate.model.predict(inputs, verbose=0, batch_size=1)[0]
+        candidate_ms = (time.perf_counter() - start) * 1000
+        idx = int(np.argmax(probabilities))
+        names = candidate.class_names
+        try:
+            primary_idx = names.index(primary['class'])
+        except ValueError:
+            primary_idx = None
+        return {
+            'created_at': time.time(),
+            'kind': self.kind,
+            'primary_version': primary['version'],
+            'candidate_version': candidate.version,
+            'primary_class': primary['class'],
+            'candidate_class': names[idx] if idx < len(names) else f"Class_{idx}",
+            'primary_confidence': float(primary['confidence']),
+            'candidate_confidence': float(probabilities[idx]),
+            'candidate_primary_confidence': (float(probabilities[primary_idx])
+                                             if primary_idx is not None and primary_idx < len(probabilities)
+                                             else None),
+            'primary_ms': primary.get('latency_ms'),
+            'candidate_ms': candidate_ms
+        }
+
+    def stats(self):
+        return {
+            'candidate_version': self.candidate_version,
+            'target_version': self._target_version,
+            'loading': self.loading,
+            'sample_rate': self.sample_rate,
+            'cpu_budget': self.cpu_budget,
+            'pending': self._queue.qsize(),
+            'sampled': self.sampled,
+            'dropped': self.dropped,
+            'evaluated': self.evaluated,
+            'failures': self.failures,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'throttled_seconds': round(self.throttled_seconds, 3),
+            'last_error': self.last_error
+        }
+
+
+# Global instances
+_shadow_store = None
+_shadow_evaluators = {}
+_shadow_lock = threading.Lock()
+
+
+def get_shadow_store():
+    """Get or create the shadow result store."""
+    global _shadow_store
+    with _shadow_lock:
+        if _shadow_store is None:
+            _shadow_store = ShadowResultStore()
+        return _shadow_store
+
+
+def get_shadow_evaluator(kind, registry=None):
+    """Get the evaluator for a model kind, creating it on first use (registry is then required)."""
+    store = get_shadow_store()
+    with _shadow_lock:
+        evaluator = _shadow_evaluators.get(kind)
+        if evaluator is None and registry is not None:
+            evaluator = ShadowEvaluator(kind, registry, store)
+            _shadow_evaluators[kind] = evaluator
+        return evaluator
+
+
+def all_shadow_evaluators():
+    with _shadow_lock:
+        return dict(_shadow_evaluators)
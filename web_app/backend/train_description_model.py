@@ -11,6 +11,14 @@ Usage:
 Output:
     - models/description_embeddings.npz (species embeddings)
     - models/species_index.json (species name index)
+    - models/species_ann_index.npz (approximate nearest-neighbour index)
+
+Benchmark the ANN index (recall@k vs latency against brute force):
+    python train_description_model.py --benchmark-index
+
+Export the sentence encoder to ONNX for torch-free, offline loading
+(requires torch, onnx and onnxruntime at export time only):
+    python train_description_model.py --export-onnx [--quantize]
 """
 
 import json
@@ -246,6 +254,9 @@ def train_embeddings(model_name='all-MiniLM-L6-v2'):
         }, f, ensure_ascii=False, indent=2)
     print(f"💾 Saved descriptions to: {desc_file}")
     
+    # Build ANN index (used by semantic_matcher for large catalogs)
+    ann_file = build_ann_index(embeddings, species_keys, unique_species, output_dir)
+    
     print("\n" + "=" * 60)
     print("✅ Training complete!")
     print(f"   Total species: {len(unique_species)}")
@@ -255,10 +266,174 @@ def train_embeddings(model_name='all-MiniLM-L6-v2'):
     print(f"   - {embeddings_file}")
     print(f"   - {index_file}")
     print(f"   - {desc_file}")
+    print(f"   - {ann_file}")
     
     return True
 
 
+def build_ann_index(embeddings, species_keys, species_index, output_dir, n_lists=None):
+    """Build and save the IVF index over the species embeddings, partitioned by species type."""
+    from embedding_index import IVFIndex
+    
+    print("\n🗂️ Building ANN index...")
+    row_categories = [species_index.get(str(key), {}).get('type', 'unknown') for key in species_keys]
+    index = IVFIndex.build(embeddings, row_categories, n_lists=n_lists)
+    ann_file = output_dir / 'species_ann_index.npz'
+    index.save(ann_file)
+    print(f"💾 Saved ANN index ({index.n_lists} lists) to: {ann_file}")
+    return ann_file
+
+
+def export_onnx_encoder(model_name='all-MiniLM-L6-v2', quantize=False, output_dir=None):
+    """
+    Export the Sentence Transformer encoder and tokenizer to ONNX.
+    
+    Writes encoder.onnx (and encoder.int8.onnx with quantize=True),
+    tokenizer.json and encoder_config.json to the directory the semantic
+    matcher loads from, then checks that the ONNX embeddings match the
+    original model closely enough to keep the stored species vectors valid.
+    """
+    if not SENTENCE_TRANSFORMERS_AVAILABLE:
+        print("❌ Cannot export: sentence-transformers not installed")
+        return False
+    
+    try:
+        import torch
+        from onnx_encoder import (OnnxSentenceEncoder, ENCODER_FILE, QUANTIZED_ENCODER_FILE,
+                                  TOKENIZER_FILE, ENCODER_CONFIG_FILE)
+    except ImportError as e:
+        print(f"❌ Cannot export: {e}")
+        return False
+    
+    if output_dir is None:
+        from semantic_matcher import get_model_path
+        output_dir = get_model_path()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    print(f"\n📦 Exporting {model_name} to ONNX in {output_dir}")
+    print("=" * 60)
+    
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model[0].tokenizer
+    
+    # Tokenizer (fast tokenizer JSON, loadable with the `tokenizers` library)
+    tokenizer.backend_tokenizer.save(str(output_dir / TOKENIZER_FILE))
+    
+    class _TokenEmbeddings(torch.nn.Module):
+        """Wrap the transformer so the ONNX graph returns token embeddings only."""
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+        
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+    
+    dummy = tokenizer(["a small blue butterfly"], return_tensors='pt')
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in ['input_ids', 'attention_mask', 'token_type_ids']}
+    dynamic_axes['token_embeddings'] = {0: 'batch', 1: 'sequence'}
+    encoder_file = output_dir / ENCODER_FILE
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer),
+            (dummy['input_ids'], dummy['attention_mask'], dummy['token_type_ids']),
+            str(encoder_file),
+            input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+            output_names=['token_embeddings'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    print(f"💾 Saved ONNX encoder to: {encoder_file} ({encoder_file.stat().st_size / 1e6:.1f} MB)")
+    
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_file = output_dir / QUANTIZED_ENCODER_FILE
+        quantize_dynamic(str(encoder_file), str(quantized_file), weight_type=QuantType.QInt8)
+        print(f"💾 Saved int8 encoder to: {quantized_file} ({quantized_file.stat().st_size / 1e6:.1f} MB)")
+    
+    config = {
+        'model_name': model_name,
+        'max_seq_length': st_model.max_seq_length,
+        'pad_token': tokenizer.pad_token,
+        'pad_token_id': tokenizer.pad_token_id,
+        'embedding_dim': st_model.get_sentence_embedding_dimension(),
+        'quantized': False  # set once the int8 encoder has passed the parity check
+    }
+    with open(output_dir / ENCODER_CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    
+    # Parity check against the original model on the species description variants
+    species_data = load_species_data()
+    descriptions, _, _ = create_species_descriptions(species_data)
+    sample = descriptions[:256] or ["small blue butterfly with orange spots in grasslands"]
+    reference = st_model.encode(sample, convert_to_numpy=True, normalize_embeddings=True)
+    
+    print("\n🧪 Parity check (cosine similarity to the original embeddings):")
+    all_ok = True
+    for label, model_file in [('fp32', encoder_file)] + ([('int8', quantized_file)] if quantize else []):
+        encoder = OnnxSentenceEncoder(output_dir, model_file=model_file)
+        exported = encoder.encode(sample, normalize_embeddings=True)
+        cosine = np.sum(reference * exported, axis=1)
+        print(f"   {label}: mean {cosine.mean():.5f}, min {cosine.min():.5f}")
+        config[f'{label}_parity_min_cosine'] = round(float(cosine.min()), 5)
+        if cosine.min() >= 0.98:
+            continue
+        all_ok = False
+        if label == 'int8':
+            # Never leave a drifting int8 encoder where the matcher would prefer it
+            model_file.unlink()
+            print("   ⚠️ int8 encoder drifts from the original; removed it, the matcher uses fp32")
+        else:
+            print("   ⚠️ fp32 encoder drifts from the original; re-run training with it or disable it")
+    
+    config['quantized'] = quantize and quantized_file.exists()
+    with open(output_dir / ENCODER_CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    
+    if all_ok:
+        print("✅ ONNX encoder matches the original model; stored species vectors stay valid")
+    return all_ok
+
+
+def benchmark_ann_index(k=20, num_queries=200):
+    """Print a recall@k vs latency table for the ANN index against brute force."""
+    from embedding_index import IVFIndex, benchmark
+    
+    output_dir = Path(__file__).parent.parent.parent / 'models' / 'description'
+    embeddings_file = output_dir / 'species_embeddings.npz'
+    index_file = output_dir / 'species_index.json'
+    ann_file = output_dir / 'species_ann_index.npz'
+    
+    if not embeddings_file.exists() or not ann_file.exists():
+        print("❌ Model not trained yet. Run training first.")
+        return
+    
+    with open(index_file, 'r', encoding='utf-8') as f:
+        index_data = json.load(f)
+    data = np.load(embeddings_file, allow_pickle=True)
+    embeddings = data['embeddings'].astype(np.float32)
+    species_keys = data['species_keys']
+    row_categories = [index_data['species'].get(str(key), {}).get('type', 'unknown') for key in species_keys]
+    index = IVFIndex.load(ann_file, embeddings)
+    
+    # Queries: perturbed copies of stored description embeddings
+    rng = np.random.default_rng(0)
+    queries = embeddings[rng.integers(len(embeddings), size=num_queries)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    
+    print(f"\n📊 ANN benchmark: {len(embeddings)} rows, {index.n_lists} lists, recall@{k}")
+    print("=" * 60)
+    for category in [None] + sorted(set(row_categories)):
+        label = category or 'all'
+        print(f"\nCategory: {label}")
+        print(f"   {'n_probe':>8} {'recall':>8} {'ann ms':>10} {'brute ms':>10}")
+        for row in benchmark(index, embeddings, queries, k=k, row_categories=row_categories, category=category):
+            print(f"   {row['n_probe']:>8} {row['recall']:>8.3f} {row['ann_ms']:>10.3f} {row['brute_force_ms']:>10.3f}")
+
+
 def test_model():
     """Test the trained model with sample queries."""
     if not SENTENCE_TRANSFORMERS_AVAILABLE:
@@ -323,10 +498,20 @@ if __name__ == '__main__':
                        help='Sentence Transformer model name')
     parser.add_argument('--test', action='store_true',
                        help='Test the trained model')
+    parser.add_argument('--benchmark-index', action='store_true',
+                       help='Report ANN index recall@k and latency against brute force')
+    parser.add_argument('--export-onnx', action='store_true',
+                       help='Export the sentence encoder to ONNX for torch-free loading')
+    parser.add_argument('--quantize', action='store_true',
+                       help='With --export-onnx, also write a dynamically quantized int8 encoder')
     
     args = parser.parse_args()
     
-    if args.test:
+    if args.export_onnx:
+        export_onnx_encoder(args.model, quantize=args.quantize)
+    elif args.benchmark_index:
+        benchmark_ann_index()
+    elif args.test:
         test_model()
     else:
         success = train_embeddings(args.model)
@@ -12,8 +12,14 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 import pickle
+import argparse
+import subprocess
+import sys
+import time
 from collections import Counter
 
+from intent_scorer import INTENT_MODEL_PATH, IntentScorer, export_intent_model
+
 # Intent categories based on knowledge base
 INTENT_CATEGORIES = [
     'greetings',
@@ -167,8 +173,8 @@ def train_model(texts, labels, model_type='naive_bayes'):
     return model, vectorizer
 
 def save_model(model, vectorizer, model_path='intent_classifier_model.pkl', 
-               vectorizer_path='intent_vectorizer.pkl'):
-    """Save trained model and vectorizer"""
+               vectorizer_path='intent_vectorizer.pkl', export_path=INTENT_MODEL_PATH):
+    """Save trained model and vectorizer, plus the sklearn-free .npz export"""
     try:
         with open(model_path, 'wb') as f:
             pickle.dump(model, f)
@@ -178,6 +184,10 @@ def save_model(model, vectorizer, model_path='intent_classifier_model.pkl',
             pickle.dump(vectorizer, f)
         print(f"✅ Vectorizer saved to: {vectorizer_path}")
         
+        if export_path:
+            export_intent_model(model, vectorizer, export_path)
+            print(f"✅ Scorer export saved to: {export_path}")
+        
         return True
     except Exception as e:
         print(f"❌ Error saving model: {e}")
@@ -218,8 +228,102 @@ def predict_intent(model, vectorizer, text):
         print(f"⚠️ Error in prediction: {e}")
         return 'default', 0.0
 
+def get_parity_texts():
+    """Training texts plus mixed-language and out-of-vocabulary messages"""
+    texts, _ = load_training_data()
+    synthetic_texts, _ = create_synthetic_training_data()
+    texts = (texts or []) + synthetic_texts
+    texts += [
+        "how to identify butterflies?", "when is the best time to observe birds?",
+        "how to take good photos?", "what species can you identify?", "hello", "你好",
+        "如何識別蝴蝶？", "", "???", "the and of", "Butterfly BUTTERFLY butterfly habitat",
+        "what is the confidence of this identification result", "xyz qwerty", "鳥 bird 蝴蝶 butterfly 拍照"
+    ]
+    return texts
+
+def check_parity(model, vectorizer, export_path=INTENT_MODEL_PATH, texts=None, tolerance=1e-9):
+    """Compare IntentScorer against the sklearn model; returns the number of mismatches"""
+    scorer = IntentScorer(export_path)
+    texts = get_parity_texts() if texts is None else texts
+    mismatches = 0
+    for text in texts:
+        expected_intent, expected_confidence = predict_intent(model, vectorizer, text)
+        intent, confidence = scorer.predict(text.lower())
+        expected_proba = model.predict_proba(vectorizer.transform([text.lower()]))[0]
+        proba = scorer.predict_proba_features(scorer.vectorize(text.lower()))
+        if intent != expected_intent or np.max(np.abs(proba - expected_proba)) > tolerance:
+            mismatches += 1
+            print(f"  ❌ '{text}': sklearn {expected_intent} ({expected_confidence:.4f}), "
+                  f"scorer {intent} ({confidence:.4f})")
+    print(f"{'✅' if mismatches == 0 else '❌'} Parity: {len(texts) - mismatches}/{len(texts)} texts match")
+    return mismatches
+
+def _timed_subprocess(code):
+    """Wall time of a fresh interpreter running `code` (includes imports)"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.perf_counter() - start
+
+def benchmark(model, vectorizer, export_path=INTENT_MODEL_PATH, model_path='intent_classifier_model.pkl',
+              vectorizer_path='intent_vectorizer.pkl', repeats=200):
+    """Cold-start load time and per-message latency: pickled sklearn model vs IntentScorer"""
+    baseline = _timed_subprocess('pass')
+    pickle_load = _timed_subprocess(
+        f"import pickle; pickle.load(open({model_path!r}, 'rb')); pickle.load(open({vectorizer_path!r}, 'rb'))"
+    ) - baseline
+    scorer_load = _timed_subprocess(
+        f"from intent_scorer import IntentScorer; IntentScorer({export_path!r})"
+    ) - baseline
+    print(f"  Load (fresh process): pickle+sklearn {pickle_load * 1000:.1f} ms, "
+          f"IntentScorer {scorer_load * 1000:.1f} ms")
+
+    scorer = IntentScorer(export_path)
+    texts = [text.lower() for text in get_parity_texts()]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            features = vectorizer.transform([text])
+            model.predict(features)
+            model.predict_proba(features)
+    sklearn_latency = (time.perf_counter() - start) / (repeats * len(texts))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            scorer.predict(text)
+    scorer_latency = (time.perf_counter() - start) / (repeats * len(texts))
+    print(f"  Per message: sklearn {sklearn_latency * 1e6:.1f} µs, IntentScorer {scorer_latency * 1e6:.1f} µs")
+    return {
+        'pickle_load_seconds': pickle_load,
+        'scorer_load_seconds': scorer_load,
+        'sklearn_latency_seconds': sklearn_latency,
+        'scorer_latency_seconds': scorer_latency
+    }
+
 def main():
     """Main training function"""
+    parser = argparse.ArgumentParser(description='Train the assistant intent classifier')
+    parser.add_argument('--export-only', action='store_true',
+                        help=f'Export the saved pickles to {INTENT_MODEL_PATH} without retraining')
+    parser.add_argument('--check-parity', action='store_true',
+                        help='Compare the .npz scorer with the sklearn model')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Compare load time and per-message latency of the two runtimes')
+    args = parser.parse_args()
+    
+    if args.export_only or args.check_parity or args.benchmark:
+        model, vectorizer = load_model()
+        if model is None:
+            print("❌ No saved model; run training first")
+            sys.exit(1)
+        if args.export_only:
+            export_intent_model(model, vectorizer, INTENT_MODEL_PATH)
+            print(f"✅ Scorer export saved to: {INTENT_MODEL_PATH}")
+        if args.check_parity and check_parity(model, vectorizer) > 0:
+            sys.exit(1)
+        if args.benchmark:
+            benchmark(model, vectorizer)
+        return
+    
     print("=" * 60)
     print("🤖 Training Intent Classification Model for AI Assistant")
     print("=" * 60)
@@ -267,6 +371,9 @@ def main():
         intent, confidence = predict_intent(model, vectorizer, test_text)
         print(f"  '{test_text}' → {intent} ({confidence:.2%})")
     
+    print("\n5️⃣ Checking scorer export parity...")
+    check_parity(model, vectorizer)
+    
     print("\n" + "=" * 60)
     print("✅ Training completed successfully!")
     print("=" * 60)
@@ -0,0 +1,97 @@
+"""
+Background warm-up of lazily initialized subsystems.
+
+Tasks are registered at startup and run in a daemon thread once the server
+is listening, so the first real request for each feature does not pay for
+model initialization or TensorFlow graph tracing. Per-subsystem readiness
+is reported through get_status() (exposed in /api/health).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+PENDING = 'pending'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class WarmupManager:
+    """Runs registered warm-up tasks in order and tracks their state."""
+
+    def __init__(self):
+        self._tasks = OrderedDict()  # name -> callable
+        self._status = OrderedDict()  # name -> status dict
+        self._lock = threading.Lock()
+        self._thread = None
+        self.started_at = None
+        self.finished_at = None
+
+    def register(self, name, func):
+        """
+        Register a warm-up task.
+
+        The callable may return False to mark the subsystem as skipped
+        (e.g. the model is not available on this instance).
+        """
+        with self._lock:
+            self._tasks[name] = func
+            self._status[name] = {'state': PENDING, 'duration_ms': None, 'error': None}
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._status[name].update(fields)
+
+    def run(self):
+        """Run all tasks sequentially in the calling thread."""
+        self.started_at = time.time()
+        for name, func in list(self._tasks.items()):
+            self._set(name, state=WARMING)
+            start = time.perf_counter()
+            try:
+                result = func()
+                state = SKIPPED if result is False else READY
+                self._set(name, state=state, duration_ms=round((time.perf_counter() - start) * 1000, 1))
+                print(f"🔥 Warm-up {name}: {state} ({(time.perf_counter() - start):.2f}s)")
+            except Exception as e:
+                self._set(name, state=FAILED, error=str(e),
+                          duration_ms=round((time.perf_counter() - start) * 1000, 1))
+                print(f"⚠️ Warm-up {name} failed: {e}")
+        self.finished_at = time.time()
+
+    def start(self, delay_seconds=0.0):
+        """Run the tasks in a background daemon thread (optionally after a delay)."""
+        if self._thread is not None:
+            return self._thread
+
+        def _runner():
+            if delay_seconds:
+                time.sleep(delay_seconds)
+            self.run()
+
+        self._thread = threading.Thread(target=_runner, name='warmup', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def is_ready(self):
+        """True once every task has finished without failing (skipped counts as done)."""
+        with self._lock:
+            return all(status['state'] in (READY, SKIPPED) for status in self._status.values())
+
+    def get_status(self):
+        with self._lock:
+            return {name: dict(status) for name, status in self._status.items()}
+
+
+# Global instance
+_warmup_manager = None
+
+
+def get_warmup_manager():
+    """Get or create the warm-up manager."""
+    global _warmup_manager
+    if _warmup_manager is None:
+        _warmup_manager = WarmupManager()
+    return _warmup_manager
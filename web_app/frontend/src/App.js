@@ -59,6 +59,18 @@ const getApiUrl = () => {
 
 const API_URL = getApiUrl();
 
+// Anonymous per-browser id for the server-side identification history
+const getDeviceId = () => {
+  let deviceId = localStorage.getItem('deviceId');
+  if (!deviceId) {
+    deviceId = (window.crypto && window.crypto.randomUUID)
+      ? window.crypto.randomUUID()
+      : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    localStorage.setItem('deviceId', deviceId);
+  }
+  return deviceId;
+};
+
 // Debug: Log API URL (will show in browser console)
 if (typeof window !== 'undefined') {
   console.log('🔍 Frontend API URL:', API_URL);
@@ -74,9 +86,13 @@ function App() {
   const [selectedImage, setSelectedImage] = useState(null);
   const [preview, setPreview] = useState(null);
   const [prediction, setPrediction] = useState(null);
+  const [uploadId, setUploadId] = useState(null); // id of the upload kept on the server (only when retention is enabled), for feedback
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [warning, setWarning] = useState(null); // 警告信息
+  const [similarSpecies, setSimilarSpecies] = useState([]);
+  const [speciesCatalog, setSpeciesCatalog] = useState(null); // catalog entry of the predicted species (streamed predict)
+  const [enrichmentPending, setEnrichmentPending] = useState(false); // top-3 shown, verification still running
   const [apiStatus, setApiStatus] = useState('checking'); // 'checking', 'healthy', 'unhealthy'
   const [apiErrorMessage, setApiErrorMessage] = useState('');
   const [history, setHistory] = useState([]);
@@ -189,6 +205,7 @@ function App() {
   const [descriptionLoading, setDescriptionLoading] = useState(false);
   const [descriptionConversation, setDescriptionConversation] = useState([]);
   const [currentMatches, setCurrentMatches] = useState([]);
+  const [descriptionSessionId, setDescriptionSessionId] = useState(null); // Server-side description-chat session
   // Conversation history management
   const [conversationHistory, setConversationHistory] = useState([]);
   const [currentConversationId, setCurrentConversationId] = useState(null);
@@ -653,11 +670,15 @@ function App() {
     setBatchResults([]);
 
     const results = [];
+    const batchStartId = Date.now();
     
     for (let i = 0; i < batchFiles.length; i++) {
       const file = batchFiles[i];
       const formData = new FormData();
       formData.append('image', file);
+      formData.append('user_id', getDeviceId());
+      // The server stores the history item id, so importing local history later does not double count
+      formData.append('history_id', batchStartId + i);
 
       try {
         const response = await axios.post(`${API_URL}/api/predict`, formData, {
@@ -667,7 +688,7 @@ function App() {
         });
 
         results.push({
-          id: Date.now() + i,
+          id: batchStartId + i,
           filename: file.name,
           image: URL.createObjectURL(file),
           prediction: response.data.prediction,
@@ -685,7 +706,7 @@ function App() {
         });
       } catch (err) {
         results.push({
-          id: Date.now() + i,
+          id: batchStartId + i,
           filename: file.name,
           image: URL.createObjectURL(file),
           error: err.response?.data?.error || 'Failed to make prediction',
@@ -720,24 +741,25 @@ function App() {
 
     setLoading(true);
     setError(null);
+    setSimilarSpecies([]);
+    setSpeciesCatalog(null);
 
     // Debug: Log API URL
     console.log('API URL:', API_URL);
     console.log('Full URL:', `${API_URL}/api/predict`);
 
+    const historyId = Date.now();
     const formData = new FormData();
     formData.append('image', selectedImage);
-
-    try {
-      const response = await axios.post(`${API_URL}/api/predict`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-        timeout: 30000, // 30 seconds timeout
-      });
-
-      setPrediction(response.data.prediction);
-      console.log('🔍 Full response data:', response.data);
+    formData.append('user_id', getDeviceId());
+    // The server stores the history item id, so importing local history later does not double count
+    formData.append('history_id', historyId);
+
+    // Everything except the top-3: history, collection unlock, feedback state
+    const applyPredictionResult = (data) => {
+      setPrediction(data.prediction);
+      setUploadId(data.upload_id || null);
+      console.log('🔍 Full response data:', data);
       
       // 重置反饋狀態
       setFeedbackStatus(null);
@@ -745,40 +767,40 @@ function App() {
       setSelectedCorrectSpecies('');
       
       // 保存警告信息（如果有）
-      if (response.data.warning) {
-        setWarning(response.data.warning);
-        console.log('⚠️ Warning:', response.data.warning);
+      if (data.warning) {
+        setWarning(data.warning);
+        console.log('⚠️ Warning:', data.warning);
       } else {
         setWarning(null); // 清除之前的警告
       }
       
       // 只有在無警告且存在有效分類結果時才解鎖圖鑑
-      if (!response.data.warning && response.data.prediction && response.data.prediction.class) {
-        let speciesId = getSpeciesId(response.data.prediction);
-        const speciesName = response.data.prediction.class;
-        
+      if (!data.warning && data.prediction && data.prediction.class) {
+        let speciesId = getSpeciesId(data.prediction);
+        const speciesName = data.prediction.class;
+      
         // If class is in format "001.Black_footed_Albatross" or "ADONIS", use it directly
-        if (!speciesId && response.data.prediction.class) {
-          speciesId = response.data.prediction.class;
+        if (!speciesId && data.prediction.class) {
+          speciesId = data.prediction.class;
         }
-        
+      
         if (speciesId) {
-          console.log('📚 Adding prediction to collection:', { speciesId, speciesName, prediction: response.data.prediction });
+          console.log('📚 Adding prediction to collection:', { speciesId, speciesName, prediction: data.prediction });
           addToCollection(speciesId, speciesName);
         } else {
-          console.warn('⚠️ Could not get species ID from prediction:', response.data.prediction);
+          console.warn('⚠️ Could not get species ID from prediction:', data.prediction);
         }
-      } else if (response.data.warning) {
-        console.log('⏸️ Skip collection unlock due to warning:', response.data.warning?.type || 'unknown');
+      } else if (data.warning) {
+        console.log('⏸️ Skip collection unlock due to warning:', data.warning?.type || 'unknown');
       }
       
       // Add to history
       const historyItem = {
-        id: Date.now(),
+        id: historyId,
         image: preview,
-        prediction: response.data.prediction,
-        quality: response.data.quality_analysis,
-        warning: response.data.warning, // 保存警告信息
+        prediction: data.prediction,
+        quality: data.quality_analysis,
+        warning: data.warning, // 保存警告信息
         timestamp: new Date().toLocaleString('en-US', {
           year: 'numeric',
           month: '2-digit',
@@ -790,6 +812,103 @@ function App() {
         }),
       };
       setHistory([historyItem, ...history].slice(0, 10)); // Keep last 10
+    };
+
+    // An error the server answered with (shown as is, never retried through the fallback)
+    const serverError = (status, data) => {
+      const err = new Error(data?.error || `Prediction failed (${status})`);
+      err.response = { status, data };
+      return err;
+    };
+
+    try {
+      // Stream the result: the top-3 arrives after the forward pass, verification and enrichment follow
+      let predictionShown = false;
+      try {
+        const streamResponse = await fetch(`${API_URL}/api/predict?stream=1`, {
+          method: 'POST',
+          headers: { Accept: 'text/event-stream' },
+          body: formData
+        });
+        const contentType = streamResponse.headers.get('Content-Type') || '';
+        if (streamResponse.ok && contentType.includes('application/json')) {
+          // Server without streaming support answered with the regular result
+          const data = await streamResponse.json();
+          setSimilarSpecies(data.similar_species || []);
+          applyPredictionResult(data);
+          return;
+        }
+        if (!streamResponse.ok) {
+          const data = contentType.includes('application/json') ? await streamResponse.json().catch(() => null) : null;
+          throw serverError(streamResponse.status, data);
+        }
+        if (!streamResponse.body || !contentType.includes('text/event-stream')) {
+          throw new Error(`Predict stream unsupported: ${contentType || 'no content type'}`);
+        }
+
+        const reader = streamResponse.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let streamDone = false;
+        while (!streamDone) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventType = 'message';
+            let eventData = '';
+            rawEvent.split('\n').forEach(line => {
+              if (line.startsWith('event: ')) eventType = line.slice(7);
+              else if (line.startsWith('data: ')) eventData += line.slice(6);
+            });
+            const payload = eventData ? JSON.parse(eventData) : {};
+
+            if (eventType === 'prediction') {
+              predictionShown = true;
+              setPrediction(payload.prediction);
+              setEnrichmentPending(true);
+              setLoading(false);
+            } else if (eventType === 'warning') {
+              setWarning(payload.warning || null);
+            } else if (eventType === 'similar_species') {
+              setSimilarSpecies(payload.similar_species || []);
+            } else if (eventType === 'catalog') {
+              setSpeciesCatalog(payload.info || null);
+            } else if (eventType === 'done') {
+              applyPredictionResult(payload);
+              streamDone = true;
+            } else if (eventType === 'error') {
+              throw serverError(payload.status || 500, payload);
+            }
+          }
+        }
+        if (!streamDone) {
+          throw new Error('Predict stream ended early');
+        }
+      } catch (streamErr) {
+        if (predictionShown) {
+          // Keep the top-3 already shown
+          console.error('Predict stream interrupted:', streamErr);
+          return;
+        }
+        if (streamErr.response) {
+          // The server rejected the image (invalid file, model not loaded, ...): a retry would fail the same way
+          throw streamErr;
+        }
+        // Server without streaming support (or the connection failed): use the regular endpoint
+        const response = await axios.post(`${API_URL}/api/predict`, formData, {
+          headers: {
+            'Content-Type': 'multipart/form-data',
+          },
+          timeout: 30000, // 30 seconds timeout
+        });
+        setSimilarSpecies(response.data.similar_species || []);
+        applyPredictionResult(response.data);
+      }
     } catch (err) {
       // Enhanced error logging
       console.error('Prediction error:', err);
@@ -820,6 +939,7 @@ function App() {
       setError(errorMessage);
     } finally {
       setLoading(false);
+      setEnrichmentPending(false);
     }
   };
 
@@ -879,6 +999,8 @@ function App() {
     setPrediction(null);
     setError(null);
     setWarning(null); // 清除警告
+    setSimilarSpecies([]);
+    setSpeciesCatalog(null);
     setQualityAnalysis(null);
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
@@ -1395,31 +1517,100 @@ function App() {
     setChatInput('');
     setChatLoading(true);
 
+    const chatPayload = {
+      message: userMessage.text,
+      context: {
+        lastPrediction: prediction,
+        historyCount: history.length
+      }
+    };
+    const botMessageId = Date.now() + 1;
+    const botTimestamp = new Date().toLocaleString('en-US', {
+      year: 'numeric',
+      month: '2-digit',
+      day: '2-digit',
+      hour: '2-digit',
+      minute: '2-digit',
+      second: '2-digit',
+      hour12: true
+    });
+    const setBotText = (updateText) => {
+      setChatMessages(prev => prev.map(msg =>
+        msg.id === botMessageId ? { ...msg, text: updateText(msg.text) } : msg
+      ));
+    };
+
     try {
-      const response = await axios.post(`${API_URL}/api/chat`, {
-        message: userMessage.text,
-        context: {
-          lastPrediction: prediction,
-          historyCount: history.length
+      // Stream the reply: the main answer arrives first, generated interpretation text follows
+      let botMessageShown = false;
+      try {
+        const streamResponse = await fetch(`${API_URL}/api/chat/stream`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(chatPayload)
+        });
+        if (!streamResponse.ok || !streamResponse.body) {
+          throw new Error(`Chat stream failed: ${streamResponse.status}`);
         }
-      });
-
-      const botMessage = {
-        id: Date.now() + 1,
-        type: 'bot',
-        text: response.data.response,
-        timestamp: new Date().toLocaleString('en-US', {
-          year: 'numeric',
-          month: '2-digit',
-          day: '2-digit',
-          hour: '2-digit',
-          minute: '2-digit',
-          second: '2-digit',
-          hour12: true
-        })
-      };
 
-      setChatMessages(prev => [...prev, botMessage]);
+        const reader = streamResponse.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let streamDone = false;
+        while (!streamDone) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventType = 'message';
+            let eventData = '';
+            rawEvent.split('\n').forEach(line => {
+              if (line.startsWith('event: ')) eventType = line.slice(7);
+              else if (line.startsWith('data: ')) eventData += line.slice(6);
+            });
+            const payload = eventData ? JSON.parse(eventData) : {};
+
+            if (eventType === 'response') {
+              botMessageShown = true;
+              setChatMessages(prev => [...prev, {
+                id: botMessageId,
+                type: 'bot',
+                text: payload.text,
+                timestamp: botTimestamp
+              }]);
+              setChatLoading(false);
+            } else if (eventType === 'token') {
+              setBotText(text => text + payload.text);
+            } else if (eventType === 'done') {
+              setBotText(() => payload.response);
+              streamDone = true;
+            } else if (eventType === 'error') {
+              throw new Error(payload.error || 'Chat stream error');
+            }
+          }
+        }
+        if (!botMessageShown) {
+          throw new Error('Chat stream ended without a response');
+        }
+      } catch (streamErr) {
+        if (botMessageShown) {
+          // Keep the part already shown
+          console.error('Chat stream interrupted:', streamErr);
+          return;
+        }
+        // Server without streaming support (or stream failure): use the regular endpoint
+        const response = await axios.post(`${API_URL}/api/chat`, chatPayload);
+        setChatMessages(prev => [...prev, {
+          id: botMessageId,
+          type: 'bot',
+          text: response.data.response,
+          timestamp: botTimestamp
+        }]);
+      }
     } catch (err) {
       const errorMessage = {
         id: Date.now() + 1,
@@ -1449,22 +1640,27 @@ function App() {
   };
 
   const handleLoadStatistics = async () => {
-    if (history.length === 0) {
-      setError('No identification history available');
-      return;
-    }
-
     setStatsLoading(true);
     setError(null);
 
     try {
-      const response = await axios.post(`${API_URL}/api/statistics`, {
-        history: history
-      });
+      // Statistics come from the server-side history; the local history is
+      // imported once (re-importing the same items is a no-op on the server)
+      const userId = getDeviceId();
+      const needsImport = localStorage.getItem('historyImported') !== userId && history.length > 0;
+      const response = await axios.post(`${API_URL}/api/statistics`,
+        needsImport ? { user_id: userId, history: history } : { user_id: userId });
+      if (needsImport) {
+        localStorage.setItem('historyImported', userId);
+      }
 
       setStatistics(response.data.statistics);
       setShowStatistics(true);
     } catch (err) {
+      if (err.response?.status === 404) {
+        setError('No identification history available');
+        return;
+      }
       setError('Failed to load statistics: ' + (err.response?.data?.error || err.message));
     } finally {
       setStatsLoading(false);
@@ -1776,14 +1972,33 @@ function App() {
     setError(null);
 
     try {
-      const response = await axios.post(`${API_URL}/api/description-chat`, {
+      const category = descriptionCategory === 'all' ? null : descriptionCategory;
+      // With a live server session only the new message is sent; otherwise
+      // (first message, restored conversation, expired session) send the full context
+      const fullPayload = {
         message: descriptionInput,
         conversation_history: descriptionConversation,
-        current_matches: currentMatches,
-        category: descriptionCategory === 'all' ? null : descriptionCategory
-      });
+        current_matches: currentMatches.map(m => ({ key: m.key, category: m.category })),
+        category
+      };
+      let response;
+      if (descriptionSessionId) {
+        try {
+          response = await axios.post(`${API_URL}/api/description-chat`, {
+            message: descriptionInput,
+            session_id: descriptionSessionId,
+            category
+          });
+        } catch (err) {
+          if (err.response?.status !== 410) throw err;
+          response = await axios.post(`${API_URL}/api/description-chat`, fullPayload);
+        }
+      } else {
+        response = await axios.post(`${API_URL}/api/description-chat`, fullPayload);
+      }
 
       if (response.data.success) {
+        setDescriptionSessionId(response.data.session_id || null);
         const botMessage = {
           role: 'assistant',
           content: response.data.response,
@@ -1871,6 +2086,7 @@ function App() {
     setCurrentConversationId(newId);
     setDescriptionConversation([]);
     setCurrentMatches([]);
+    setDescriptionSessionId(null);
     setDescriptionResults(null);
     setDescriptionInput('');
     setDescriptionCategory(category);
@@ -1882,6 +2098,7 @@ function App() {
       setCurrentConversationId(conversationId);
       setDescriptionConversation(conversation.messages || []);
       setCurrentMatches(conversation.matches || []);
+      setDescriptionSessionId(null);
       setDescriptionCategory(conversation.category || 'all');
       setDescriptionResults(null);
       setDescriptionInput('');
@@ -1950,6 +2167,7 @@ function App() {
         setCurrentConversationId(null);
         setDescriptionConversation([]);
         setCurrentMatches([]);
+        setDescriptionSessionId(null);
         setDescriptionResults(null);
         setDescriptionInput('');
       } else {
@@ -1995,7 +2213,8 @@ function App() {
       feedback_type: feedbackType, // 'correct' or 'incorrect'
       correct_species: correctSpecies || (feedbackType === 'correct' ? prediction.class : null),
       timestamp: new Date().toISOString(),
-      image_path: preview // 圖片預覽URL
+      image_path: preview, // 圖片預覽URL
+      upload_id: uploadId // 伺服器端保留的上傳ID，用於重新訓練
     };
     
     try {
@@ -4218,12 +4437,70 @@ function App() {
                     })}
                   </div>
                   
+                  {enrichmentPending && (
+                    <p className="predictions-hint" style={{ marginTop: '14px' }}>
+                      ⏳ Verifying the image and looking up similar species...
+                    </p>
+                  )}
+                  
+                  {/* Catalog entry of the predicted species (streamed predict) */}
+                  {speciesCatalog && (
+                    <div style={{ marginTop: '20px' }}>
+                      <h3 style={{ marginBottom: '6px' }}>
+                        {speciesCatalog.common_name || prediction.class}
+                        {speciesCatalog.scientific_name && (
+                          <span style={{ fontSize: '0.9rem', fontStyle: 'italic', opacity: 0.85, marginLeft: '8px' }}>
+                            {speciesCatalog.scientific_name}
+                          </span>
+                        )}
+                      </h3>
+                      {speciesCatalog.description && (
+                        <p style={{ fontSize: '0.9rem', opacity: 0.9, margin: '0 0 6px' }}>{speciesCatalog.description}</p>
+                      )}
+                      {speciesCatalog.habitat && (
+                        <p style={{ fontSize: '0.85rem', opacity: 0.85, margin: 0 }}>
+                          <strong>Habitat:</strong> {speciesCatalog.habitat}
+                        </p>
+                      )}
+                    </div>
+                  )}
+                  
+                  {similarSpecies.length > 0 && (
+                    <div style={{ marginTop: '20px' }}>
+                      <h3 style={{ marginBottom: '6px' }}>Similar Species</h3>
+                      <p className="predictions-hint" style={{ marginBottom: '10px' }}>
+                        Species the model finds easy to confuse with this one:
+                      </p>
+                      <div style={{ display: 'flex', flexWrap: 'wrap', gap: '8px' }}>
+                        {similarSpecies.map((species, idx) => (
+                          <span
+                            key={idx}
+                            style={{
+                              background: 'rgba(255,255,255,0.08)',
+                              border: '1px solid rgba(255,255,255,0.15)',
+                              borderRadius: '999px',
+                              padding: '6px 12px',
+                              fontSize: '0.85rem'
+                            }}
+                          >
+                            {species.class} · {(species.similarity * 100).toFixed(1)}%
+                          </span>
+                        ))}
+                      </div>
+                    </div>
+                  )}
+                  
                   {/* 識別結果反饋機制 */}
                   <div className="feedback-section" style={{ marginTop: '25px', paddingTop: '20px', borderTop: '2px solid rgba(255,255,255,0.2)' }}>
                     <div style={{ display: 'flex', flexDirection: 'column', gap: '12px' }}>
                       <p style={{ fontSize: '0.95rem', opacity: 0.9, marginBottom: '8px' }}>
                         Was this identification correct?
                       </p>
+                      {uploadId && (
+                        <p style={{ fontSize: '0.8rem', opacity: 0.75, margin: 0 }}>
+                          Your photo is kept on the server for a limited time. If you report the correct species, it may be used to improve the model.
+                        </p>
+                      )}
                       <div style={{ display: 'flex', gap: '10px', flexWrap: 'wrap' }}>
                         <button
                           className="feedback-btn feedback-correct"